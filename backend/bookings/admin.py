@@ -3,37 +3,23 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
-from .models import Booking
-import threading
+from django.db import transaction
+from django.utils import timezone
+from core.admin import ImportAdminMixin
+from core.paginator import EstimatedCountPaginator
+from rooms.models import Room
+from . import export
+from .assignment import plan_for_bookings
+from .models import Booking, OutboxMessage
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def send_email_async(subject, message, recipient_list):
-    """Send email in a background thread to avoid blocking"""
-    def send():
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=recipient_list,
-                fail_silently=False,
-            )
-            logger.info(f"Email sent successfully to {recipient_list}")
-        except Exception as e:
-            logger.error(f"Failed to send email: {e}")
-    
-    thread = threading.Thread(target=send)
-    thread.daemon = True
-    thread.start()
-
-
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'bookings'
     list_display = [
         'id', 'full_name', 'room_type', 'room_display', 
         'check_in', 'check_out', 'nights', 
@@ -44,6 +30,10 @@ class BookingAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at', 'nights', 'total_price']
     date_hierarchy = 'check_in'
     
+    # Large tables: estimated page counts and no second, unfiltered COUNT(*)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
     fieldsets = (
         ('Guest Information', {
             'fields': ('full_name', 'email', 'phone')
@@ -62,9 +52,12 @@ class BookingAdmin(admin.ModelAdmin):
     
     actions = [
         'confirm_bookings', 
+        'preview_optimal_assignment',
         'cancel_bookings',
         'mark_checked_in',
-        'mark_checked_out'
+        'mark_checked_out',
+        'export_csv',
+        'export_xlsx',
     ]
     
     def room_display(self, obj):
@@ -75,6 +68,16 @@ class BookingAdmin(admin.ModelAdmin):
     room_display.short_description = 'Room'
     room_display.admin_order_field = 'room__number'
     
+    def nights(self, obj):
+        return obj.nights
+    nights.short_description = 'Nights'
+    nights.admin_order_field = 'nights'
+    
+    def total_price(self, obj):
+        return obj.total_price
+    total_price.short_description = 'Total price'
+    total_price.admin_order_field = 'total_price'
+    
     def status_badge(self, obj):
         """Colored status badge"""
         colors = {
@@ -91,35 +94,79 @@ class BookingAdmin(admin.ModelAdmin):
             obj.get_status_display()
         )
     status_badge.short_description = 'Status'
+    status_badge.admin_order_field = 'status'
     
     def confirm_bookings(self, request, queryset):
-        """Confirm selected pending bookings"""
-        success = 0
-        for booking in queryset.filter(status='pending'):
-            try:
-                booking.confirm()
-                success += 1
-                
-                # Send confirmation email to guest (non-blocking)
-                self._send_guest_confirmation(booking)
-                
-            except Exception as e:
-                self.message_user(
-                    request, 
-                    f"Failed to confirm booking #{booking.id}: {e}", 
-                    messages.ERROR
-                )
+        """Confirm selected pending bookings in one pass (rooms planned together, one email batch)"""
+        booking_ids = list(queryset.filter(status='pending').values_list('id', flat=True))
+        if not booking_ids:
+            self.message_user(request, "No pending bookings selected", messages.WARNING)
+            return
         
-        if success:
+        with transaction.atomic():
+            result = Booking.objects.bulk_confirm(booking_ids)
+            if result.confirmed:
+                rooms = Room.objects.in_bulk({booking.room_id for booking in result.confirmed})
+                for booking in result.confirmed:
+                    booking.room = rooms[booking.room_id]
+                OutboxMessage.objects.enqueue_many('guest_confirmation', [
+                    (booking, self._guest_confirmation_email(booking)) for booking in result.confirmed
+                ])
+        
+        for booking_id, reason in sorted(result.failed.items()):
+            self.message_user(
+                request, 
+                f"Failed to confirm booking #{booking_id}: {reason}", 
+                messages.ERROR
+            )
+        
+        if result.confirmed:
             self.message_user(
                 request, 
-                f"Confirmed {success} booking(s). Confirmation emails are being sent.", 
+                f"Confirmed {len(result.confirmed)} booking(s). Confirmation emails are being sent.", 
                 messages.SUCCESS
             )
     confirm_bookings.short_description = "Confirm selected bookings"
     
-    def _send_guest_confirmation(self, booking):
-        """Send booking confirmation email to guest (non-blocking)"""
+    def _plan_optimal_assignment(self, queryset):
+        """Plan rooms for the selected pending bookings, per room type"""
+        bookings = {
+            booking.id: booking
+            for booking in queryset.filter(status='pending').select_related('room_type')
+        }
+        plans = plan_for_bookings(bookings.values())
+        rooms = Room.objects.in_bulk(
+            {room_id for plan in plans.values() for room_id in plan.assignments.values()}
+        )
+        return bookings, plans, rooms
+    
+    def preview_optimal_assignment(self, request, queryset):
+        """Dry run: show the room each selected pending booking would get"""
+        bookings, plans, rooms = self._plan_optimal_assignment(queryset)
+        if not plans:
+            self.message_user(request, "No pending bookings selected", messages.WARNING)
+            return
+        
+        for plan in plans.values():
+            lines = [
+                f"#{booking_id} → Room {rooms[room_id].number}"
+                for booking_id, room_id in sorted(plan.assignments.items())
+            ]
+            room_type = bookings[next(iter(plan.assignments or plan.rejected))].room_type
+            summary = f"{room_type.name}: {len(plan.assignments)} assignable, {len(plan.rejected)} without a room"
+            if len(lines) > 50:
+                lines = lines[:50] + [f"... and {len(plan.assignments) - 50} more"]
+            self.message_user(request, f"{summary}. {', '.join(lines)}", messages.INFO)
+            if plan.rejected:
+                self.message_user(
+                    request,
+                    f"{room_type.name}: no room for " + ', '.join(f"#{booking_id}" for booking_id in plan.rejected),
+                    messages.WARNING
+                )
+    preview_optimal_assignment.short_description = "Preview optimal room assignment (dry run)"
+    
+    def _guest_confirmation_email(self, booking):
+        """(subject, message, from_email, recipient_list) for the guest confirmation email"""
         subject = f'Booking Confirmed - {booking.room_type.name}'
         
         message = f"""
@@ -158,24 +205,19 @@ Best regards,
 Hotel Management Team
 """
         
-        # Send email asynchronously using threading
-        send_email_async(
-            subject=subject,
-            message=message,
-            recipient_list=[booking.email]
-        )
+        return subject, message, settings.DEFAULT_FROM_EMAIL, [booking.email]
     
     def cancel_bookings(self, request, queryset):
         """Cancel selected bookings"""
         success = 0
         for booking in queryset.exclude(status__in=['cancelled', 'checked_out']):
             try:
-                booking.cancel()
+                with transaction.atomic():
+                    booking.cancel()
+                    OutboxMessage.objects.enqueue(
+                        'guest_cancellation', self._cancellation_email(booking), booking=booking
+                    )
                 success += 1
-                
-                # Send cancellation email (non-blocking)
-                self._send_cancellation_email(booking)
-                
             except Exception as e:
                 self.message_user(
                     request, 
@@ -191,8 +233,8 @@ Hotel Management Team
             )
     cancel_bookings.short_description = "Cancel selected bookings"
     
-    def _send_cancellation_email(self, booking):
-        """Send cancellation notification to guest (non-blocking)"""
+    def _cancellation_email(self, booking):
+        """(subject, message, from_email, recipient_list) for the guest cancellation email"""
         subject = 'Booking Cancelled - Confirmation'
         
         message = f"""
@@ -213,19 +255,14 @@ Thank you,
 Hotel Management Team
 """
         
-        # Send email asynchronously using threading
-        send_email_async(
-            subject=subject,
-            message=message,
-            recipient_list=[booking.email]
-        )
+        return subject, message, settings.DEFAULT_FROM_EMAIL, [booking.email]
     
     def mark_checked_in(self, request, queryset):
         """Mark as checked in"""
         success = 0
         for booking in queryset.filter(status='confirmed'):
             try:
-                booking.mark_checked_in()
+                booking.mark_check_in()
                 success += 1
             except Exception as e:
                 self.message_user(
@@ -247,7 +284,7 @@ Hotel Management Team
         success = 0
         for booking in queryset.filter(status='checked_in'):
             try:
-                booking.mark_checked_out()
+                booking.mark_check_out()
                 success += 1
             except Exception as e:
                 self.message_user(
@@ -264,12 +301,50 @@ Hotel Management Team
             )
     mark_checked_out.short_description = "Mark as checked out"
     
+    def export_csv(self, request, queryset):
+        """Download the selected bookings (use "select all" with the filters for a full export)"""
+        return export.export_response(queryset, 'csv')
+    export_csv.short_description = "Export selected bookings to CSV"
+    
+    def export_xlsx(self, request, queryset):
+        if export.openpyxl is None:
+            self.message_user(request, "XLSX export requires openpyxl", messages.ERROR)
+            return
+        return export.export_response(queryset, 'xlsx')
+    export_xlsx.short_description = "Export selected bookings to Excel"
+    
     def get_queryset(self, request):
         """Optimize queries"""
         return super().get_queryset(request).select_related(
             'room', 
             'room_type'
+        ).with_pricing()
+
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'recipient_display', 'subject', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['subject', 'recipients', 'booking__id']
+    readonly_fields = [field.name for field in OutboxMessage._meta.fields]
+    raw_id_fields = ['booking']
+    actions = ['retry_messages']
+    
+    def recipient_display(self, obj):
+        return ', '.join(obj.recipients)
+    recipient_display.short_description = 'To'
+    
+    def retry_messages(self, request, queryset):
+        """Queue failed messages again for the next relay run"""
+        updated = queryset.filter(status='failed').update(
+            status='pending', attempts=0, available_at=timezone.now()
         )
+        self.message_user(request, f"Queued {updated} message(s) for another attempt", messages.SUCCESS)
+    retry_messages.short_description = "Retry failed messages"
+    
+    def has_add_permission(self, request):
+        return False
 
 
 
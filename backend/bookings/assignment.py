@@ -0,0 +1,147 @@
+"""
+Room assignment for batches of pending bookings.
+
+Booking.confirm() gives each booking the first free room, in whatever order
+bookings are confirmed. That fragments inventory: short stays land in the
+middle of rooms that could have held long stays, and later requests get
+rejected although a different assignment would have fitted them all.
+
+plan_assignments() treats the whole pending set of a room type as one
+interval scheduling problem. Requests are placed in check-out order (the
+classic greedy that maximises the number of intervals k machines can hold),
+each into the compatible room where it leaves the smallest gap behind the
+previous stay (best fit), so rooms fill up back to back and long free runs
+stay intact for long stays.
+"""
+from bisect import bisect_right
+from collections import namedtuple
+
+Plan = namedtuple('Plan', ['assignments', 'rejected'])
+
+# Gap used for a room with nothing booked before a stay: any real gap is preferred
+NO_NEIGHBOUR = 10 ** 9
+
+
+class RoomSchedule:
+    """Non-overlapping [check_in, check_out) stays of one room, sorted by check-in"""
+
+    def __init__(self, room_id, stays=()):
+        self.room_id = room_id
+        self.starts = []
+        self.ends = []
+        for check_in, check_out in sorted(stays):
+            self.starts.append(check_in)
+            self.ends.append(check_out)
+
+    def fit(self, check_in, check_out):
+        """(gap before, gap after) in days if the stay fits, else None"""
+        i = bisect_right(self.starts, check_in)
+        if i and self.ends[i - 1] > check_in:
+            return None
+        if i < len(self.starts) and self.starts[i] < check_out:
+            return None
+        before = (check_in - self.ends[i - 1]).days if i else NO_NEIGHBOUR
+        after = (self.starts[i] - check_out).days if i < len(self.starts) else NO_NEIGHBOUR
+        return before, after
+
+    def add(self, check_in, check_out):
+        i = bisect_right(self.starts, check_in)
+        self.starts.insert(i, check_in)
+        self.ends.insert(i, check_out)
+
+
+def plan_assignments(room_stays, requests):
+    """
+    room_stays: {room_id: [(check_in, check_out), ...]} stays already held
+    requests: [(booking_id, check_in, check_out), ...] to place
+    Returns Plan(assignments={booking_id: room_id}, rejected=[booking_id, ...])
+    """
+    schedules = [RoomSchedule(room_id, stays) for room_id, stays in sorted(room_stays.items())]
+    assignments = {}
+    rejected = []
+
+    for booking_id, check_in, check_out in sorted(requests, key=lambda r: (r[2], r[1], r[0])):
+        best = None
+        for schedule in schedules:
+            gaps = schedule.fit(check_in, check_out)
+            if gaps is not None and (best is None or gaps < best[0]):
+                best = (gaps, schedule)
+        if best is None:
+            rejected.append(booking_id)
+            continue
+        best[1].add(check_in, check_out)
+        assignments[booking_id] = best[1].room_id
+
+    return Plan(assignments, rejected)
+
+
+def plan_first_available(room_stays, requests):
+    """What confirming one by one with the first free room would do, for comparison"""
+    schedules = [RoomSchedule(room_id, stays) for room_id, stays in sorted(room_stays.items())]
+    assignments = {}
+    rejected = []
+    for booking_id, check_in, check_out in requests:
+        for schedule in schedules:
+            if schedule.fit(check_in, check_out) is not None:
+                schedule.add(check_in, check_out)
+                assignments[booking_id] = schedule.room_id
+                break
+        else:
+            rejected.append(booking_id)
+    return Plan(assignments, rejected)
+
+
+def plan_for_bookings(bookings):
+    """
+    Plan rooms for pending bookings, one room type at a time.
+    Returns {room_type_id: Plan}. Reads the active rooms and the stays
+    already held in them; writes nothing.
+    """
+    # Import here to avoid circular import
+    from rooms.models import Room
+    from .models import Booking
+
+    requests = {}
+    for booking in bookings:
+        if booking.status == 'pending':
+            requests.setdefault(booking.room_type_id, []).append(
+                (booking.id, booking.check_in, booking.check_out)
+            )
+    if not requests:
+        return {}
+
+    first = min(check_in for reqs in requests.values() for _, check_in, _ in reqs)
+    last = max(check_out for reqs in requests.values() for _, _, check_out in reqs)
+
+    rooms = Room.objects.filter(room_type_id__in=requests, is_active=True)
+
+    room_stays = {room_type_id: {} for room_type_id in requests}
+    for room_id, room_type_id in rooms.values_list('id', 'room_type_id'):
+        room_stays[room_type_id][room_id] = []
+
+    held = Booking.objects.overlapping(first, last).filter(
+        room__room_type_id__in=requests
+    ).values_list('room__room_type_id', 'room_id', 'check_in', 'check_out')
+    for room_type_id, room_id, check_in, check_out in held:
+        if room_id in room_stays[room_type_id]:
+            room_stays[room_type_id][room_id].append((check_in, check_out))
+
+    return {
+        room_type_id: plan_assignments(room_stays[room_type_id], reqs)
+        for room_type_id, reqs in requests.items()
+    }
+
+
+def total_gap_nights(room_stays, plan, requests):
+    """Free nights stranded between consecutive stays once a plan is applied"""
+    by_id = {booking_id: (check_in, check_out) for booking_id, check_in, check_out in requests}
+    stays = {room_id: list(s) for room_id, s in room_stays.items()}
+    for booking_id, room_id in plan.assignments.items():
+        stays[room_id].append(by_id[booking_id])
+    gaps = 0
+    for room_id in stays:
+        ordered = sorted(stays[room_id])
+        for (_, previous_out), (next_in, _) in zip(ordered, ordered[1:]):
+            gaps += max((next_in - previous_out).days, 0)
+    return gaps
+
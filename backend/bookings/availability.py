@@ -0,0 +1,381 @@
+"""
+Availability helpers built on the RoomNight ledger.
+
+Two caches live here, both invalidated through version counters instead of
+key deletion:
+
+- availability counts per (room_type, check_in, check_out), keyed by a
+  per-room-type version
+- calendar responses per window, keyed by the versions of the calendar
+  months they span
+
+Booking.save() reports every committed occupancy change to
+occupancy_changed(), which bumps the affected room type and month versions,
+so only answers that could have changed are invalidated. Room changes go
+through rooms_changed() (bookings/signals.py).
+"""
+import hashlib
+import threading
+from bisect import bisect_left
+import time
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from . import engine
+
+AVAILABILITY_CACHE_TIMEOUT = 10 * 60
+CALENDAR_MAX_DAYS = 365
+# Room inventory edits (new rooms, is_active toggles) show up once these expire
+CALENDAR_CACHE_TIMEOUT = 15 * 60
+
+
+def _versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Seed with a timestamp so an evicted counter never rewinds to a
+            # value an older cached entry was keyed with.
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def _aversions(keys):
+    """_versions() through the async cache API"""
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+class AvailabilityCache:
+    """Available room counts per (room_type, check_in, check_out)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version_key(self, room_type_id):
+        return f'availability:room-type:{room_type_id}:version'
+
+    def count_key(self, room_type, version, check_in, check_out):
+        return f'availability:{room_type.id}:{version}:{check_in.isoformat()}:{check_out.isoformat()}'
+
+    def _record(self, count):
+        with self.lock:
+            if count is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def get_available_count(self, room_type, check_in, check_out):
+        # Import here to avoid circular import
+        from .models import Booking
+
+        version, = _versions([self.version_key(room_type.id)])
+        key = self.count_key(room_type, version, check_in, check_out)
+        count = cache.get(key)
+        self._record(count)
+        if count is None:
+            count = Booking.objects.get_available_rooms(
+                room_type, check_in, check_out, use_engine=False
+            ).count()
+            cache.set(key, count, AVAILABILITY_CACHE_TIMEOUT)
+        return count
+
+    async def aget_available_count(self, room_type, check_in, check_out):
+        """get_available_count() through the async cache and ORM APIs"""
+        # Import here to avoid circular import
+        from .models import Booking
+
+        version, = await _aversions([self.version_key(room_type.id)])
+        key = self.count_key(room_type, version, check_in, check_out)
+        count = await cache.aget(key)
+        self._record(count)
+        if count is None:
+            count = await Booking.objects.get_available_rooms(
+                room_type, check_in, check_out, use_engine=False
+            ).acount()
+            await cache.aset(key, count, AVAILABILITY_CACHE_TIMEOUT)
+        return count
+
+    def invalidate(self, room_type_ids):
+        for room_type_id in room_type_ids:
+            _bump(self.version_key(room_type_id))
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = self.misses = 0
+
+
+availability_cache = AvailabilityCache()
+
+
+def available_count(room_type, check_in, check_out):
+    """
+    Number of rooms of the type free for [check_in, check_out), from the
+    in-memory engine when enabled, otherwise through the versioned cache.
+    """
+    matrix = engine.get_engine()
+    if matrix is not None:
+        count = matrix.available_count(room_type.id, check_in, check_out)
+        if count is not None:
+            return count
+    return availability_cache.get_available_count(room_type, check_in, check_out)
+
+
+async def aavailable_count(room_type, check_in, check_out):
+    """available_count() for async views"""
+    matrix = engine.get_engine()
+    if matrix is not None:
+        # A stale matrix rebuilds from the database, so keep that off the event loop
+        count = await sync_to_async(matrix.available_count)(room_type.id, check_in, check_out)
+        if count is not None:
+            return count
+    return await availability_cache.aget_available_count(room_type, check_in, check_out)
+
+
+BATCH_MAX_QUERIES = 300
+
+
+def batch_available_counts(queries):
+    """
+    Available room counts for many (room_type_id, check_in, check_out)
+    tuples with a fixed number of queries: the active rooms of every
+    requested type, then the occupied nights of those rooms over each
+    type's merged date span. Returns counts aligned with `queries`.
+    """
+    # Import here to avoid circular import
+    from rooms.models import Room
+    from .models import RoomNight
+
+    spans = {}
+    for room_type_id, check_in, check_out in queries:
+        first, last = spans.get(room_type_id, (check_in, check_out))
+        spans[room_type_id] = (min(first, check_in), max(last, check_out))
+    if not spans:
+        return []
+
+    rooms_by_type = {room_type_id: [] for room_type_id in spans}
+    for room_id, room_type_id in Room.objects.filter(
+        room_type_id__in=spans, is_active=True
+    ).values_list('id', 'room_type_id'):
+        rooms_by_type[room_type_id].append(room_id)
+
+    in_spans = Q()
+    for room_type_id, (first, last) in spans.items():
+        in_spans |= Q(room__room_type_id=room_type_id, date__gte=first, date__lt=last)
+    occupied = {}
+    for room_id, day in RoomNight.objects.filter(in_spans, room__is_active=True).values_list('room_id', 'date'):
+        occupied.setdefault(room_id, []).append(day)
+    for days in occupied.values():
+        days.sort()
+
+    counts = []
+    for room_type_id, check_in, check_out in queries:
+        free = 0
+        for room_id in rooms_by_type[room_type_id]:
+            days = occupied.get(room_id)
+            # Free unless some occupied night falls inside [check_in, check_out)
+            if not days:
+                free += 1
+                continue
+            i = bisect_left(days, check_in)
+            if i == len(days) or days[i] >= check_out:
+                free += 1
+        counts.append(free)
+    return counts
+
+
+FLEXIBLE_SEARCH_MAX_DAYS = 365
+
+
+def flexible_search(nights, start, end, room_type_id=None):
+    """
+    Every check-in date in [start, end - nights] with at least one room free
+    for `nights` consecutive nights (check-out no later than `end`), with the
+    cheapest room type available that day.
+
+    One pass over each room's booking intervals, sorted by check-in, turns
+    the gaps between stays into ranges of feasible check-in dates; a
+    difference array per room type adds those ranges up.
+    """
+    # Import here to avoid circular import
+    from rooms.models import Room, RoomType
+    from .models import Booking
+
+    last_start = (end - start).days - nights
+    if last_start < 0:
+        return []
+
+    room_types = RoomType.objects.all()
+    rooms = Room.objects.filter(is_active=True)
+    bookings = Booking.objects.overlapping(start, end).filter(room__is_active=True)
+    if room_type_id is not None:
+        room_types = room_types.filter(id=room_type_id)
+        rooms = rooms.filter(room_type_id=room_type_id)
+        bookings = bookings.filter(room__room_type_id=room_type_id)
+    room_types = {room_type.id: room_type for room_type in room_types}
+
+    stays = {}
+    for room_id, check_in, check_out in bookings.values_list('room_id', 'check_in', 'check_out').order_by():
+        stays.setdefault(room_id, []).append((check_in, check_out))
+
+    # free_rooms[type][i] ends up as the number of rooms free for a stay starting start + i days
+    free_rooms = {}
+    for room_id, type_id in rooms.values_list('id', 'room_type_id'):
+        diff = free_rooms.setdefault(type_id, [0] * (last_start + 2))
+        cursor = start
+        for check_in, check_out in sorted(stays.get(room_id, [])) + [(end, end)]:
+            # Gap [cursor, check_in) fits check-ins up to check_in - nights
+            first = (cursor - start).days
+            last = min((check_in - start).days - nights, last_start)
+            if last >= first:
+                diff[first] += 1
+                diff[last + 1] -= 1
+            cursor = max(cursor, check_out)
+
+    results = []
+    running = {type_id: 0 for type_id in free_rooms}
+    for i in range(last_start + 1):
+        available = {}
+        for type_id, diff in free_rooms.items():
+            running[type_id] += diff[i]
+            if running[type_id] > 0 and type_id in room_types:
+                available[type_id] = running[type_id]
+        if not available:
+            continue
+        cheapest = min((room_types[type_id] for type_id in available), key=lambda room_type: room_type.base_price)
+        check_in = start + timedelta(days=i)
+        results.append({
+            'check_in': check_in.isoformat(),
+            'check_out': (check_in + timedelta(days=nights)).isoformat(),
+            'available_rooms': sum(available.values()),
+            'cheapest_price': str(cheapest.base_price * nights),
+            'room_type_id': cheapest.id,
+            'room_type': cheapest.name,
+        })
+    return results
+
+
+def _month_key(day):
+    return f'availability-calendar:month:{day.year}-{day.month:02d}'
+
+
+def _months_between(start, end):
+    """Version keys for every calendar month touched by [start, end)"""
+    keys = []
+    year, month = start.year, start.month
+    last = end - timedelta(days=1)
+    while (year, month) <= (last.year, last.month):
+        keys.append(_month_key(date(year, month, 1)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+
+def invalidate_calendar(dates):
+    """Bump the version of every month containing one of `dates`"""
+    for key in {_month_key(day) for day in dates}:
+        _bump(key)
+
+
+def occupancy_changed(changes, room_type_ids):
+    """
+    Called after commit with {(room_id, date): occupied} for every night
+    whose occupancy changed and the room types those rooms belong to.
+    """
+    availability_cache.invalidate(room_type_ids)
+    invalidate_calendar({day for _, day in changes})
+
+    matrix = engine.get_engine()
+    if matrix is not None:
+        matrix.apply(changes)
+
+
+def rooms_changed(room_type_ids):
+    """
+    Called after commit when rooms of these types were added, deleted,
+    retyped or (de)activated: every availability answer for them can change.
+    """
+    availability_cache.invalidate(room_type_ids)
+    engine.invalidate()
+
+
+def availability_calendar(start, days, room_type_id=None):
+    """
+    Available room counts per day for each room type over [start, start + days).
+    Two queries: room types with their active room counts, and occupied
+    nights grouped by room type and date.
+    """
+    # Import here to avoid circular import
+    from rooms.models import RoomType
+    from .models import RoomNight
+
+    end = start + timedelta(days=days)
+
+    room_types = RoomType.objects.with_room_counts().order_by('id')
+    nights = RoomNight.objects.filter(date__gte=start, date__lt=end, room__is_active=True)
+    if room_type_id is not None:
+        room_types = room_types.filter(id=room_type_id)
+        nights = nights.filter(room__room_type_id=room_type_id)
+
+    occupied = {}
+    for row in nights.values('room__room_type_id', 'date').annotate(count=Count('id')).order_by():
+        occupied[(row['room__room_type_id'], row['date'])] = row['count']
+
+    dates = [start + timedelta(days=i) for i in range(days)]
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': days,
+        'room_types': [
+            {
+                'room_type_id': room_type.id,
+                'room_type': room_type.name,
+                'price_per_night': str(room_type.base_price),
+                'total_rooms': room_type.active_rooms_count,
+                'days': [
+                    {
+                        'date': day.isoformat(),
+                        'available': max(room_type.active_rooms_count - occupied.get((room_type.id, day), 0), 0),
+                    }
+                    for day in dates
+                ],
+            }
+            for room_type in room_types
+        ],
+    }
+
+
+def cached_availability_calendar(start, days, room_type_id=None):
+    """availability_calendar() behind the month-versioned cache"""
+    versions = _versions(_months_between(start, start + timedelta(days=days)))
+    digest = hashlib.md5('-'.join(str(v) for v in versions).encode()).hexdigest()
+    key = f"availability-calendar:{start.isoformat()}:{days}:{room_type_id or 'all'}:{digest}"
+    data = cache.get(key)
+    if data is None:
+        data = availability_calendar(start, days, room_type_id)
+        cache.set(key, data, CALENDAR_CACHE_TIMEOUT)
+    return data
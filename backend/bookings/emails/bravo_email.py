@@ -1,13 +1,107 @@
+"""
+Django email backend for Brevo's transactional email API.
+
+    EMAIL_BACKEND = 'bookings.emails.bravo_email.BrevoEmailBackend'
+
+Requests go through one requests.Session per process, so HTTPS connections
+are kept alive and reused across messages and backend instances. Plain
+messages from the same sender are grouped into batch requests (one
+messageVersions entry per message, BREVO_BATCH_SIZE per request), and
+batches are sent concurrently by at most BREVO_MAX_WORKERS threads.
+Messages with attachments, alternatives or custom headers are sent on their
+own.
+
+Every message gets brevo_message_id (accepted) or brevo_error (rejected).
+When Brevo rejects a batch as invalid, its messages are resent one per
+request so a single bad address fails only its own message. Unless
+fail_silently, a BrevoSendError listing the failed messages is raised after
+the rest have been sent.
+
+Settings: BREVO_API_KEY, BREVO_API_URL, BREVO_BATCH_SIZE, BREVO_MAX_WORKERS,
+BREVO_TIMEOUT, DEFAULT_FROM_NAME.
+"""
+import base64
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parseaddr
 
-import json
 import requests
-from django.core.mail.backends.base import BaseEmailBackend
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://api.brevo.com/v3/smtp/email'
+
+
+class BrevoSendError(Exception):
+    """Some messages were not accepted; each has brevo_error set"""
+
+    def __init__(self, failed_messages, sent):
+        self.failed_messages = failed_messages
+        self.sent = sent
+        errors = '; '.join(f"{message.to}: {message.brevo_error}" for message in failed_messages[:5])
+        super().__init__(f"Brevo rejected {len(failed_messages)} message(s), sent {sent}: {errors}")
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(pool_size):
+    """The process-wide Session for Brevo, with up to pool_size kept-alive connections"""
+    # Keyed on the pid too: pooled sockets must not be shared with forked workers
+    key = (os.getpid(), pool_size)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                # Only retry what Brevo cannot have processed: failed connects and 429s
+                retry = Retry(
+                    total=3, connect=3, read=0, status=3, status_forcelist=[429],
+                    allowed_methods=frozenset(['POST']), backoff_factor=0.5, raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'accept': 'application/json', 'content-type': 'application/json'})
+                _sessions[key] = session
+    return session
+
+
+def _contact(address):
+    name, email = parseaddr(address)
+    return {'email': email, 'name': name} if name else {'email': email}
+
 
 class BrevoEmailBackend(BaseEmailBackend):
-    
-    #Custom Django email backend to send emails via Brevo SMTP API.
-    
+    """Custom Django email backend to send emails via the Brevo API"""
+
+    def __init__(self, fail_silently=False, api_key=None, api_url=None, batch_size=None,
+                 max_workers=None, timeout=None, **kwargs):
+        super().__init__(fail_silently=fail_silently, **kwargs)
+        self.api_key = api_key or getattr(settings, 'BREVO_API_KEY', '')
+        self.api_url = api_url or getattr(settings, 'BREVO_API_URL', DEFAULT_API_URL)
+        self.batch_size = batch_size or getattr(settings, 'BREVO_BATCH_SIZE', 100)
+        self.max_workers = max_workers or getattr(settings, 'BREVO_MAX_WORKERS', 4)
+        self.timeout = timeout or getattr(settings, 'BREVO_TIMEOUT', 10)
+        self.session = None
+
+    def open(self):
+        if self.session is not None:
+            return False
+        self.session = get_session(self.max_workers)
+        return True
+
+    def close(self):
+        # The session's connections stay pooled for the next backend instance
+        self.session = None
 
     def send_messages(self, email_messages):
         """
@@ -16,41 +110,140 @@ class BrevoEmailBackend(BaseEmailBackend):
         if not email_messages:
             return 0
 
-        sent_count = 0
+        new_session = self.open()
+        try:
+            batches = self._batches(email_messages)
+            if len(batches) == 1 or self.max_workers == 1:
+                for batch in batches:
+                    self._send_batch(batch)
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                    list(pool.map(self._send_batch, batches))
+        finally:
+            if new_session:
+                self.close()
+
+        handled = [message for message in email_messages if message.recipients()]
+        failed = [message for message in handled if message.brevo_error]
+        sent = len(handled) - len(failed)
+        for message in failed:
+            logger.error(f"Brevo did not send {message.subject!r} to {message.to}: {message.brevo_error}")
+        if failed and not self.fail_silently:
+            raise BrevoSendError(failed, sent)
+        return sent
+
+    def _batchable(self, message):
+        return not (message.attachments or getattr(message, 'alternatives', None) or message.extra_headers)
 
+    def _batches(self, email_messages):
+        """Group messages that can share one request: plain, same sender and content type"""
+        groups = {}
+        batches = []
         for message in email_messages:
-            try:
-                payload = {
-                    "sender": {
-                        "name": getattr(settings, "DEFAULT_FROM_NAME", "Hotel Nyumba"),
-                        "email": getattr(settings, "DEFAULT_FROM_EMAIL", "umarkhemis9@gmail.com")
-                    },
-                    "to": [{"email": to} for to in message.to],
-                    "subject": message.subject,
-                    "htmlContent": message.body
-                }
-
-                headers = {
-                    "accept": "application/json",
-                    "api-key": settings.BREVO_API_KEY,
-                    "content-type": "application/json"
-                }
-
-                response = requests.post(
-                    "https://api.brevo.com/v3/smtp/email",
-                    headers=headers,
-                    data=json.dumps(payload),
-                    timeout=10
-                )
+            message.brevo_message_id = None
+            message.brevo_error = None
+            if not message.recipients():
+                continue
+            if not self._batchable(message):
+                batches.append([message])
+                continue
+            group = groups.setdefault((message.from_email, message.content_subtype), [])
+            group.append(message)
+            if len(group) == self.batch_size:
+                batches.append(group)
+                groups[(message.from_email, message.content_subtype)] = []
+        batches.extend(group for group in groups.values() if group)
+        return batches
+
+    def _content_field(self, message):
+        return 'htmlContent' if message.content_subtype == 'html' else 'textContent'
+
+    def _addresses(self, message):
+        addresses = {'to': [_contact(to) for to in message.to]}
+        if message.cc:
+            addresses['cc'] = [_contact(cc) for cc in message.cc]
+        if message.bcc:
+            addresses['bcc'] = [_contact(bcc) for bcc in message.bcc]
+        if message.reply_to:
+            addresses['replyTo'] = _contact(message.reply_to[0])
+        if not message.to:
+            # Brevo requires "to"; send bcc-only messages to their bcc list instead
+            addresses['to'] = addresses.pop('bcc', None) or addresses.pop('cc')
+        return addresses
+
+    def _sender(self, message):
+        name, email = parseaddr(message.from_email or settings.DEFAULT_FROM_EMAIL)
+        return {'name': name or getattr(settings, 'DEFAULT_FROM_NAME', 'Hotel Nyumba'), 'email': email}
+
+    def _payload(self, message):
+        """A single-message request, including attachments and alternatives"""
+        payload = {
+            'sender': self._sender(message),
+            'subject': message.subject,
+            self._content_field(message): message.body,
+            **self._addresses(message),
+        }
+        for content, mimetype in getattr(message, 'alternatives', None) or []:
+            if mimetype == 'text/html':
+                payload['htmlContent'] = content
+        if message.extra_headers:
+            payload['headers'] = dict(message.extra_headers)
+        if message.attachments:
+            payload['attachment'] = [self._attachment(attachment) for attachment in message.attachments]
+        return payload
+
+    def _attachment(self, attachment):
+        if hasattr(attachment, 'get_filename'):
+            # A MIMEBase instance
+            filename, content = attachment.get_filename(), attachment.get_payload(decode=True)
+        else:
+            filename, content = attachment[0], attachment[1]
+        if isinstance(content, str):
+            content = content.encode()
+        return {'name': filename or 'attachment', 'content': base64.b64encode(content).decode()}
+
+    def _batch_payload(self, batch):
+        """One request for several plain messages, one messageVersions entry each"""
+        first = batch[0]
+        field = self._content_field(first)
+        return {
+            'sender': self._sender(first),
+            'subject': first.subject,
+            field: first.body,
+            'messageVersions': [
+                {'subject': message.subject, field: message.body, **self._addresses(message)}
+                for message in batch
+            ],
+        }
 
-                if response.status_code in [200, 201, 202]:
-                    sent_count += 1
-                else:
-                    if not self.fail_silently:
-                        print("Brevo API error:", response.status_code, response.text)
+    def _send_batch(self, batch):
+        payload = self._payload(batch[0]) if len(batch) == 1 else self._batch_payload(batch)
+        status, body, error = self._post(payload)
 
-            except Exception as e:
-                if not self.fail_silently:
-                    print("Email send error:", e)
+        if error is None:
+            ids = body.get('messageIds') or [body.get('messageId')] * len(batch)
+            for message, message_id in zip(batch, ids):
+                message.brevo_message_id = message_id
+        elif len(batch) > 1 and status == 400:
+            # One bad message rejects the whole batch; find it by sending each alone
+            for message in batch:
+                self._send_batch([message])
+        else:
+            for message in batch:
+                message.brevo_error = error
 
-        return sent_count
+    def _post(self, payload):
+        """POST payload; returns (status code or None, JSON body, error message or None)"""
+        try:
+            response = self.session.post(
+                self.api_url, json=payload, headers={'api-key': self.api_key}, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            return None, {}, str(e)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code in (200, 201, 202):
+            return response.status_code, body, None
+        return response.status_code, body, f"{response.status_code} {body.get('message') or response.text[:200]}"
@@ -0,0 +1,90 @@
+"""
+Local stand-in for Brevo's send endpoint, for tests and benchmarks.
+
+    server = BrevoStandInServer(latency=0.02, reject={'bad@example.com'}).start()
+    backend = BrevoEmailBackend(api_key='test', api_url=server.url)
+    ...
+    server.stop()
+
+Accepts the same JSON as https://api.brevo.com/v3/smtp/email and answers
+201 with messageId / messageIds. Requests addressed to a rejected address
+get Brevo's 400 invalid_parameter answer. Payloads, request and connection
+counts are recorded.
+"""
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BrevoStandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, reject=()):
+        super().__init__(address, BrevoStandInHandler)
+        self.latency = latency
+        self.reject = set(reject)
+        self.lock = threading.Lock()
+        self.payloads = []
+        self.connections = 0
+        self.message_ids = itertools.count(1)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v3/smtp/email'
+
+    @property
+    def requests(self):
+        return len(self.payloads)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class BrevoStandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        with server.lock:
+            server.payloads.append(payload)
+        time.sleep(server.latency)
+
+        if not self.headers.get('api-key'):
+            return self.respond(401, {'code': 'unauthorized', 'message': 'Key not found'})
+
+        versions = payload.get('messageVersions') or [payload]
+        recipients = {contact['email'] for version in versions for contact in version.get('to', [])}
+        if not recipients or recipients & server.reject:
+            return self.respond(400, {'code': 'invalid_parameter', 'message': 'email is not valid in to'})
+
+        with server.lock:
+            ids = [f'<{next(server.message_ids)}@standin.brevo>' for _ in versions]
+        if 'messageVersions' in payload:
+            return self.respond(201, {'messageIds': ids})
+        return self.respond(201, {'messageId': ids[0]})
@@ -0,0 +1,172 @@
+"""
+Optional in-process availability engine.
+
+Holds a rooms x days boolean matrix of occupied nights, built from Room and
+the RoomNight ledger, and answers availability questions with vectorized
+NumPy reductions instead of database queries. Enable it with
+AVAILABILITY_ENGINE = 'numpy' (requires numpy). The database stays the
+source of truth: Booking.confirm() and Booking.clean() never consult it.
+
+Every process keeps its own matrix. Local booking changes are applied
+incrementally after commit; a shared version counter in the cache tells
+other processes their copy is stale so they rebuild on next use.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'availability-engine:version'
+
+
+class OccupancyMatrix:
+    """Rooms x days occupancy for the window [start, start + days)"""
+
+    def __init__(self, days):
+        self.days = days
+        self.lock = threading.Lock()
+        self.start = None
+        self.version = None
+
+    def build(self):
+        """Load rooms and occupied nights from the database"""
+        # Import here to avoid circular import
+        from rooms.models import Room
+        from .models import RoomNight
+
+        start = timezone.now().date()
+        end = start + timedelta(days=self.days)
+        version = cache.get(VERSION_KEY)
+
+        rooms = list(Room.objects.filter(is_active=True).order_by('id').values_list('id', 'room_type_id'))
+        room_ids = np.array([room_id for room_id, _ in rooms], dtype=np.int64)
+        room_type_ids = np.array([room_type_id for _, room_type_id in rooms], dtype=np.int64)
+        occupied = np.zeros((len(rooms), self.days), dtype=bool)
+
+        nights = RoomNight.objects.filter(
+            date__gte=start, date__lt=end, room__is_active=True
+        ).values_list('room_id', 'date')
+        if len(room_ids):
+            pairs = list(nights)
+            if pairs:
+                rows = np.searchsorted(room_ids, [room_id for room_id, _ in pairs])
+                cols = [(day - start).days for _, day in pairs]
+                occupied[rows, cols] = True
+
+        with self.lock:
+            self.start = start
+            self.version = version
+            self.room_ids = room_ids
+            self.occupied = occupied
+            self.rows_by_type = {
+                int(room_type_id): np.flatnonzero(room_type_ids == room_type_id)
+                for room_type_id in np.unique(room_type_ids)
+            }
+
+    def is_current(self):
+        return (
+            self.start == timezone.now().date()
+            and self.version is not None
+            and self.version == cache.get(VERSION_KEY)
+        )
+
+    def ensure_current(self):
+        if not self.is_current():
+            if cache.get(VERSION_KEY) is None:
+                cache.add(VERSION_KEY, 1, timeout=None)
+            self.build()
+
+    def _columns(self, check_in, check_out):
+        """Column slice for [check_in, check_out), or None if outside the window"""
+        first = (check_in - self.start).days
+        last = (check_out - self.start).days
+        if first < 0 or last > self.days or last <= first:
+            return None
+        return slice(first, last)
+
+    def available_room_ids(self, room_type_id, check_in, check_out):
+        """
+        Ids of active rooms of the type with no occupied night in the range,
+        or None if the range falls outside the matrix window.
+        """
+        self.ensure_current()
+        with self.lock:
+            columns = self._columns(check_in, check_out)
+            if columns is None:
+                return None
+            rows = self.rows_by_type.get(int(room_type_id))
+            if rows is None:
+                return []
+            free = ~self.occupied[rows, columns].any(axis=1)
+            return self.room_ids[rows[free]].tolist()
+
+    def available_count(self, room_type_id, check_in, check_out):
+        room_ids = self.available_room_ids(room_type_id, check_in, check_out)
+        return None if room_ids is None else len(room_ids)
+
+    def apply(self, changes):
+        """
+        Apply {(room_id, date): occupied} after a committed booking change and
+        bump the shared version so other processes rebuild.
+        """
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, timeout=None)
+            version = None
+
+        with self.lock:
+            if self.start is None:
+                return
+            for (room_id, day), occupied in changes.items():
+                col = (day - self.start).days
+                row = np.searchsorted(self.room_ids, room_id)
+                if 0 <= col < self.days and row < len(self.room_ids) and self.room_ids[row] == room_id:
+                    self.occupied[row, col] = occupied
+            # Only stay current if nobody else changed anything in between
+            if version is not None and self.version is not None and version == self.version + 1:
+                self.version = version
+            else:
+                self.version = None
+
+
+def invalidate():
+    """
+    Make every process rebuild its matrix on next use; for changes to the
+    rooms themselves (added, removed, retyped, (de)activated)
+    """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Seeded with a timestamp so it can't match a version a matrix was built at
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The process-wide OccupancyMatrix, or None when the engine is disabled"""
+    global _engine
+    if getattr(settings, 'AVAILABILITY_ENGINE', 'db') != 'numpy':
+        return None
+    if np is None:
+        logger.warning("AVAILABILITY_ENGINE is 'numpy' but numpy is not installed; using the database")
+        return None
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = OccupancyMatrix(getattr(settings, 'AVAILABILITY_ENGINE_DAYS', 400))
+    return _engine
@@ -0,0 +1,163 @@
+"""
+Streaming booking exports (CSV, and XLSX when openpyxl is installed).
+
+Rows are read with values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+no model instances are built, and on PostgreSQL the rows come through a
+server-side cursor, so memory stays flat however many bookings there are.
+Nights and total price are computed by the database (with_pricing()).
+
+CSV is written to the response row by row. An XLSX file is a zip archive
+that can't be produced incrementally, so it is written in openpyxl's
+write-only mode to a temporary file (still one row in memory at a time)
+and then streamed from disk.
+
+Under ASGI Django buffers synchronous streaming responses completely -
+serve exports from a WSGI worker.
+"""
+import csv
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Booking
+
+try:
+    import openpyxl
+except ImportError:  # optional dependency
+    openpyxl = None
+
+# (header, values_list lookup)
+COLUMNS = [
+    ('ID', 'id'),
+    ('Guest', 'full_name'),
+    ('Email', 'email'),
+    ('Phone', 'phone'),
+    ('Room type', 'room_type__name'),
+    ('Room', 'room__number'),
+    ('Check-in', 'check_in'),
+    ('Check-out', 'check_out'),
+    ('Nights', 'nights'),
+    ('Guests', 'guests'),
+    ('Status', 'status'),
+    # Total price and created are expected last by _clean()
+    ('Total price', 'total_price'),
+    ('Created', 'created_at'),
+]
+
+FORMATS = ['csv', 'xlsx']
+
+CENTS = Decimal('0.01')
+
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def filter_bookings(queryset, params):
+    """
+    Apply the export filters from a query dict: status (comma separated),
+    room_type_id, start and end (YYYY-MM-DD, check-in dates, both included).
+    Raises ValueError for invalid values.
+    """
+    statuses = [value for value in params.get('status', '').split(',') if value]
+    if statuses:
+        unknown = set(statuses) - {value for value, _ in Booking.STATUS_CHOICES}
+        if unknown:
+            raise ValueError(f"Unknown status: {', '.join(sorted(unknown))}")
+        queryset = queryset.filter(status__in=statuses)
+
+    room_type_id = params.get('room_type_id')
+    if room_type_id:
+        try:
+            queryset = queryset.filter(room_type_id=int(room_type_id))
+        except ValueError:
+            raise ValueError("room_type_id must be an integer")
+
+    for param, lookup in (('start', 'check_in__gte'), ('end', 'check_in__lte')):
+        if params.get(param):
+            try:
+                day = datetime.strptime(params[param], '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError(f"Invalid {param} date. Use YYYY-MM-DD")
+            queryset = queryset.filter(**{lookup: day})
+    return queryset
+
+
+def export_rows(queryset, chunk_size=None):
+    """The header row, then one tuple per booking, fetched chunk_size rows at a time"""
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    yield [header for header, _ in COLUMNS]
+    rows = (
+        queryset.with_pricing()
+        .order_by('id')
+        .values_list(*[lookup for _, lookup in COLUMNS])
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield _clean(row)
+
+
+def _clean(row):
+    # Guest-entered text is prefixed with ' so it can't run as a formula.
+    # Total price comes back as 300 or 300.00 depending on the database;
+    # created_at (last) in local, naive time as spreadsheets expect
+    *row, total_price, created_at = row
+    return (
+        *(_escape(value) for value in row),
+        None if total_price is None else Decimal(total_price).quantize(CENTS),
+        timezone.localtime(created_at).replace(tzinfo=None, microsecond=0),
+    )
+
+
+def _escape(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """File-like object whose write() hands the written line back"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, file):
+    """Write rows to file as a single-sheet workbook, without keeping them in memory"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Bookings')
+    for row in rows:
+        sheet.append(row)
+    workbook.save(file)
+
+
+def export_response(queryset, file_format='csv', filename=None):
+    """A streaming download of the bookings in queryset"""
+    if file_format not in FORMATS:
+        raise ValueError(f"file_format must be one of: {', '.join(FORMATS)}")
+    filename = filename or f"bookings-{timezone.localdate().isoformat()}.{file_format}"
+    rows = export_rows(queryset)
+
+    if file_format == 'xlsx':
+        if openpyxl is None:
+            raise ValueError("XLSX export requires openpyxl")
+        # Deleted on close, i.e. once the response has been sent
+        file = tempfile.TemporaryFile()
+        write_xlsx(rows, file)
+        file.seek(0)
+        return FileResponse(
+            file, as_attachment=True, filename=filename,
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
+    response = StreamingHttpResponse(csv_lines(rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
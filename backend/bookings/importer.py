@@ -0,0 +1,433 @@
+"""
+Bulk import of room types, rooms and historical bookings from CSV or JSON.
+
+    with open('bookings.csv', newline='') as file, open('errors.csv', 'w', newline='') as report:
+        result = importer.run_import('bookings', file, 'bookings.csv', report)
+
+Records are read one at a time (CSV and JSON Lines; a .json array is loaded
+whole) and handled IMPORT_BATCH_SIZE at a time: a batch is validated in
+memory with one or two lookup queries, then inserted with bulk_create in
+its own transaction. Invalid rows are skipped and written to the error
+report (CSV: line, error, record) instead. A file that can't be read to
+the end raises ImportStopped, saying how many records the batches before
+it committed.
+
+Bookings get the checks of Booking.clean() without a query per row: dates,
+capacity, room type and room, and no overlap with another stay in the same
+room, checked against the room's existing bookings (loaded once per room)
+and the rows imported before. Unlike clean(), past dates are allowed. As in
+bulk_confirm(), RoomNight ledger rows are written in the same transaction
+and availability caches are invalidated after commit. DailyStats is rebuilt
+once over the imported dates at the end: applying increments batch by batch
+took most of the import time (the nightly rebuild covers an interrupted
+import).
+"""
+import bisect
+import csv
+import json
+import os
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+from rooms.models import Room, RoomType
+from . import availability
+from .locks import room_type_lock
+from .models import Booking, DailyStats, RoomNight
+
+ImportResult = namedtuple('ImportResult', ['created', 'failed'])
+
+FORMATS = ['.csv', '.json', '.jsonl', '.ndjson']
+
+
+class ImportStopped(ValueError):
+    """The file became unreadable part way; result counts the records handled before that"""
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+
+def read_records(file, filename):
+    """(line, record) for each record of a CSV, JSON array or JSON Lines text file"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, record
+    elif extension in ('.jsonl', '.ndjson'):
+        for line, text in enumerate(file, 1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError as e:
+                yield line, f"Invalid JSON: {e}"
+    elif extension == '.json':
+        try:
+            records = json.load(file)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if not isinstance(records, list):
+            raise ValueError("A .json file must hold a list of records")
+        yield from enumerate(records, 1)
+    else:
+        raise ValueError(f"Unsupported file type '{extension}'. Use one of: {', '.join(FORMATS)}")
+
+
+def _text(record, name, required=False, max_length=None):
+    value = record.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValidationError(f"{name} is required")
+    if max_length and len(value) > max_length:
+        raise ValidationError(f"{name} is longer than {max_length} characters")
+    return value
+
+
+def _integer(record, name, default, minimum=0):
+    value = _text(record, name)
+    if not value:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError(f"{name} must be a whole number")
+    if value < minimum:
+        raise ValidationError(f"{name} must be at least {minimum}")
+    return value
+
+
+def _date(record, name):
+    value = _text(record, name, required=True)
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def _boolean(record, name, default):
+    value = _text(record, name).lower()
+    if not value:
+        return default
+    if value in ('1', 'true', 'yes', 'y'):
+        return True
+    if value in ('0', 'false', 'no', 'n'):
+        return False
+    raise ValidationError(f"{name} must be true or false")
+
+
+class Importer:
+    """Reads, validates and bulk-inserts records batch by batch"""
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', 5000)
+
+    def run(self, records, report=None):
+        """
+        Import (line, record) pairs; returns ImportResult(created, failed).
+        report, a text file, receives a CSV row per failed record.
+        """
+        writer = csv.writer(report) if report is not None else None
+        if writer:
+            writer.writerow(['line', 'error', 'record'])
+        created = failed = 0
+
+        records = iter(records)
+        try:
+            while True:
+                try:
+                    batch = list(islice(records, self.batch_size))
+                except (ValueError, csv.Error) as e:
+                    # Also UnicodeDecodeError, a ValueError
+                    message = str(e)
+                    if created or failed:
+                        message += (
+                            f". Import stopped after {created} record(s) were imported"
+                            f" and {failed} invalid row(s) skipped"
+                        )
+                    raise ImportStopped(message, ImportResult(created, failed)) from e
+                if not batch:
+                    break
+
+                self.prepare([record for _, record in batch if isinstance(record, dict)])
+                valid = []
+                errors = []
+                for line, record in batch:
+                    try:
+                        if not isinstance(record, dict):
+                            raise ValidationError(record if isinstance(record, str) else "Not a record")
+                        valid.append((line, record, self.build(record)))
+                    except ValidationError as e:
+                        errors.append((line, record, '; '.join(e.messages)))
+
+                if valid:
+                    try:
+                        with transaction.atomic():
+                            self.save([obj for _, _, obj in valid])
+                    except IntegrityError as e:
+                        # Lost a race with a concurrent change; the batch is rolled back
+                        self.release([obj for _, _, obj in valid])
+                        errors.extend(
+                            (line, record, f"Batch rejected by the database: {e}") for line, record, _ in valid
+                        )
+                        valid = []
+
+                created += len(valid)
+                failed += len(errors)
+                if writer:
+                    for line, record, error in sorted(errors, key=lambda error: error[0]):
+                        writer.writerow([line, error, json.dumps(record, default=str)])
+        finally:
+            # Batches already committed stay, so finish them even when stopping early
+            self.finish()
+        return ImportResult(created, failed)
+
+    def finish(self):
+        """Called once every batch has been saved, or the import stopped"""
+
+    def prepare(self, records):
+        """Load what validating a batch needs"""
+
+    def build(self, record):
+        """An unsaved instance for a valid record; raises ValidationError otherwise"""
+        raise NotImplementedError
+
+    def save(self, objs):
+        self.model.objects.bulk_create(objs)
+
+    def release(self, objs):
+        """Forget what build() recorded for objs, whose batch was rolled back"""
+
+
+class RoomTypeImporter(Importer):
+    """Fields: name, slug (from the name if empty), description, base_price, capacity"""
+    model = RoomType
+
+    def __init__(self, batch_size=None):
+        super().__init__(batch_size)
+        self.slugs = set()
+
+    def prepare(self, records):
+        slugs = {_text(record, 'slug') or slugify(_text(record, 'name')) for record in records}
+        self.slugs.update(RoomType.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+
+    def build(self, record):
+        name = _text(record, 'name', required=True, max_length=50)
+        slug = _text(record, 'slug', max_length=50) or slugify(name)
+        if slug in self.slugs:
+            raise ValidationError(f"Room type '{slug}' already exists")
+        try:
+            base_price = Decimal(_text(record, 'base_price') or 0)
+        except InvalidOperation:
+            raise ValidationError("base_price must be a number")
+        if not base_price.is_finite() or base_price < 0:
+            raise ValidationError("base_price must be a number of at least 0")
+        capacity = _integer(record, 'capacity', default=1, minimum=1)
+
+        self.slugs.add(slug)
+        return RoomType(
+            name=name,
+            slug=slug,
+            description=_text(record, 'description'),
+            base_price=base_price,
+            capacity=capacity,
+        )
+
+    def release(self, objs):
+        self.slugs.difference_update(room_type.slug for room_type in objs)
+
+
+class RoomImporter(Importer):
+    """Fields: number, room_type (slug or name), is_active"""
+    model = Room
+
+    def __init__(self, batch_size=None):
+        super().__init__(batch_size)
+        self.numbers = set()
+        self.room_types = _room_types()
+
+    def prepare(self, records):
+        numbers = {_text(record, 'number') for record in records}
+        self.numbers.update(Room.objects.filter(number__in=numbers).values_list('number', flat=True))
+
+    def build(self, record):
+        number = _text(record, 'number', required=True, max_length=32)
+        if number in self.numbers:
+            raise ValidationError(f"Room {number} already exists")
+        room_type = _room_type(self.room_types, record)
+        is_active = _boolean(record, 'is_active', default=True)
+
+        self.numbers.add(number)
+        return Room(number=number, room_type=room_type, is_active=is_active)
+
+    def release(self, objs):
+        self.numbers.difference_update(room.number for room in objs)
+
+    def save(self, objs):
+        super().save(objs)
+        room_type_ids = {room.room_type_id for room in objs}
+        transaction.on_commit(lambda: availability.rooms_changed(room_type_ids))
+
+
+class BookingImporter(Importer):
+    """
+    Fields: full_name, email, phone, room_type (slug or name), room (number;
+    required for confirmed and checked-in bookings), check_in, check_out
+    (YYYY-MM-DD), guests, status (default pending), special_requests
+    """
+    model = Booking
+
+    STATUSES = {value for value, _ in Booking.STATUS_CHOICES}
+
+    def __init__(self, batch_size=None):
+        super().__init__(batch_size)
+        self.room_types = _room_types()
+        self.rooms = {}
+        # Sorted, non-overlapping (check_in, check_out) stays per room id
+        self.stays = {}
+        # First check-in and last check-out imported, for the DailyStats rebuild
+        self.dates = None
+
+    def prepare(self, records):
+        numbers = {_text(record, 'room') for record in records} - set(self.rooms) - {''}
+        if not numbers:
+            return
+        rooms = Room.objects.filter(number__in=numbers)
+        self.rooms.update((room.number, room) for room in rooms)
+
+        new_room_ids = [room.id for room in rooms if room.id not in self.stays]
+        for room_id in new_room_ids:
+            self.stays[room_id] = []
+        existing = Booking.objects.filter(
+            room_id__in=new_room_ids, status__in=Booking.SOLD_STATUSES
+        ).values_list('room_id', 'check_in', 'check_out')
+        for room_id, check_in, check_out in existing.iterator(chunk_size=2000):
+            bisect.insort(self.stays[room_id], (check_in, check_out))
+
+    def build(self, record):
+        full_name = _text(record, 'full_name', required=True, max_length=150)
+        room_type = _room_type(self.room_types, record)
+        check_in = _date(record, 'check_in')
+        check_out = _date(record, 'check_out')
+        if check_out <= check_in:
+            raise ValidationError("Check-out must be after check-in")
+
+        guests = _integer(record, 'guests', default=1, minimum=1)
+        if guests > room_type.capacity:
+            raise ValidationError(f"Room type '{room_type.name}' has max capacity of {room_type.capacity}")
+
+        status = _text(record, 'status') or 'pending'
+        if status not in self.STATUSES:
+            raise ValidationError(f"Unknown status '{status}'")
+
+        email = _text(record, 'email', required=True, max_length=254)
+        validate_email(email)
+
+        number = _text(record, 'room')
+        room = None
+        if number:
+            room = self.rooms.get(number)
+            if room is None:
+                raise ValidationError(f"Room {number} does not exist")
+            if room.room_type_id != room_type.id:
+                raise ValidationError(f"Room {number} is not a {room_type.name} room")
+        elif status in Booking.ACTIVE_STATUSES:
+            raise ValidationError(f"A {status} booking needs a room")
+
+        # Last, once the record is known to be valid
+        if room and status in Booking.SOLD_STATUSES:
+            self._claim(room, check_in, check_out)
+
+        return Booking(
+            full_name=full_name,
+            email=email,
+            phone=_text(record, 'phone', max_length=50),
+            room_type=room_type,
+            room=room,
+            check_in=check_in,
+            check_out=check_out,
+            guests=guests,
+            status=status,
+            special_requests=_text(record, 'special_requests'),
+        )
+
+    def _claim(self, room, check_in, check_out):
+        """Record the stay in the room, unless it overlaps one already there"""
+        stays = self.stays[room.id]
+        i = bisect.bisect_left(stays, (check_in, check_out))
+        # The stays don't overlap each other, so only the neighbours can overlap this one
+        if (i > 0 and stays[i - 1][1] > check_in) or (i < len(stays) and stays[i][0] < check_out):
+            raise ValidationError(f"Room {room.number} is already booked for these dates")
+        stays.insert(i, (check_in, check_out))
+
+    def release(self, objs):
+        for booking in objs:
+            if booking.room_id and booking.status in Booking.SOLD_STATUSES:
+                self.stays[booking.room_id].remove((booking.check_in, booking.check_out))
+
+    def save(self, objs):
+        room_type_ids = {booking.room_type_id for booking in objs}
+        with room_type_lock(*room_type_ids):
+            created = Booking.objects.bulk_create(objs, batch_size=1000)
+            nights = [
+                RoomNight(booking=booking, room_id=booking.room_id, date=day)
+                for booking in created if booking.status in Booking.ACTIVE_STATUSES
+                for day in booking.stay_dates()
+            ]
+            RoomNight.objects.bulk_create(nights, batch_size=1000)
+
+        first = min(booking.check_in for booking in created)
+        last = max(booking.check_out for booking in created)
+        if self.dates:
+            first, last = min(first, self.dates[0]), max(last, self.dates[1])
+        self.dates = (first, last)
+        if nights:
+            changes = {(night.room_id, night.date): True for night in nights}
+            transaction.on_commit(lambda: availability.occupancy_changed(changes, room_type_ids))
+
+    def finish(self):
+        if self.dates:
+            # Departures count on the check-out date itself
+            DailyStats.objects.rebuild(self.dates[0], self.dates[1] + timedelta(days=1))
+
+
+def _room_types():
+    """Room types by slug and by name"""
+    room_types = {}
+    for room_type in RoomType.objects.all():
+        room_types.setdefault(room_type.name, room_type)
+        room_types[room_type.slug] = room_type
+    return room_types
+
+
+def _room_type(room_types, record):
+    value = _text(record, 'room_type', required=True)
+    room_type = room_types.get(value)
+    if room_type is None:
+        raise ValidationError(f"Room type '{value}' does not exist")
+    return room_type
+
+
+IMPORTERS = {
+    'room_types': RoomTypeImporter,
+    'rooms': RoomImporter,
+    'bookings': BookingImporter,
+}
+
+
+def run_import(kind, file, filename, report=None, batch_size=None):
+    """
+    Import kind ('room_types', 'rooms' or 'bookings') records from a text
+    file; returns ImportResult. Raises ValueError for an unreadable file.
+    """
+    if kind not in IMPORTERS:
+        raise ValueError(f"kind must be one of: {', '.join(IMPORTERS)}")
+    return IMPORTERS[kind](batch_size).run(read_records(file, filename), report)
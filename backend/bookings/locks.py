@@ -0,0 +1,64 @@
+"""
+Room-type scoped locks for room assignment.
+
+Picking a free room and writing the booking are two steps; two confirmations
+for the same room type running at once can both pick the same room. Holding
+room_type_lock() across both steps serializes assignment per room type while
+confirmations for other room types proceed in parallel.
+
+On PostgreSQL this is a transaction-level advisory lock (pg_advisory_xact_lock),
+released when the outermost transaction ends, so it works across processes.
+Other backends get a per-process threading lock held for the with-block; the
+RoomNight unique constraint remains the backstop across processes there.
+SQLite allows one writer per database, so there a single lock covers all
+room types.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import connections, transaction
+
+# First key of the two-int advisory lock, so room type ids don't collide with
+# advisory locks taken elsewhere on the same database
+ADVISORY_LOCK_NAMESPACE = 0x524D5459  # 'RMTY'
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _local_lock(key):
+    with _local_locks_guard:
+        return _local_locks.setdefault(key, threading.RLock())
+
+
+@contextmanager
+def room_type_lock(*room_type_ids, using='default'):
+    """
+    Lock the given room types and open a transaction. Locks are always taken
+    in id order, so callers locking several types cannot deadlock each other.
+    """
+    room_type_ids = sorted({room_type_id for room_type_id in room_type_ids if room_type_id is not None})
+    connection = connections[using]
+
+    if connection.vendor == 'postgresql':
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                for room_type_id in room_type_ids:
+                    cursor.execute(
+                        "SELECT pg_advisory_xact_lock(%s, %s)",
+                        [ADVISORY_LOCK_NAMESPACE, room_type_id]
+                    )
+            yield
+        return
+
+    if connection.vendor == 'sqlite':
+        room_type_ids = [None] if room_type_ids else []
+    locks = [_local_lock((using, room_type_id)) for room_type_id in room_type_ids]
+    for lock in locks:
+        lock.acquire()
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        for lock in reversed(locks):
+            lock.release()
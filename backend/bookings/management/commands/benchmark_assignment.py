@@ -0,0 +1,42 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from bookings.assignment import plan_assignments, plan_first_available, total_gap_nights
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare first-available room assignment with the batch optimizer on a synthetic "
+        "set of pending bookings (in memory, no database access)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pending', type=int, default=5000, help="Pending bookings to place")
+        parser.add_argument('--rooms', type=int, default=60, help="Rooms of the room type")
+        parser.add_argument('--days', type=int, default=365, help="Horizon the stays fall into")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        start = date(2030, 1, 1)
+
+        requests = []
+        for booking_id in range(options['pending']):
+            # Mostly short stays with a tail of long ones
+            nights = rng.choice([1, 1, 2, 2, 2, 3, 3, 4, 5, 7, 10, 14])
+            check_in = start + timedelta(days=rng.randint(0, options['days'] - nights))
+            requests.append((booking_id, check_in, check_in + timedelta(days=nights)))
+
+        room_stays = {room_id: [] for room_id in range(options['rooms'])}
+
+        for name, planner in (('first available', plan_first_available), ('optimizer', plan_assignments)):
+            started = time.perf_counter()
+            plan = planner(room_stays, requests)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(
+                f"{name:>15}: {len(plan.assignments)} placed, {len(plan.rejected)} rejected, "
+                f"{total_gap_nights(room_stays, plan, requests)} gap nights, {elapsed:.1f} ms"
+            )
@@ -0,0 +1,123 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from bookings.models import Booking, RoomNight
+from rooms.models import Room, RoomType
+
+
+class Rollback(Exception):
+    """Raised to throw away the generated benchmark data"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the booking overlap scan with the RoomNight ledger for availability lookups. "
+        "Synthetic data is generated inside a transaction and rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=1_000_000, help="Bookings to generate")
+        parser.add_argument('--rooms', type=int, default=120, help="Rooms to spread them over")
+        parser.add_argument('--queries', type=int, default=200, help="Availability lookups per approach")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                room_type = self.generate(options['bookings'], options['rooms'])
+                self.run(room_type, options['queries'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Benchmark data rolled back")
+
+    def generate(self, total, room_count):
+        started = time.perf_counter()
+        room_type = RoomType.objects.create(name='Benchmark', slug='benchmark-availability', base_price=100, capacity=2)
+        rooms = Room.objects.bulk_create([
+            Room(room_type=room_type, number=f'BENCH-{i:04d}') for i in range(room_count)
+        ])
+        today = timezone.now().date()
+
+        per_room = total // room_count
+        bookings = []
+        for room in rooms:
+            # Lay stays back to back, walking backwards from half a year ahead
+            cursor = today + timedelta(days=180)
+            for _ in range(per_room):
+                check_out = cursor - timedelta(days=self.rng.randint(0, 3))
+                check_in = check_out - timedelta(days=self.rng.randint(1, 7))
+                cursor = check_in
+                if check_out <= today:
+                    status = 'checked_out'
+                elif check_in > today:
+                    status = 'confirmed'
+                else:
+                    status = 'checked_in'
+                bookings.append(Booking(
+                    full_name='Benchmark Guest', email='bench@example.com',
+                    room_type=room_type, room=room, status=status,
+                    check_in=check_in, check_out=check_out,
+                ))
+            if len(bookings) >= 20000:
+                self.flush(bookings)
+                bookings = []
+        if bookings:
+            self.flush(bookings)
+
+        self.stdout.write(
+            f"Generated {per_room * room_count} bookings, "
+            f"{RoomNight.objects.filter(room__room_type=room_type).count()} ledger nights "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return room_type
+
+    def flush(self, bookings):
+        # bulk_create skips Booking.save(), so write the ledger rows directly
+        created = Booking.objects.bulk_create(bookings, batch_size=5000)
+        RoomNight.objects.bulk_create([
+            RoomNight(booking=booking, room_id=booking.room_id, date=day)
+            for booking in created if booking.status in Booking.ACTIVE_STATUSES
+            for day in booking.stay_dates()
+        ], batch_size=5000)
+
+    def run(self, room_type, queries):
+        today = timezone.now().date()
+        windows = []
+        for _ in range(queries):
+            check_in = today + timedelta(days=self.rng.randint(0, 170))
+            windows.append((check_in, check_in + timedelta(days=self.rng.randint(1, 14))))
+
+        def overlap_scan(check_in, check_out):
+            booked = Booking.objects.overlapping(check_in, check_out).filter(
+                room__room_type=room_type
+            ).values_list('room_id', flat=True)
+            return Room.objects.filter(room_type=room_type, is_active=True).exclude(id__in=booked).count()
+
+        def ledger(check_in, check_out):
+            return Booking.objects.get_available_rooms(room_type, check_in, check_out).count()
+
+        results = {}
+        for name, lookup in (('overlap scan', overlap_scan), ('ledger', ledger)):
+            timings = []
+            answers = []
+            for check_in, check_out in windows:
+                started = time.perf_counter()
+                answers.append(lookup(check_in, check_out))
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = answers
+            timings.sort()
+            self.stdout.write(
+                f"{name:>12}: mean {statistics.mean(timings):.2f} ms, "
+                f"p50 {timings[len(timings) // 2]:.2f} ms, "
+                f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms"
+            )
+
+        if results['overlap scan'] != results['ledger']:
+            self.stderr.write("Approaches disagree - run `rebuild_room_nights --check`")
@@ -0,0 +1,64 @@
+import time
+
+import requests
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand
+
+from bookings.emails.bravo_email import BrevoEmailBackend
+from bookings.emails.standin import BrevoStandInServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the old one-request-per-email Brevo sending with the pooled, batched "
+        "BrevoEmailBackend against a local stand-in of the Brevo API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=1000)
+        parser.add_argument('--latency', type=float, default=50, help="Milliseconds per API request")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        server = BrevoStandInServer(latency=options['latency'] / 1000).start()
+        messages = [
+            EmailMessage(f'Benchmark {i}', 'Body', 'hotel@example.com', [f'guest{i}@example.com'])
+            for i in range(options['emails'])
+        ]
+        backend = BrevoEmailBackend(
+            api_key='benchmark', api_url=server.url,
+            batch_size=options['batch_size'], max_workers=options['workers'],
+        )
+        try:
+            per_message = lambda messages: self.per_message(messages, server.url)
+            for name, send in (('per message', per_message), ('batched', backend.send_messages)):
+                server.payloads.clear()
+                server.connections = 0
+                started = time.perf_counter()
+                sent = send(messages)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{name:>11}: {sent} emails in {elapsed:.2f}s ({sent / elapsed:.0f}/s), "
+                    f"{server.requests} requests, {server.connections} connections"
+                )
+        finally:
+            server.stop()
+
+    def per_message(self, messages, url):
+        """What BrevoEmailBackend did before: a new connection and request per message, serially"""
+        sent = 0
+        for message in messages:
+            response = requests.post(
+                url,
+                headers={'accept': 'application/json', 'api-key': 'benchmark', 'content-type': 'application/json'},
+                json={
+                    'sender': {'name': 'Hotel Nyumba', 'email': message.from_email},
+                    'to': [{'email': to} for to in message.to],
+                    'subject': message.subject,
+                    'htmlContent': message.body,
+                },
+                timeout=10,
+            )
+            sent += response.status_code in (200, 201, 202)
+        return sent
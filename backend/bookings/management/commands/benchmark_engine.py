@@ -0,0 +1,60 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from bookings import engine
+from bookings.models import Booking
+from .benchmark_availability import Command as AvailabilityBenchmark
+
+
+class Command(AvailabilityBenchmark):
+    help = (
+        "Compare the ORM availability path with the in-memory NumPy occupancy matrix. "
+        "Synthetic data is generated inside a transaction and rolled back afterwards."
+    )
+
+    def handle(self, *args, **options):
+        if engine.np is None:
+            raise CommandError("numpy is not installed")
+        super().handle(*args, **options)
+
+    def run(self, room_type, queries):
+        today = timezone.now().date()
+        windows = []
+        for _ in range(queries):
+            check_in = today + timedelta(days=self.rng.randint(0, 170))
+            windows.append((check_in, check_in + timedelta(days=self.rng.randint(1, 14))))
+
+        matrix = engine.OccupancyMatrix(days=400)
+        started = time.perf_counter()
+        matrix.ensure_current()
+        self.stdout.write(f"Built {matrix.occupied.shape[0]}x{matrix.occupied.shape[1]} matrix in "
+                          f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+        def orm(check_in, check_out):
+            return Booking.objects.get_available_rooms(room_type, check_in, check_out, use_engine=False).count()
+
+        def numpy_engine(check_in, check_out):
+            return matrix.available_count(room_type.id, check_in, check_out)
+
+        results = {}
+        for name, lookup in (('orm', orm), ('numpy', numpy_engine)):
+            timings = []
+            answers = []
+            for check_in, check_out in windows:
+                started = time.perf_counter()
+                answers.append(lookup(check_in, check_out))
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = answers
+            timings.sort()
+            self.stdout.write(
+                f"{name:>6}: mean {statistics.mean(timings):.3f} ms, "
+                f"p50 {timings[len(timings) // 2]:.3f} ms, "
+                f"p95 {timings[int(len(timings) * 0.95) - 1]:.3f} ms"
+            )
+
+        if results['orm'] != results['numpy']:
+            self.stderr.write("Engine and ORM disagree")
@@ -0,0 +1,77 @@
+import csv
+import io
+import os
+import tempfile
+import threading
+import time
+
+from bookings import export
+from bookings.models import Booking
+from .benchmark_availability import Command as AvailabilityBenchmark
+
+
+class Command(AvailabilityBenchmark):
+    help = (
+        "Measure time and peak memory of the streaming booking export against building "
+        "model instances for every row. Synthetic data is generated inside a transaction "
+        "and rolled back afterwards. Memory is sampled from /proc (Linux)."
+    )
+
+    def run(self, room_type, queries):
+        bookings = Booking.objects.filter(room_type=room_type)
+        total = bookings.count()
+        ids = bookings.order_by('id').values_list('id', flat=True)
+
+        # Peak memory should stay the same from a tenth of the rows to all of them
+        for rows in sorted({max(total // 10, 1), total}):
+            subset = bookings.filter(id__lte=ids[rows - 1])
+            self.measure('csv', rows, lambda: sum(len(line) for line in export.csv_lines(export.export_rows(subset))))
+            if rows < total:
+                self.measure('instances', rows, lambda: self.instances(subset))
+            if export.openpyxl is not None:
+                self.measure('xlsx', rows, lambda: self.xlsx(subset))
+
+    def rss(self):
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    def measure(self, name, rows, run):
+        # Sample resident memory from a thread: tracemalloc would slow the export down several times
+        baseline = peak = self.rss()
+        done = threading.Event()
+
+        def sample():
+            nonlocal peak
+            while not done.wait(0.01):
+                peak = max(peak, self.rss())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            size = run()
+        finally:
+            done.set()
+            sampler.join()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{name:>9} {rows:>8} rows: {size / 2 ** 20:.1f} MB in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s), "
+            f"peak memory growth {(peak - baseline) / 2 ** 20:.1f} MB"
+        )
+
+    def instances(self, queryset):
+        """Rows from a list of model instances, the way paging through the admin reads them"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for booking in list(queryset.select_related('room', 'room_type').order_by('id')):
+            writer.writerow([
+                booking.id, booking.full_name, booking.email, booking.phone, booking.room_type.name,
+                booking.room.number if booking.room else None, booking.check_in, booking.check_out,
+                booking.nights, booking.guests, booking.status, booking.total_price, booking.created_at,
+            ])
+        return len(buffer.getvalue())
+
+    def xlsx(self, queryset):
+        with tempfile.TemporaryFile() as file:
+            export.write_xlsx(export.export_rows(queryset), file)
+            return file.tell()
@@ -0,0 +1,83 @@
+import csv
+import io
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from bookings import importer
+from bookings.models import DailyStats, RoomNight
+from .benchmark_availability import Rollback
+
+
+class Command(BaseCommand):
+    help = (
+        "Time bulk_import on a generated file of rooms and historical bookings. "
+        "The imported data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=100_000)
+        parser.add_argument('--rooms', type=int, default=200)
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        room_types, rooms, bookings = self.generate(rng, options['bookings'], options['rooms'])
+        try:
+            with transaction.atomic():
+                for kind, content in (('room_types', room_types), ('rooms', rooms), ('bookings', bookings)):
+                    report = io.StringIO()
+                    started = time.perf_counter()
+                    result = importer.run_import(
+                        kind, io.StringIO(content), f'{kind}.csv', report, batch_size=options['batch_size']
+                    )
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{kind:>10}: {result.created} imported, {result.failed} rejected in {elapsed:.2f}s "
+                        f"({(result.created + result.failed) / elapsed * 60:,.0f} rows/minute)"
+                    )
+                self.stdout.write(
+                    f"{RoomNight.objects.count()} ledger nights, {DailyStats.objects.count()} daily stats rows"
+                )
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Benchmark data rolled back")
+
+    def generate(self, rng, total, room_count):
+        """CSV text for two room types, room_count rooms and about total bookings, 1% of them invalid"""
+        room_types = 'name,slug,base_price,capacity\nBench Standard,bench-standard,80,2\nBench Suite,bench-suite,200,4\n'
+
+        rooms = io.StringIO()
+        writer = csv.writer(rooms)
+        writer.writerow(['number', 'room_type'])
+        numbers = []
+        for i in range(room_count):
+            numbers.append((f'BENCH-{i:04d}', 'bench-suite' if i % 4 == 0 else 'bench-standard'))
+            writer.writerow(numbers[-1])
+
+        bookings = io.StringIO()
+        writer = csv.writer(bookings)
+        writer.writerow(['full_name', 'email', 'room_type', 'room', 'check_in', 'check_out', 'guests', 'status'])
+        today = timezone.now().date()
+        per_room = total // room_count
+        for number, room_type in numbers:
+            # Back to back stays, walking back in time from two months ahead
+            cursor = today + timedelta(days=60)
+            for _ in range(per_room):
+                check_out = cursor - timedelta(days=rng.randint(0, 2))
+                check_in = check_out - timedelta(days=rng.randint(1, 5))
+                cursor = check_in
+                if rng.random() < 0.01:
+                    # Overlaps the previous stay in this room
+                    check_out += timedelta(days=7)
+                status = 'checked_out' if check_out <= today else 'confirmed' if check_in > today else 'checked_in'
+                writer.writerow([
+                    'Bench Guest', 'bench@example.com', room_type, number,
+                    check_in.isoformat(), check_out.isoformat(), 2, status,
+                ])
+        return room_types, rooms.getvalue(), bookings.getvalue()
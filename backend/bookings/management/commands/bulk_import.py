@@ -0,0 +1,43 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Import room types, rooms or historical bookings from a CSV, JSON or JSON Lines file. "
+        "Invalid rows are skipped and listed in an error report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(importer.IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--errors', help="Error report path (default: <path>.errors.csv)")
+        parser.add_argument('--batch-size', type=int, help="Records per transaction (default IMPORT_BATCH_SIZE)")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        report_path = options['errors'] or f'{path}.errors.csv'
+        started = time.perf_counter()
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as file, \
+                    open(report_path, 'w', newline='', encoding='utf-8') as report:
+                result = importer.run_import(
+                    options['kind'], file, path, report, batch_size=options['batch_size']
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"Imported {result.created} {options['kind'].replace('_', ' ')} in {elapsed:.1f}s "
+            f"({result.created / elapsed:.0f}/s)"
+        )
+        if result.failed:
+            self.stdout.write(self.style.WARNING(f"{result.failed} invalid row(s) skipped, see {report_path}"))
+        else:
+            os.remove(report_path)
+            self.stdout.write(self.style.SUCCESS("No errors"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from bookings.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses past their TTL (for cron when celery beat is not running)"
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyKey.objects.purge_expired()
+        self.stdout.write(f"Purged {deleted} expired idempotency keys")
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings.models import DailyStats
+
+
+class Command(BaseCommand):
+    help = "Recompute the DailyStats aggregates from Booking (for cron when celery beat is not running)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First date to rebuild (YYYY-MM-DD); all dates by default")
+        parser.add_argument('--end', help="Day after the last date to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        try:
+            start, end = (
+                datetime.strptime(options[name], '%Y-%m-%d').date() if options[name] else None
+                for name in ('start', 'end')
+            )
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        rows = DailyStats.objects.rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily stats row(s)"))
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from bookings.models import Booking, RoomNight
+
+
+class Command(BaseCommand):
+    help = "Rebuild the RoomNight occupancy ledger from Booking, or check it for consistency"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only compare the ledger with Booking and report differences",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help="Rows per bulk insert when rebuilding",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            problems = self.check_ledger()
+            if problems:
+                for problem in problems[:50]:
+                    self.stderr.write(problem)
+                raise CommandError(f"RoomNight ledger is inconsistent ({len(problems)} booking(s) differ)")
+            self.stdout.write(self.style.SUCCESS("RoomNight ledger is consistent with Booking"))
+            return
+
+        created, expected = self.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt RoomNight ledger: {created} night(s)"))
+        if created != expected:
+            # Two active bookings claim the same room/night; the first one wins the row.
+            self.stderr.write(
+                f"{expected - created} night(s) were skipped because of overlapping active bookings. "
+                "Run with --check for details."
+            )
+
+    def active_bookings(self):
+        return Booking.objects.filter(
+            status__in=Booking.ACTIVE_STATUSES,
+            room__isnull=False,
+        ).order_by('id').values_list('id', 'room_id', 'check_in', 'check_out')
+
+    @transaction.atomic
+    def rebuild(self, batch_size):
+        RoomNight.objects.all().delete()
+
+        expected = 0
+        batch = []
+        for booking_id, room_id, check_in, check_out in self.active_bookings().iterator(chunk_size=2000):
+            for i in range((check_out - check_in).days):
+                batch.append(RoomNight(booking_id=booking_id, room_id=room_id, date=check_in + timedelta(days=i)))
+            if len(batch) >= batch_size:
+                expected += len(batch)
+                RoomNight.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            expected += len(batch)
+            RoomNight.objects.bulk_create(batch, ignore_conflicts=True)
+
+        created = RoomNight.objects.count()
+        return created, expected
+
+    def check_ledger(self):
+        """Walk active bookings and per-booking ledger summaries side by side, both ordered by booking id"""
+        summaries = RoomNight.objects.values('booking_id', 'room_id').annotate(
+            nights=Count('id'),
+            first=Min('date'),
+            last=Max('date'),
+        ).order_by('booking_id', 'room_id')
+
+        problems = []
+        ledger = iter(summaries.iterator(chunk_size=2000))
+        row = next(ledger, None)
+
+        for booking_id, room_id, check_in, check_out in self.active_bookings().iterator(chunk_size=2000):
+            while row is not None and row['booking_id'] < booking_id:
+                problems.append(f"Booking #{row['booking_id']}: ledger rows for a booking that holds no room")
+                row = next(ledger, None)
+
+            nights = (check_out - check_in).days
+            if row is None or row['booking_id'] != booking_id:
+                problems.append(f"Booking #{booking_id}: missing {nights} night(s) in the ledger")
+                continue
+
+            if (
+                row['room_id'] != room_id
+                or row['nights'] != nights
+                or row['first'] != check_in
+                or row['last'] != check_out - timedelta(days=1)
+            ):
+                problems.append(
+                    f"Booking #{booking_id}: ledger has {row['nights']} night(s) in room {row['room_id']} "
+                    f"({row['first']} - {row['last']}), expected {nights} in room {room_id}"
+                )
+            row = next(ledger, None)
+            # A booking split over several rooms shows up as extra summary rows
+            while row is not None and row['booking_id'] == booking_id:
+                problems.append(f"Booking #{booking_id}: ledger rows in unexpected room {row['room_id']}")
+                row = next(ledger, None)
+
+        while row is not None:
+            problems.append(f"Booking #{row['booking_id']}: ledger rows for a booking that holds no room")
+            row = next(ledger, None)
+
+        return problems
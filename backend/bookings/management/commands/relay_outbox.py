@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bookings.outbox import drain
+
+
+class Command(BaseCommand):
+    help = (
+        "Send due outbox messages (for cron or a dedicated process when celery beat is not running). "
+        "Several relays can run at once; each claims different messages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Messages per batch (default OUTBOX_BATCH_SIZE)")
+        parser.add_argument('--loop', action='store_true', help="Keep relaying until interrupted")
+        parser.add_argument(
+            '--interval', type=float, default=getattr(settings, 'OUTBOX_RELAY_INTERVAL', 10),
+            help="Seconds between polls with --loop"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            result = drain(options['batch_size'])
+            if result.sent or result.failed or result.retrying or not options['loop']:
+                self.stdout.write(
+                    f"Sent {result.sent}, {result.retrying} to retry, {result.failed} failed"
+                )
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bookings.outbox import send_admin_digest
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold held new-booking notifications into one admin digest email in the outbox "
+        "(for cron when celery beat is not running; relay_outbox sends it)"
+    )
+
+    def handle(self, *args, **options):
+        count = send_admin_digest()
+        self.stdout.write(f"Queued a digest of {count} new booking(s)" if count else "No held notifications")
@@ -0,0 +1,118 @@
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from bookings.models import Booking
+from rooms.models import Room, RoomType
+
+
+class Command(BaseCommand):
+    help = (
+        "Confirm pending bookings from many threads at once and report confirmations per second "
+        "and any overlapping stays. The generated data is committed and deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--bookings', type=int, default=400, help="Pending bookings to confirm")
+        parser.add_argument('--room-types', type=int, default=2)
+        parser.add_argument('--rooms', type=int, default=10, help="Rooms per room type")
+        parser.add_argument('--days', type=int, default=30, help="Horizon the stays fall into")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        room_types = [
+            RoomType.objects.create(
+                name=f'Stress {i}', slug=f'stress-confirmations-{i}', base_price=100, capacity=2
+            )
+            for i in range(options['room_types'])
+        ]
+        try:
+            for room_type in room_types:
+                Room.objects.bulk_create([
+                    Room(room_type=room_type, number=f'STRESS-{room_type.id}-{i:03d}')
+                    for i in range(options['rooms'])
+                ])
+            today = timezone.now().date()
+            booking_ids = []
+            for _ in range(options['bookings']):
+                check_in = today + timedelta(days=rng.randint(1, options['days']))
+                booking = Booking.objects.create(
+                    full_name='Stress Guest', email='stress@example.com',
+                    room_type=rng.choice(room_types),
+                    check_in=check_in, check_out=check_in + timedelta(days=rng.randint(1, 5)),
+                )
+                booking_ids.append(booking.id)
+            self.run(booking_ids, options['threads'])
+        finally:
+            Booking.objects.filter(room_type__in=room_types).delete()
+            Room.objects.filter(room_type__in=room_types).delete()
+            RoomType.objects.filter(id__in=[room_type.id for room_type in room_types]).delete()
+
+    def run(self, booking_ids, thread_count):
+        counts = {'confirmed': 0, 'unavailable': 0, 'errors': 0}
+        counts_lock = threading.Lock()
+        barrier = threading.Barrier(thread_count)
+
+        def worker(ids):
+            try:
+                # Load up front so the timed part is only the confirmations
+                bookings = list(Booking.objects.select_related('room_type').filter(id__in=ids))
+                barrier.wait()
+                for booking in bookings:
+                    try:
+                        booking.confirm()
+                        outcome = 'confirmed'
+                    except ValidationError:
+                        outcome = 'unavailable'
+                    except Exception as e:
+                        self.stderr.write(f"Booking #{booking.id}: {e}")
+                        outcome = 'errors'
+                    with counts_lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(booking_ids[i::thread_count],))
+            for i in range(thread_count)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        overlaps = self.count_overlaps(booking_ids)
+        self.stdout.write(
+            f"{counts['confirmed']} confirmed, {counts['unavailable']} without a room, "
+            f"{counts['errors']} errors in {elapsed:.2f}s with {thread_count} threads "
+            f"({counts['confirmed'] / elapsed:.1f} confirmations/s)"
+        )
+        self.stdout.write(f"Overlapping stays: {overlaps}")
+
+    def count_overlaps(self, booking_ids):
+        """Pairs of active bookings sharing a room on overlapping dates"""
+        stays = {}
+        for room_id, check_in, check_out in Booking.objects.filter(
+            id__in=booking_ids, status__in=Booking.ACTIVE_STATUSES
+        ).values_list('room_id', 'check_in', 'check_out'):
+            stays.setdefault(room_id, []).append((check_in, check_out))
+
+        overlaps = 0
+        for room_stays in stays.values():
+            room_stays.sort()
+            latest_out = None
+            for check_in, check_out in room_stays:
+                if latest_out is not None and check_in < latest_out:
+                    overlaps += 1
+                latest_out = max(latest_out or check_out, check_out)
+        return overlaps
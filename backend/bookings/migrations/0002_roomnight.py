@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_room_nights(apps, schema_editor):
+    """Populate the ledger from existing confirmed / checked-in bookings"""
+    Booking = apps.get_model("bookings", "Booking")
+    RoomNight = apps.get_model("bookings", "RoomNight")
+
+    batch = []
+    bookings = Booking.objects.filter(
+        status__in=["confirmed", "checked_in"], room__isnull=False
+    ).values_list("id", "room_id", "check_in", "check_out")
+    for booking_id, room_id, check_in, check_out in bookings.iterator(chunk_size=2000):
+        for i in range((check_out - check_in).days):
+            batch.append(
+                RoomNight(
+                    booking_id=booking_id,
+                    room_id=room_id,
+                    date=check_in + timedelta(days=i),
+                )
+            )
+        if len(batch) >= 5000:
+            RoomNight.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        RoomNight.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookings", "0001_initial"),
+        ("rooms", "0005_rename_describtion_roomtype_description"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RoomNight",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "booking",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="room_nights",
+                        to="bookings.booking",
+                    ),
+                ),
+                (
+                    "room",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="nights",
+                        to="rooms.room",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["date", "room"], name="bookings_ro_date_1da1fa_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("room", "date"), name="unique_room_night"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_room_nights, migrations.RunPython.noop),
+    ]
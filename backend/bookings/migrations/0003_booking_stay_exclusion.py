@@ -0,0 +1,57 @@
+from django.db import migrations
+
+# PostgreSQL only: a generated daterange column plus an exclusion constraint
+# so two active bookings can never hold the same room on overlapping dates.
+# Other backends keep the Python-level check in Booking.clean().
+
+FORWARD_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    """
+    ALTER TABLE bookings_booking
+    ADD COLUMN stay daterange
+    GENERATED ALWAYS AS (daterange(check_in, check_out, '[)')) STORED
+    """,
+    """
+    ALTER TABLE bookings_booking
+    ADD CONSTRAINT bookings_booking_no_overlap
+    EXCLUDE USING gist (room_id WITH =, stay WITH &&)
+    WHERE (status IN ('confirmed', 'checked_in') AND room_id IS NOT NULL)
+    """,
+    # Serves overlap queries that are not scoped to a single room
+    """
+    CREATE INDEX bookings_booking_active_stay_gist
+    ON bookings_booking USING gist (stay)
+    WHERE (status IN ('confirmed', 'checked_in') AND room_id IS NOT NULL)
+    """,
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS bookings_booking_active_stay_gist",
+    "ALTER TABLE bookings_booking DROP CONSTRAINT IF EXISTS bookings_booking_no_overlap",
+    "ALTER TABLE bookings_booking DROP COLUMN IF EXISTS stay",
+]
+
+
+def add_stay_exclusion(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in FORWARD_SQL:
+        schema_editor.execute(sql)
+
+
+def remove_stay_exclusion(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in REVERSE_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookings", "0002_roomnight"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_stay_exclusion, remove_stay_exclusion),
+    ]
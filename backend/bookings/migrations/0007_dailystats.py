@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bookings", "0006_outboxmessage_held_status"),
+        ("rooms", "0005_rename_describtion_roomtype_description"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("rooms_sold", models.IntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                ("arrivals", models.IntegerField(default=0)),
+                ("departures", models.IntegerField(default=0)),
+                ("cancellations", models.IntegerField(default=0)),
+                (
+                    "room_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="rooms.roomtype",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "daily stats",
+                "indexes": [
+                    models.Index(fields=["date"], name="bookings_da_date_9a7c4a_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("room_type", "date"), name="unique_daily_stats"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,45 +1,247 @@
 
 
-from django.db import models
-from django.db.models import Q
+import hashlib
+import json
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from django.db import models, transaction, connections, IntegrityError
+from django.db.models import Sum
+from django.db.models.expressions import Expression
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from rooms.models import Room, RoomType
+from . import availability, engine
+from .locks import room_type_lock
+
+
+class StayOverlaps(Expression):
+    """
+    `stay && daterange(check_in, check_out)` against the PostgreSQL-only
+    generated column added in migration 0003_booking_stay_exclusion.
+    """
+    output_field = models.BooleanField()
+    conditional = True
+    
+    def __init__(self, check_in, check_out, alias=None):
+        super().__init__()
+        self.check_in = check_in
+        self.check_out = check_out
+        self.alias = alias
+    
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None, summarize=False, for_save=False):
+        clone = self.copy()
+        clone.alias = query.get_initial_alias()
+        return clone
+    
+    def relabeled_clone(self, change_map):
+        # Keep pointing at the booking table when used inside a subquery
+        clone = self.copy()
+        clone.alias = change_map.get(self.alias, self.alias)
+        return clone
+    
+    def get_group_by_cols(self):
+        return []
+    
+    def as_sql(self, compiler, connection):
+        column = f'{compiler.quote_name_unless_alias(self.alias)}.{connection.ops.quote_name("stay")}'
+        return f"{column} && daterange(%s, %s, '[)')", (self.check_in, self.check_out)
+
+
+class Nights(models.Func):
+    """Whole nights between two date columns (check_in and check_out by default), computed by the database"""
+    output_field = models.IntegerField()
+    
+    def __init__(self, check_in='check_in', check_out='check_out', **extra):
+        super().__init__(check_out, check_in, **extra)
+    
+    def as_sql(self, compiler, connection, **extra_context):
+        # date - date is a number of days on PostgreSQL
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context
+        )
+    
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='DATEDIFF', **extra_context)
+
+
+class BookingQuerySet(models.QuerySet):
+    
+    def with_pricing(self):
+        """
+        Annotate nights and total_price in SQL, so they can be sorted, filtered
+        and aggregated on; Booking.nights/total_price return the annotated values.
+        """
+        return self.annotate(
+            nights=Nights(),
+            total_price=models.ExpressionWrapper(
+                models.F('room_type__base_price') * Nights(),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            ),
+        )
+
+
+BulkConfirmResult = namedtuple('BulkConfirmResult', ['confirmed', 'failed'])
 
 
 class BookingManager(models.Manager):
     """Custom manager for booking queries"""
     
-    def get_available_rooms(self, room_type, check_in, check_out):
+    def overlapping(self, check_in, check_out):
+        """
+        Active bookings with a room assigned that overlap [check_in, check_out).
+        This is a range scan over the booking table - prefer the RoomNight
+        ledger for availability questions.
+        """
+        active = self.filter(
+            status__in=Booking.ACTIVE_STATUSES,
+            room__isnull=False
+        )
+        if connections[self.db].vendor == 'postgresql':
+            # Served by the partial GiST index on the generated `stay` column
+            return active.filter(StayOverlaps(check_in, check_out))
+        return active.filter(
+            check_in__lt=check_out,
+            check_out__gt=check_in
+        )
+    
+    def get_available_rooms(self, room_type, check_in, check_out, use_engine=True):
         """
         Get available rooms for a room type during the specified period.
         Returns a queryset of available Room objects.
         
         IMPORTANT: Only looks at confirmed/checked-in bookings that have a room assigned.
         Pending bookings are ignored since they don't have rooms assigned yet.
+        
+        With AVAILABILITY_ENGINE = 'numpy' the in-memory occupancy matrix picks
+        the rooms; pass use_engine=False where the database must decide.
         """
-        # Find all bookings that:
-        # 1. Are confirmed or checked in (not pending)
-        # 2. Have a room assigned (room is not null)
-        # 3. Overlap with the requested dates
-        overlapping_bookings = self.filter(
-            status__in=['confirmed', 'checked_in'],  # Only active bookings
-            room__room_type=room_type,  # Filter by room type through the room relationship
-            room__isnull=False,  # Must have a room assigned
-            # Date overlap check: booking overlaps if check_in < requested check_out AND check_out > requested check_in
-            check_in__lt=check_out,
-            check_out__gt=check_in
-        ).values_list('room_id', flat=True).distinct()
+        matrix = engine.get_engine() if use_engine else None
+        if matrix is not None:
+            room_ids = matrix.available_room_ids(room_type.id, check_in, check_out)
+            if room_ids is not None:
+                return Room.objects.filter(id__in=room_ids, is_active=True)
+        
+        # The RoomNight ledger holds one row per occupied (room, night), so
+        # this is an indexed lookup over the requested nights only instead
+        # of an overlap scan over the whole booking history.
+        booked_room_ids = RoomNight.objects.booked_room_ids(
+            check_in, check_out, room_type=room_type
+        )
         
-        # Get all active rooms of this type that are NOT in overlapping bookings
+        # Get all active rooms of this type that are NOT occupied on any requested night
         available_rooms = Room.objects.filter(
             room_type=room_type,
             is_active=True
         ).exclude(
-            id__in=overlapping_bookings
+            id__in=booked_room_ids
         )
         
         return available_rooms
+    
+    def bulk_confirm(self, booking_ids):
+        """
+        Confirm many pending bookings with a fixed number of queries: lock the
+        affected room types once, plan assignments in memory, then write
+        bookings with bulk_update and ledger rows with bulk_create.
+        Returns BulkConfirmResult(confirmed=[Booking, ...], failed={booking_id: reason}).
+        """
+        # Import here to avoid circular import
+        from .assignment import plan_for_bookings
+        
+        failed = {}
+        confirmed = []
+        
+        room_type_ids = set(self.filter(id__in=booking_ids).values_list('room_type_id', flat=True))
+        
+        with room_type_lock(*room_type_ids, using=self.db):
+            bookings = {
+                booking.id: booking
+                for booking in self.select_for_update(of=('self',)).select_related('room_type').filter(
+                    id__in=booking_ids
+                )
+            }
+            
+            # Same rules as Booking.clean(), checked in memory; like confirm(),
+            # a check-in already in the past is allowed
+            candidates = []
+            for booking_id in booking_ids:
+                booking = bookings.get(booking_id)
+                if booking is None:
+                    failed[booking_id] = "Booking not found"
+                elif booking.status != 'pending':
+                    failed[booking_id] = "Only pending bookings can be confirmed"
+                elif booking.check_out <= booking.check_in:
+                    failed[booking_id] = "Check-out must be after check-in"
+                elif booking.guests > booking.room_type.capacity:
+                    failed[booking_id] = (
+                        f"Room type '{booking.room_type.name}' has max capacity of {booking.room_type.capacity}"
+                    )
+                else:
+                    candidates.append(booking)
+            
+            plans = plan_for_bookings(candidates)
+            
+            now = timezone.now()
+            for plan in plans.values():
+                for booking_id in plan.rejected:
+                    failed[booking_id] = "No rooms available"
+                for booking_id, room_id in plan.assignments.items():
+                    booking = bookings[booking_id]
+                    booking.room_id = room_id
+                    booking.status = 'confirmed'
+                    booking.updated_at = now
+                    confirmed.append(booking)
+            
+            if confirmed:
+                try:
+                    with transaction.atomic(using=self.db):
+                        nights = self._write_confirmed(confirmed)
+                except IntegrityError:
+                    # A night was taken outside the room type lock (the ledger's
+                    # unique constraint, or the overlap constraint on PostgreSQL):
+                    # write the bookings one at a time to find the conflicting ones
+                    nights = []
+                    written = []
+                    for booking in confirmed:
+                        try:
+                            with transaction.atomic(using=self.db):
+                                nights += self._write_confirmed([booking])
+                            written.append(booking)
+                        except IntegrityError:
+                            failed[booking.id] = "Room is already booked for these dates"
+                            booking.room_id = None
+                            booking.status = 'pending'
+                    confirmed = written
+            
+            if confirmed:
+                changes = {(night.room_id, night.date): True for night in nights}
+                room_type_ids = set(plans)
+                transaction.on_commit(
+                    lambda: availability.occupancy_changed(changes, room_type_ids)
+                )
+        
+        return BulkConfirmResult(confirmed, failed)
+    
+    def _write_confirmed(self, bookings):
+        """Save planned confirmations with their ledger rows and stats; returns the RoomNights"""
+        self.bulk_update(bookings, ['room', 'status', 'updated_at'], batch_size=500)
+        nights = [
+            RoomNight(booking=booking, room_id=booking.room_id, date=day)
+            for booking in bookings
+            for day in booking.stay_dates()
+        ]
+        RoomNight.objects.bulk_create(nights, batch_size=1000)
+        DailyStats.objects.bookings_changed(
+            [(booking.stats_state()[:3] + ('pending',), booking.stats_state()) for booking in bookings],
+            {booking.room_type_id: booking.room_type.base_price for booking in bookings}
+        )
+        return nights
 
     
     
@@ -71,6 +273,15 @@ class Booking(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    # Statuses that hold a room (and therefore rows in the RoomNight ledger)
+    ACTIVE_STATUSES = ['confirmed', 'checked_in']
+    
+    # Statuses whose nights count as sold in DailyStats
+    SOLD_STATUSES = ['confirmed', 'checked_in', 'checked_out']
+    
+    # PostgreSQL exclusion constraint rejecting overlapping active stays per room
+    STAY_EXCLUSION_CONSTRAINT = 'bookings_booking_no_overlap'
+    
     # Guest info
     full_name = models.CharField(max_length=150)
     email = models.EmailField()
@@ -102,7 +313,7 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
-    objects = BookingManager()
+    objects = BookingManager.from_queryset(BookingQuerySet)()
     
     class Meta:
         ordering = ['-created_at']
@@ -111,75 +322,227 @@ class Booking(models.Model):
             models.Index(fields=['status']),
         ]
     
+    # Fields whose loaded values are remembered so clean() and save() can
+    # skip work for inputs that did not change
+    TRACKED_FIELDS = ['room_type_id', 'room_id', 'check_in', 'check_out', 'guests', 'status']
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_values()
+        return instance
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # The reloaded values are the new baseline for changed_fields()
+        self._remember_loaded_values()
+    
+    def _remember_loaded_values(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            name: getattr(self, name) for name in self.TRACKED_FIELDS if name not in deferred
+        }
+    
+    def changed_fields(self):
+        """Tracked fields that differ from the database (all of them for a new booking)"""
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return set(self.TRACKED_FIELDS)
+        return {
+            name for name in self.TRACKED_FIELDS
+            if name not in loaded or loaded[name] != getattr(self, name)
+        }
+    
+    def _holds_room_changed(self, changed):
+        """Whether the room/nights this booking holds may differ from the ledger"""
+        if changed & {'room_id', 'check_in', 'check_out'}:
+            return True
+        if 'status' in changed:
+            was_active = self._loaded_values.get('status') in self.ACTIVE_STATUSES
+            return was_active != (self.status in self.ACTIVE_STATUSES)
+        return False
+    
     def clean(self):
-        """Validate booking"""
-        if self.check_out <= self.check_in:
-            raise ValidationError("Check-out must be after check-in")
+        """Validate booking, re-running only the checks whose inputs changed"""
+        changed = self.changed_fields()
         
-        if self.check_in < timezone.now().date():
-            raise ValidationError("Check-in cannot be in the past")
+        if changed & {'check_in', 'check_out'}:
+            if self.check_out <= self.check_in:
+                raise ValidationError("Check-out must be after check-in")
+            
+            if 'check_in' in changed and self.check_in < timezone.now().date():
+                raise ValidationError("Check-in cannot be in the past")
         
-        if self.guests > self.room_type.capacity:
-            raise ValidationError(
-                f"Room type '{self.room_type.name}' has max capacity of {self.room_type.capacity}"
-            )
+        if changed & {'guests', 'room_type_id'}:
+            if self.guests > self.room_type.capacity:
+                raise ValidationError(
+                    f"Room type '{self.room_type.name}' has max capacity of {self.room_type.capacity}"
+                )
         
-        if self.room and self.status in ['confirmed', 'checked_in']:
-            overlapping = Booking.objects.filter(
-                room=self.room,
-                status__in=['confirmed', 'checked_in']
+        # Checked on every backend so forms (e.g. the admin) show it as a form
+        # error. The RoomNight unique constraint and, on PostgreSQL, the
+        # bookings_booking_no_overlap exclusion constraint only back this up
+        # against concurrent writes (reported by save()).
+        if (
+            self.room_id
+            and self.status in self.ACTIVE_STATUSES
+            and (self._state.adding or self._holds_room_changed(changed))
+        ):
+            overlapping = RoomNight.objects.filter(
+                room_id=self.room_id,
+                date__gte=self.check_in,
+                date__lt=self.check_out
             )
             
             if self.pk:
-                overlapping = overlapping.exclude(pk=self.pk)
-            
-            overlapping = overlapping.filter(
-                Q(check_in__lt=self.check_out) & Q(check_out__gt=self.check_in)
-            )
+                overlapping = overlapping.exclude(booking_id=self.pk)
             
             if overlapping.exists():
                 raise ValidationError(
                     f"Room {self.room.number} is already booked for these dates"
                 )
     
-    def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
+    def save(self, *args, validate=True, **kwargs):
+        """
+        Validate and save, keeping the RoomNight ledger in step.
+        validate=False skips full_clean() for callers that already checked
+        the booking (e.g. under room_type_lock); database constraints still apply.
+        """
+        changed = self.changed_fields()
+        if validate:
+            # Unchanged fields were valid when loaded; skipping them also
+            # skips the existence query per foreign key
+            unchanged = {name.removesuffix('_id') for name in set(self.TRACKED_FIELDS) - changed}
+            self.full_clean(exclude=unchanged)
+        sync_ledger = self._state.adding or self._holds_room_changed(changed)
+        
+        with transaction.atomic():
+            # Another booking may claim one of these nights between clean()
+            # and the write; report that like the clean() check does.
+            try:
+                super().save(*args, **kwargs)
+            except IntegrityError as e:
+                if self.STAY_EXCLUSION_CONSTRAINT not in str(e):
+                    raise
+                raise ValidationError(
+                    f"Room {self.room.number} is already booked for these dates"
+                )
+            changes = None
+            if sync_ledger:
+                try:
+                    changes = RoomNight.objects.sync_booking(self)
+                except IntegrityError:
+                    raise ValidationError(
+                        f"Room {self.room.number} is already booked for these dates"
+                    )
+            if changes:
+                room_type_ids = {self.room_type_id}
+                if self.room:
+                    room_type_ids.add(self.room.room_type_id)
+                transaction.on_commit(
+                    lambda: availability.occupancy_changed(changes, room_type_ids)
+                )
+            if changed & {'room_type_id', 'check_in', 'check_out', 'status'}:
+                DailyStats.objects.booking_changed(self._loaded_stats_state(), self.stats_state(), self._rates())
+        self._remember_loaded_values()
+    
+    def delete(self, *args, **kwargs):
+        """Delete, taking the booking out of DailyStats (bulk deletes are caught by the nightly rebuild)"""
+        state = self._loaded_stats_state()
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            DailyStats.objects.booking_changed(state, None, self._rates())
+        return result
+    
+    def stats_state(self):
+        """(room_type_id, check_in, check_out, status), what DailyStats counts of this booking"""
+        return (self.room_type_id, self.check_in, self.check_out, self.status)
+    
+    def _loaded_stats_state(self):
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return None
+        if not {'room_type_id', 'check_in', 'check_out', 'status'} <= loaded.keys():
+            # Deferred fields; read what the database holds
+            return Booking.objects.filter(pk=self.pk).values_list(
+                'room_type_id', 'check_in', 'check_out', 'status'
+            ).first()
+        return (loaded['room_type_id'], loaded['check_in'], loaded['check_out'], loaded['status'])
+    
+    def _rates(self):
+        """Nightly rate of the loaded room type, saving DailyStats a query"""
+        if Booking.room_type.is_cached(self):
+            return {self.room_type_id: self.room_type.base_price}
+        return {}
     
     def __str__(self):
         room_info = f"Room {self.room.number}" if self.room else "No room assigned"
         return f"{self.full_name} - {room_info} ({self.get_status_display()})"
     
+    def _pricing_annotation(self, name):
+        """A with_pricing() value, if loaded and the dates and room type are unchanged since"""
+        value = self.__dict__.get(f'_{name}')
+        loaded = getattr(self, '_loaded_values', {})
+        if value is None or any(
+            loaded.get(field) != getattr(self, field) for field in ('room_type_id', 'check_in', 'check_out')
+        ):
+            return None
+        return value
+    
     @property
     def nights(self):
         """Calculate number of nights"""
+        annotated = self._pricing_annotation('nights')
+        if annotated is not None:
+            return annotated
         if self.check_in and self.check_out:
             return (self.check_out - self.check_in).days
         return 0
     
+    @nights.setter
+    def nights(self, value):
+        # Set by with_pricing()
+        self._nights = value
+    
     @property
     def total_price(self):
         """Calculate total price"""
+        annotated = self._pricing_annotation('total_price')
+        if annotated is not None:
+            return annotated
         if self.nights and self.room_type:
             return self.room_type.base_price * self.nights
         return 0
     
+    @total_price.setter
+    def total_price(self, value):
+        self._total_price = value
+    
+    def stay_dates(self):
+        """Dates of every night of the stay (check-out day excluded)"""
+        return [self.check_in + timedelta(days=i) for i in range(self.nights)]
+    
     def confirm(self, room=None):
         """Confirm booking and assign room"""
         if self.status != 'pending':
             raise ValidationError("Only pending bookings can be confirmed")
         
-        if not room:
-            available = Booking.objects.get_available_rooms(
-                self.room_type, self.check_in, self.check_out
-            )
-            if not available.exists():
-                raise ValidationError("No rooms available")
-            room = available.first()
-        
-        self.room = room
-        self.status = 'confirmed'
-        self.save()
+        # Hold the room type lock from picking the room until the write, so
+        # concurrent confirmations can't pick the same room
+        with room_type_lock(self.room_type_id, using=self._state.db or 'default'):
+            # A room picked here is free by construction; only a given room
+            # needs the overlap check
+            validate = room is not None
+            if not room:
+                room = Booking.objects.get_available_rooms(
+                    self.room_type, self.check_in, self.check_out, use_engine=False
+                ).first()
+                if room is None:
+                    raise ValidationError("No rooms available")
+            
+            self.room = room
+            self.status = 'confirmed'
+            self.save(validate=validate)
     
     def cancel(self):
         """Cancel booking"""
@@ -203,6 +566,371 @@ class Booking(models.Model):
         self.save()
 
 
+class RoomNightManager(models.Manager):
+    """Queries and maintenance for the per-night occupancy ledger"""
+    
+    def booked_room_ids(self, check_in, check_out, room_type=None):
+        """Ids of rooms occupied on at least one night in [check_in, check_out)"""
+        nights = self.filter(date__gte=check_in, date__lt=check_out)
+        if room_type is not None:
+            nights = nights.filter(room__room_type=room_type)
+        return nights.values_list('room_id', flat=True)
+    
+    def sync_booking(self, booking):
+        """
+        Bring the ledger rows of one booking in line with its current state.
+        Returns {(room_id, date): occupied} for every night that changed
+        (empty if none).
+        """
+        wanted = set()
+        if booking.room_id and booking.status in Booking.ACTIVE_STATUSES:
+            wanted = {(booking.room_id, day) for day in booking.stay_dates()}
+        
+        existing = {
+            (room_id, day): pk
+            for pk, room_id, day in self.filter(booking=booking).values_list('id', 'room_id', 'date')
+        }
+        
+        stale = {key: pk for key, pk in existing.items() if key not in wanted}
+        missing = [key for key in wanted if key not in existing]
+        
+        if stale:
+            self.filter(id__in=stale.values()).delete()
+        if missing:
+            self.bulk_create([
+                RoomNight(booking=booking, room_id=room_id, date=day)
+                for room_id, day in missing
+            ])
+        changes = {key: False for key in stale}
+        changes.update({key: True for key in missing})
+        return changes
+
+
+class RoomNight(models.Model):
+    """
+    Occupancy ledger derived from Booking: one row per (room, night) held by a
+    confirmed or checked-in booking. Kept in sync by Booking.save() and
+    rebuilt with `manage.py rebuild_room_nights`.
+    """
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='nights')
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='room_nights')
+    date = models.DateField()
+    
+    objects = RoomNightManager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'date'], name='unique_room_night'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'room']),
+        ]
+    
+    def __str__(self):
+        return f"Room {self.room_id} on {self.date} (booking #{self.booking_id})"
+
+
+class DailyStatsManager(models.Manager):
+    """Incremental maintenance, rebuilds and range sums of the daily aggregates"""
+    
+    COUNTERS = ['rooms_sold', 'revenue', 'arrivals', 'departures', 'cancellations']
+    
+    def contribution(self, room_type_id, check_in, check_out, status, rate):
+        """
+        {(room_type_id, date): {counter: amount}} that one booking adds: a sold
+        stay counts each night as a room sold at its rate, an arrival on
+        check-in and a departure on check-out; a cancelled booking counts as
+        a cancellation on its check-in date. Pending bookings add nothing.
+        """
+        rows = defaultdict(dict)
+        if status in Booking.SOLD_STATUSES:
+            for i in range((check_out - check_in).days):
+                rows[(room_type_id, check_in + timedelta(days=i))].update(rooms_sold=1, revenue=rate)
+            rows[(room_type_id, check_in)]['arrivals'] = 1
+            rows[(room_type_id, check_out)]['departures'] = 1
+        elif status == 'cancelled':
+            rows[(room_type_id, check_in)]['cancellations'] = 1
+        return rows
+    
+    def booking_changed(self, before, after, rates=None):
+        """Move one booking from state `before` to `after` (Booking.stats_state() tuples or None)"""
+        self.bookings_changed([(before, after)], rates)
+    
+    def bookings_changed(self, changes, rates=None):
+        """
+        Apply (before, after) booking state changes to the stored rows.
+        rates maps room type ids to nightly rates; missing ones are looked up.
+        """
+        changes = [(before, after) for before, after in changes if _counted(before) != _counted(after)]
+        if not changes:
+            return
+        
+        rates = dict(rates or {})
+        missing = {state[0] for pair in changes for state in pair if state and state[0] not in rates}
+        if missing:
+            rates.update(RoomType.objects.filter(id__in=missing).values_list('id', 'base_price'))
+        
+        deltas = defaultdict(dict)
+        for before, after in changes:
+            for state, sign in ((before, -1), (after, 1)):
+                if not state or state[0] not in rates:
+                    continue
+                for key, counters in self.contribution(*state, rates[state[0]]).items():
+                    for name, amount in counters.items():
+                        deltas[key][name] = deltas[key].get(name, 0) + sign * amount
+        self._apply(deltas)
+    
+    def _apply(self, deltas):
+        deltas = {
+            key: {name: amount for name, amount in counters.items() if amount}
+            for key, counters in deltas.items()
+        }
+        deltas = {key: counters for key, counters in deltas.items() if counters}
+        if not deltas:
+            return
+        
+        self.bulk_create(
+            [DailyStats(room_type_id=room_type_id, date=day) for room_type_id, day in deltas],
+            ignore_conflicts=True
+        )
+        # Lock the rows (in a fixed order, so concurrent writers can't
+        # deadlock) and write them back in one statement: three queries
+        # however many bookings and days change
+        room_type_ids = {room_type_id for room_type_id, _ in deltas}
+        dates = {day for _, day in deltas}
+        rows = [
+            row for row in self.select_for_update().filter(
+                room_type_id__in=room_type_ids, date__gte=min(dates), date__lte=max(dates)
+            ).order_by('room_type_id', 'date')
+            if (row.room_type_id, row.date) in deltas
+        ]
+        for row in rows:
+            for name, amount in deltas[(row.room_type_id, row.date)].items():
+                setattr(row, name, getattr(row, name) + amount)
+        self.bulk_update(rows, self.COUNTERS, batch_size=500)
+    
+    def rebuild(self, start=None, end=None, batch_size=1000):
+        """
+        Recompute the rows dated in [start, end) (every date by default) from
+        Booking; returns how many rows were written.
+        """
+        bookings = Booking.objects.filter(
+            status__in=Booking.SOLD_STATUSES + ['cancelled']
+        ).values_list('room_type_id', 'check_in', 'check_out', 'status', 'room_type__base_price')
+        rows = self.all()
+        if start:
+            # Departures are counted on the check-out date itself
+            bookings = bookings.filter(check_out__gte=start)
+            rows = rows.filter(date__gte=start)
+        if end:
+            bookings = bookings.filter(check_in__lt=end)
+            rows = rows.filter(date__lt=end)
+        
+        with transaction.atomic():
+            # Delete first: the row locks make concurrent booking_changed()
+            # calls wait, and the bookings are read in the same transaction
+            rows.delete()
+            totals = defaultdict(dict)
+            for room_type_id, check_in, check_out, status, rate in bookings.iterator(chunk_size=2000):
+                for key, counters in self.contribution(room_type_id, check_in, check_out, status, rate).items():
+                    if (start and key[1] < start) or (end and key[1] >= end):
+                        continue
+                    for name, amount in counters.items():
+                        totals[key][name] = totals[key].get(name, 0) + amount
+            self.bulk_create(
+                [
+                    DailyStats(room_type_id=room_type_id, date=day, **counters)
+                    for (room_type_id, day), counters in totals.items()
+                ],
+                batch_size=batch_size
+            )
+        return len(totals)
+    
+    def totals(self, start, end, room_type_ids=None):
+        """Counter sums over [start, end) per room type: {room_type_id: {counter: total}}"""
+        rows = self.filter(date__gte=start, date__lt=end)
+        if room_type_ids is not None:
+            rows = rows.filter(room_type_id__in=room_type_ids)
+        sums = rows.values('room_type_id').annotate(
+            **{f'total_{name}': Sum(name) for name in self.COUNTERS}
+        ).order_by()
+        return {
+            row['room_type_id']: {name: row[f'total_{name}'] for name in self.COUNTERS}
+            for row in sums
+        }
+
+
+def _counted(state):
+    """The part of a booking state DailyStats depends on (None if it counts for nothing)"""
+    if not state:
+        return None
+    room_type_id, check_in, check_out, status = state
+    if status in Booking.SOLD_STATUSES:
+        return (room_type_id, check_in, check_out, 'sold')
+    if status == 'cancelled':
+        return (room_type_id, check_in, 'cancelled')
+    return None
+
+
+class DailyStats(models.Model):
+    """
+    Occupancy and revenue per room type and day, derived from Booking:
+    nights sold and their revenue, arrivals, departures and cancellations
+    (on the cancelled stay's check-in date). Maintained by Booking.save()
+    and bulk_confirm(), rebuilt nightly (rebuild_daily_stats). Revenue uses
+    the room type's current base price, like Booking.total_price.
+    """
+    room_type = models.ForeignKey(RoomType, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    rooms_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    arrivals = models.IntegerField(default=0)
+    departures = models.IntegerField(default=0)
+    cancellations = models.IntegerField(default=0)
+    
+    objects = DailyStatsManager()
+    
+    class Meta:
+        verbose_name_plural = 'daily stats'
+        constraints = [
+            models.UniqueConstraint(fields=['room_type', 'date'], name='unique_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.room_type_id} on {self.date}: {self.rooms_sold} sold"
+
+
+
+class IdempotencyKeyManager(models.Manager):
+    """Stored responses for retried POSTs"""
+    
+    def lookup(self, scope, key):
+        """The live record for (scope, key), or None. Expired records are dropped."""
+        record = self.filter(scope=scope, key=key).first()
+        if record and record.expires_at <= timezone.now():
+            record.delete()
+            return None
+        return record
+    
+    def purge_expired(self):
+        """Delete expired records; returns how many were removed"""
+        # No relations or signals, so this is a single DELETE on the expires_at index
+        deleted, _ = self.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+class IdempotencyKey(models.Model):
+    """
+    First response to a request carrying an Idempotency-Key header, replayed
+    for retries of the same request until it expires.
+    """
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    objects = IdempotencyKeyManager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key'),
+        ]
+    
+    @staticmethod
+    def hash_request(data):
+        """Stable hash of a request payload, to spot a key reused for a different request"""
+        payload = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def __str__(self):
+        return f"{self.scope}:{self.key} ({self.status_code})"
+
+
+class OutboxMessageManager(models.Manager):
+    """Emails recorded in the transaction of the change they announce"""
+    
+    def enqueue(self, kind, email, booking=None, hold=False):
+        """
+        Record email, a (subject, message, from_email, recipient_list) tuple,
+        for the outbox relay. Call inside the transaction that changes the
+        booking: a rollback discards the message with it. Held messages are
+        not sent themselves but folded into a digest (see outbox.send_admin_digest).
+        """
+        return self.create(status='held' if hold else 'pending', **self._fields(kind, email, booking))
+    
+    def enqueue_many(self, kind, emails):
+        """enqueue() for (booking, email) pairs, in one INSERT"""
+        return self.bulk_create([
+            self.model(**self._fields(kind, email, booking)) for booking, email in emails
+        ])
+    
+    def _fields(self, kind, email, booking):
+        subject, message, from_email, recipient_list = email
+        return {
+            'kind': kind,
+            'booking': booking,
+            'subject': subject,
+            'body': message,
+            'from_email': from_email or '',
+            'recipients': list(recipient_list),
+        }
+    
+    def due(self):
+        """Pending messages whose next attempt time has come"""
+        return self.filter(status='pending', available_at__lte=timezone.now())
+    
+    def purge_sent(self, older_than):
+        """Delete messages sent before now - older_than (a timedelta); returns how many"""
+        deleted, _ = self.filter(status='sent', sent_at__lt=timezone.now() - older_than).delete()
+        return deleted
+
+
+class OutboxMessage(models.Model):
+    """
+    An email waiting to be sent by the outbox relay (bookings/outbox.py).
+    Written in the same transaction as the booking change, so it exists if
+    and only if the change was committed.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('held', 'Held for digest'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50)
+    booking = models.ForeignKey(
+        Booking, on_delete=models.CASCADE, null=True, blank=True, related_name='outbox_messages'
+    )
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = OutboxMessageManager()
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} to {', '.join(self.recipients)} ({self.status})"
+
+
 
 
 
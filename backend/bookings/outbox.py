@@ -0,0 +1,225 @@
+"""
+Transactional outbox relay.
+
+Booking changes record their emails as OutboxMessage rows in the same
+transaction (OutboxMessage.objects.enqueue), so a rolled-back change sends
+nothing and a committed one is not lost if the process dies before sending.
+relay() claims a batch of due messages with SELECT ... FOR UPDATE SKIP
+LOCKED and sends them while holding the row locks: relays running in
+parallel (celery workers, the relay_outbox command) each get a different
+batch and never send a message twice. The Brevo backend gets the whole
+batch in one send_messages() call and reports the result of each message;
+any other backend is fed one message per call through the pooled
+dispatcher in core/mail.py, so one refused recipient fails only its own
+message. Failed messages are retried with exponential backoff up to
+OUTBOX_MAX_ATTEMPTS, then marked failed.
+
+Delivery is at least once: if the process dies after the mail server has
+accepted a message but before the batch commits, that message is resent.
+
+With ADMIN_NOTIFICATION_DIGEST on, new-booking notifications to the admin
+are held instead (unless the check-in is within ADMIN_DIGEST_URGENT_DAYS)
+and send_admin_digest(), run every ADMIN_DIGEST_WINDOW seconds, folds them
+into one summary email. Once ADMIN_DIGEST_THRESHOLD notifications are held
+the digest is folded straight away instead of waiting for the window.
+"""
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from core import mail
+from .emails.bravo_email import BrevoEmailBackend
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+RelayResult = namedtuple('RelayResult', ['sent', 'retrying', 'failed'])
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def relay(batch_size=None, connection=None):
+    """Send one batch of due messages; returns a RelayResult of counts"""
+    batch_size = batch_size or _setting('OUTBOX_BATCH_SIZE', 100)
+    max_attempts = _setting('OUTBOX_MAX_ATTEMPTS', 5)
+    retry_delay = _setting('OUTBOX_RETRY_DELAY', 60)
+    sent = retrying = failed = 0
+
+    with transaction.atomic():
+        batch = list(
+            OutboxMessage.objects.due()
+            .select_for_update(skip_locked=True)
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        if not batch:
+            return RelayResult(0, 0, 0)
+
+        emails = [
+            EmailMessage(
+                message.subject,
+                message.body,
+                message.from_email or settings.DEFAULT_FROM_EMAIL,
+                message.recipients,
+            )
+            for message in batch
+        ]
+        errors = _send(emails, connection)
+
+        now = timezone.now()
+        for message, email in zip(batch, emails):
+            message.attempts += 1
+            error = errors.get(id(email))
+            if error is None:
+                message.status = 'sent'
+                message.sent_at = now
+                message.last_error = ''
+                sent += 1
+            else:
+                message.last_error = error[:1000]
+                if message.attempts >= max_attempts:
+                    message.status = 'failed'
+                    failed += 1
+                    logger.error(f"Giving up on outbox message #{message.id} ({message.kind}): {error}")
+                else:
+                    message.available_at = now + timedelta(seconds=retry_delay * 2 ** (message.attempts - 1))
+                    retrying += 1
+                    logger.warning(f"Outbox message #{message.id} failed, will retry: {error}")
+        
+        OutboxMessage.objects.bulk_update(
+            batch, ['status', 'attempts', 'last_error', 'available_at', 'sent_at']
+        )
+
+    if sent or failed:
+        logger.info(f"Outbox relay sent {sent}, gave up on {failed}, {retrying} to retry")
+    return RelayResult(sent, retrying, failed)
+
+
+def _send(emails, connection=None):
+    """Send emails; returns {id(email): error} for the ones that failed"""
+    if connection is None:
+        connection = get_connection()
+        if not isinstance(connection, BrevoEmailBackend):
+            return mail.deliver(emails)
+    if isinstance(connection, BrevoEmailBackend):
+        return _send_batch(emails, connection)
+
+    errors = {}
+    connection.open()
+    try:
+        for email in emails:
+            error = mail.send_one(email, connection)
+            if error is not None:
+                errors[id(email)] = error
+    finally:
+        connection.close()
+    return errors
+
+
+def _send_batch(emails, connection):
+    """
+    Send emails in one send_messages() call, so Brevo's messageVersions get
+    the whole batch; the backend marks each message with brevo_error.
+    """
+    try:
+        connection.send_messages(emails)
+    except Exception as e:
+        # BrevoSendError names the failed messages; anything else failed them all
+        failed = getattr(e, 'failed_messages', None)
+        if failed is None:
+            return {id(email): str(e) for email in emails}
+        return {id(email): email.brevo_error or str(e) for email in failed}
+    finally:
+        connection.close()
+    return {id(email): email.brevo_error for email in emails if email.brevo_error}
+
+
+def drain(batch_size=None, max_batches=None):
+    """Relay batches until nothing is due (or max_batches); returns the summed RelayResult"""
+    batch_size = batch_size or _setting('OUTBOX_BATCH_SIZE', 100)
+    totals = RelayResult(0, 0, 0)
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        result = relay(batch_size)
+        totals = RelayResult(*(total + count for total, count in zip(totals, result)))
+        batches += 1
+        if sum(result) < batch_size:
+            break
+    return totals
+
+
+def hold_for_digest(booking):
+    """Whether the admin notification for a new booking should wait for the digest"""
+    if not _setting('ADMIN_NOTIFICATION_DIGEST', False):
+        return False
+    # Arrivals this close can't wait for the next digest
+    urgent_until = timezone.localdate() + timedelta(days=_setting('ADMIN_DIGEST_URGENT_DAYS', 1))
+    return booking.check_in > urgent_until
+
+
+def send_digest_if_full():
+    """
+    Fold the held notifications into a digest now if ADMIN_DIGEST_THRESHOLD
+    (0 for no threshold) are waiting; returns how many bookings it covers.
+    """
+    threshold = _setting('ADMIN_DIGEST_THRESHOLD', 0)
+    if not threshold:
+        return 0
+    if OutboxMessage.objects.filter(status='held', kind='admin_new_booking').count() < threshold:
+        return 0
+    return send_admin_digest()
+
+
+def send_admin_digest():
+    """
+    Replace the held admin notifications with one digest email in the
+    outbox; returns how many bookings it covers.
+    """
+    with transaction.atomic():
+        held = list(
+            OutboxMessage.objects.filter(status='held', kind='admin_new_booking')
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('booking__room_type')
+            .order_by('id')
+        )
+        bookings = [message.booking for message in held if message.booking is not None]
+        if bookings:
+            OutboxMessage.objects.enqueue('admin_digest', _admin_digest_email(bookings, held[0].created_at))
+        OutboxMessage.objects.filter(id__in=[message.id for message in held]).update(
+            status='sent', sent_at=timezone.now()
+        )
+
+    if bookings:
+        logger.info(f"Queued admin digest for {len(bookings)} new booking(s)")
+    return len(bookings)
+
+
+def _admin_digest_email(bookings, since):
+    """(subject, message, from_email, recipient_list) summarizing new bookings"""
+    subject = f'{len(bookings)} New Booking Request{"s" if len(bookings) != 1 else ""}'
+    lines = [
+        f"#{booking.id}  {booking.full_name} ({booking.email})  {booking.room_type.name}  "
+        f"{booking.check_in.strftime('%b %d')} - {booking.check_out.strftime('%b %d, %Y')} "
+        f"({booking.nights} nights, {booking.guests} guests)  ${booking.total_price}"
+        f"{'' if booking.status == 'pending' else f'  [now {booking.status}]'}"
+        for booking in bookings
+    ]
+    total = sum(booking.total_price or 0 for booking in bookings)
+    
+    message = f"""
+New Booking Requests since {timezone.localtime(since).strftime('%B %d, %Y %H:%M')}
+
+{chr(10).join(lines)}
+
+{len(bookings)} request(s), ${total} in total.
+
+Please log in to the admin panel to confirm these bookings and assign rooms.
+"""
+    
+    return subject, message, settings.DEFAULT_FROM_EMAIL, [settings.ADMIN_EMAIL]
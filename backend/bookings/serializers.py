@@ -1,6 +1,7 @@
 
 
 from rest_framework import serializers
+from . import availability
 from .models import Booking
 
 
@@ -85,11 +86,7 @@ class PublicBookingSerializer(serializers.ModelSerializer):
         
         # Check availability
         if room_type and check_in and check_out:
-            available_rooms = Booking.objects.get_available_rooms(
-                room_type, check_in, check_out
-            )
-            
-            if not available_rooms.exists():
+            if not availability.available_count(room_type, check_in, check_out):
                 raise serializers.ValidationError(
                     f'No rooms of type "{room_type.name}" are available for the selected dates'
                 )
@@ -5,7 +5,7 @@ from django.db import transaction
 from django.db.models import Q
 from django.core.exceptions import ValidationError
 from rooms.models import Room, RoomType
-from .models import BookingRequest, Booking
+from .models import BookingRequest, Booking, RoomNight
 from decimal import Decimal
 
 class RoomUnavailableError(Exception):
@@ -21,34 +21,17 @@ class BookingService:
         Get all available rooms of a specific type for given dates.
         Returns queryset of available Room objects.
         """
-        # Get all rooms of this type that are active
-        all_rooms = Room.objects.filter(
-            room_type=room_type,
-            is_active=True
-        )
-        
-        # Find rooms that have conflicting bookings
-        booked_room_ids = Booking.objects.filter(
-            room__room_type=room_type,
-            status__in=[Booking.STATUS_CONFIRMED, Booking.STATUS_CHECKED_IN],
-            check_in__lt=check_out,
-            check_out__gt=check_in
-        ).values_list('room_id', flat=True)
-        
-        # Return rooms that are NOT in the booked list
-        available_rooms = all_rooms.exclude(id__in=booked_room_ids)
-        return available_rooms
+        return Booking.objects.get_available_rooms(room_type, check_in, check_out)
     
     @staticmethod
     def is_room_available(room, check_in, check_out):
         """Check if a specific room is available for given dates"""
-        overlapping_bookings = Booking.objects.filter(
+        occupied_nights = RoomNight.objects.filter(
             room=room,
-            status__in=[Booking.STATUS_CONFIRMED, Booking.STATUS_CHECKED_IN],
-            check_in__lt=check_out,
-            check_out__gt=check_in
+            date__gte=check_in,
+            date__lt=check_out
         )
-        return not overlapping_bookings.exists()
+        return not occupied_nights.exists()
     
     @staticmethod
     def calculate_total_price(room_type, check_in, check_out):
@@ -0,0 +1,43 @@
+"""
+Room changes and booking deletes invalidate the availability caches and the
+occupancy matrix.
+
+Both are otherwise only told about booking saves, so a room added, deleted,
+moved to another type or (de)activated in the admin, or a deleted booking,
+would leave them answering from the old inventory. Bulk writes that skip
+signals (RoomImporter, queryset.update()) call availability.rooms_changed()
+themselves; queryset.delete() sends post_delete for every booking.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from rooms.models import Room
+from . import availability
+from .models import Booking
+
+
+@receiver(pre_save, sender=Room)
+def remember_room_type(sender, instance, **kwargs):
+    instance._previous_room_type_id = None
+    if instance.pk:
+        instance._previous_room_type_id = (
+            Room.objects.filter(pk=instance.pk).values_list('room_type_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def room_changed(sender, instance, **kwargs):
+    room_type_ids = {instance.room_type_id, getattr(instance, '_previous_room_type_id', None)} - {None}
+    transaction.on_commit(lambda: availability.rooms_changed(room_type_ids))
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    if instance.room_id is None or instance.status not in Booking.ACTIVE_STATUSES:
+        return
+    # Its RoomNight rows go with it (cascade); free those nights
+    changes = {(instance.room_id, day): False for day in instance.stay_dates()}
+    room_type_ids = {instance.room_type_id}
+    transaction.on_commit(lambda: availability.occupancy_changed(changes, room_type_ids))
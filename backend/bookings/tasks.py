@@ -204,4 +204,61 @@ Hotel Nyumba Management Team
         
     except Exception as e:
         logger.error(f"Failed to send cancellation email for booking #{booking_id}: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+@shared_task
+def purge_expired_idempotency_keys():
+    """Delete stored Idempotency-Key responses past their TTL (scheduled by celery beat)"""
+    from .models import IdempotencyKey
+    
+    deleted = IdempotencyKey.objects.purge_expired()
+    logger.info(f"Purged {deleted} expired idempotency keys")
+    return deleted
+
+
+@shared_task
+def relay_outbox():
+    """Send due outbox messages (scheduled by celery beat; safe to run on several workers at once)"""
+    from .outbox import drain
+    
+    result = drain()
+    return result._asdict()
+
+
+@shared_task
+def send_admin_digest():
+    """Fold held new-booking notifications into one admin email (every ADMIN_DIGEST_WINDOW)"""
+    from .outbox import send_admin_digest as fold
+    
+    return fold()
+
+
+@shared_task
+def purge_sent_outbox_messages():
+    """Delete outbox messages sent longer ago than OUTBOX_RETENTION"""
+    from datetime import timedelta
+    from .models import OutboxMessage
+    
+    deleted = OutboxMessage.objects.purge_sent(timedelta(seconds=settings.OUTBOX_RETENTION))
+    logger.info(f"Purged {deleted} sent outbox messages")
+    return deleted
+
+
+@shared_task
+def rebuild_daily_stats():
+    """
+    Recompute DailyStats from Booking (scheduled nightly by celery beat) for
+    the last DAILY_STATS_REBUILD_DAYS days through the last booked check-out.
+    Older rows are left alone; rebuild them with the rebuild_daily_stats command.
+    """
+    from datetime import timedelta
+    from django.db.models import Max
+    from django.utils import timezone
+    from .models import Booking, DailyStats
+    
+    start = timezone.now().date() - timedelta(days=getattr(settings, 'DAILY_STATS_REBUILD_DAYS', 30))
+    last_check_out = Booking.objects.aggregate(last=Max('check_out'))['last']
+    end = max(start, last_check_out or start) + timedelta(days=1)
+    rows = DailyStats.objects.rebuild(start, end)
+    logger.info(f"Rebuilt {rows} daily stats rows from {start} to {end}")
+    return rows
@@ -1,3 +1,1431 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.mail import EmailDispatcher
+from core.tests import RefusingBackend
+from core.throttling import CacheLimiter, MemoryLimiter, get_limiter, reset_limiters, throttle_stats
+from rooms.models import Room, RoomType
+from . import availability, engine, export, importer, outbox, tasks
+from .emails.bravo_email import BrevoEmailBackend, BrevoSendError
+from .emails.standin import BrevoStandInServer
+from .assignment import plan_assignments, plan_first_available, plan_for_bookings
+from .models import Booking, DailyStats, IdempotencyKey, OutboxMessage, RoomNight
+from .views import CheckAvailabilityAsyncView
+
+
+class BookingTestMixin:
+    """Shared fixtures for booking tests"""
+
+    def setUp(self):
+        reset_limiters()
+        self.today = timezone.now().date()
+        self.room_type = RoomType.objects.create(name='Deluxe', base_price=100, capacity=2)
+        self.room_a = Room.objects.create(room_type=self.room_type, number='101')
+        self.room_b = Room.objects.create(room_type=self.room_type, number='102')
+
+    def make_booking(self, start=1, nights=3, **kwargs):
+        check_in = self.today + timedelta(days=start)
+        return Booking.objects.create(
+            full_name=kwargs.pop('full_name', 'Guest'),
+            email=kwargs.pop('email', 'guest@example.com'),
+            room_type=kwargs.pop('room_type', self.room_type),
+            check_in=check_in,
+            check_out=check_in + timedelta(days=nights),
+            **kwargs
+        )
+
+
+class RoomNightLedgerTests(BookingTestMixin, TestCase):
+
+    def test_confirm_writes_one_row_per_night(self):
+        booking = self.make_booking(nights=3)
+        self.assertFalse(RoomNight.objects.exists())
+
+        booking.confirm(room=self.room_a)
+
+        self.assertEqual(
+            list(booking.room_nights.order_by('date').values_list('date', flat=True)),
+            booking.stay_dates()
+        )
+
+    def test_cancel_and_check_out_release_nights(self):
+        booking = self.make_booking(start=0, nights=2)
+        booking.confirm(room=self.room_a)
+        booking.mark_check_in()
+        self.assertEqual(booking.room_nights.count(), 2)
+
+        booking.mark_check_out()
+        self.assertFalse(booking.room_nights.exists())
+
+        other = self.make_booking(start=5)
+        other.confirm(room=self.room_b)
+        other.cancel()
+        self.assertFalse(RoomNight.objects.exists())
+
+    def test_available_rooms_uses_ledger(self):
+        self.make_booking(start=2, nights=3).confirm(room=self.room_a)
+        check_in = self.today + timedelta(days=3)
+
+        available = Booking.objects.get_available_rooms(self.room_type, check_in, check_in + timedelta(days=1))
+        self.assertEqual(list(available), [self.room_b])
+
+        # Back-to-back stays do not overlap
+        check_in = self.today + timedelta(days=5)
+        available = Booking.objects.get_available_rooms(self.room_type, check_in, check_in + timedelta(days=2))
+        self.assertEqual(set(available), {self.room_a, self.room_b})
+
+    def test_ledger_conflict_is_a_validation_error(self):
+        self.make_booking(nights=3).confirm(room=self.room_a)
+        rival = self.make_booking(start=2, nights=2)
+
+        # Simulate a concurrent confirmation that slipped past clean()
+        with mock.patch.object(Booking, 'clean'):
+            with self.assertRaises(ValidationError):
+                rival.confirm(room=self.room_a)
+
+        rival.refresh_from_db()
+        self.assertEqual(rival.status, 'pending')
+
+    def test_rebuild_and_check_command(self):
+        self.make_booking(nights=2).confirm()
+        self.make_booking(nights=4).confirm()
+        RoomNight.objects.all().delete()
+
+        with self.assertRaisesMessage(CommandError, "RoomNight ledger is inconsistent"):
+            call_command('rebuild_room_nights', check=True, stdout=StringIO(), stderr=StringIO())
+
+        call_command('rebuild_room_nights', stdout=StringIO())
+        self.assertEqual(RoomNight.objects.count(), 6)
+        call_command('rebuild_room_nights', check=True, stdout=StringIO())
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_admin_reports_overlapping_edit_on_the_form(self):
+        self.make_booking(start=1, nights=3).confirm(room=self.room_a)
+        booking = self.make_booking(start=5, nights=2)
+        booking.confirm(room=self.room_a)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+        response = self.client.post(reverse('admin:bookings_booking_change', args=[booking.pk]), {
+            'full_name': booking.full_name, 'email': booking.email, 'phone': '',
+            'room_type': self.room_type.id, 'room': self.room_a.id,
+            'check_in': (self.today + timedelta(days=2)).isoformat(), 'check_out': booking.check_out.isoformat(),
+            'guests': 1, 'special_requests': '', 'status': 'confirmed',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Room 101 is already booked for these dates', response.context['errors'].as_text())
+
+class AvailabilityCalendarTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.url = reverse('bookings:availability-calendar')
+        self.params = {'start': self.today.isoformat(), 'days': 10}
+
+    def counts(self, response):
+        return [day['available'] for day in response.json()['room_types'][0]['days']]
+
+    def test_per_day_counts(self):
+        self.make_booking(start=2, nights=3).confirm(room=self.room_a)
+
+        response = self.client.get(self.url, self.params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(response), [2, 2, 1, 1, 1, 2, 2, 2, 2, 2])
+
+    def test_cached_until_booking_in_window_changes(self):
+        booking = self.make_booking(start=3, nights=2)
+        self.client.get(self.url, self.params)
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url, self.params)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.confirm(room=self.room_a)
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(self.counts(response)[3:5], [1, 1])
+
+    def test_deleted_booking_frees_its_days(self):
+        booking = self.make_booking(start=3, nights=2)
+        booking.confirm(room=self.room_a)
+        self.assertEqual(self.counts(self.client.get(self.url, self.params))[3:5], [1, 1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.filter(pk=booking.pk).delete()
+        self.assertEqual(self.counts(self.client.get(self.url, self.params))[3:5], [2, 2])
+
+    def test_rejects_oversized_window(self):
+        response = self.client.get(self.url, {'days': 366})
+        self.assertEqual(response.status_code, 400)
+
+
+@skipIf(engine.np is None, "numpy is not installed")
+@override_settings(AVAILABILITY_ENGINE='numpy')
+class OccupancyMatrixTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        engine._engine = None
+        self.addCleanup(setattr, engine, '_engine', None)
+
+    def test_matches_database_and_tracks_changes(self):
+        self.make_booking(start=2, nights=3).confirm(room=self.room_a)
+        matrix = engine.get_engine()
+        check_in = self.today + timedelta(days=3)
+        check_out = check_in + timedelta(days=2)
+
+        self.assertEqual(matrix.available_room_ids(self.room_type.id, check_in, check_out), [self.room_b.id])
+
+        booking = self.make_booking(start=3, nights=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.confirm(room=self.room_b)
+        # Applied incrementally, no rebuild needed
+        with self.assertNumQueries(0):
+            self.assertEqual(matrix.available_count(self.room_type.id, check_in, check_out), 0)
+
+    def test_room_edits_rebuild_the_matrix(self):
+        matrix = engine.get_engine()
+        check_in = self.today + timedelta(days=1)
+        check_out = check_in + timedelta(days=1)
+        matrix.ensure_current()
+
+        self.room_a.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room_a.save()
+            room_c = Room.objects.create(room_type=self.room_type, number='103')
+
+        self.assertEqual(
+            list(Booking.objects.get_available_rooms(self.room_type, check_in, check_out).order_by('id')),
+            [self.room_b, room_c],
+        )
+
+    def test_deleted_booking_frees_its_nights(self):
+        check_in = self.today + timedelta(days=1)
+        check_out = check_in + timedelta(days=2)
+        for room in (self.room_a, self.room_b):
+            self.make_booking(start=1, nights=2).confirm(room=room)
+        matrix = engine.get_engine()
+        matrix.ensure_current()
+        self.assertEqual(matrix.available_room_ids(self.room_type.id, check_in, check_out), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.get(room=self.room_a).delete()
+        self.assertEqual(matrix.available_room_ids(self.room_type.id, check_in, check_out), [self.room_a.id])
+
+        # Queryset deletes (the admin's "delete selected") too
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.filter(room=self.room_b).delete()
+        self.assertEqual(
+            list(Booking.objects.get_available_rooms(self.room_type, check_in, check_out).order_by('id')),
+            [self.room_a, self.room_b],
+        )
+
+    def test_outside_window_falls_back_to_database(self):
+        matrix = engine.get_engine()
+        far = self.today + timedelta(days=matrix.days + 10)
+        self.assertIsNone(matrix.available_room_ids(self.room_type.id, far, far + timedelta(days=1)))
+        self.assertEqual(Booking.objects.get_available_rooms(self.room_type, far, far + timedelta(days=1)).count(), 2)
+
+    def test_check_availability_view_uses_engine(self):
+        engine.get_engine().ensure_current()
+        with self.assertNumQueries(1):  # the room type lookup
+            response = self.client.post(reverse('bookings:check-availability'), {
+                'room_type_id': self.room_type.id,
+                'check_in': (self.today + timedelta(days=1)).isoformat(),
+                'check_out': (self.today + timedelta(days=2)).isoformat(),
+            }, content_type='application/json')
+        self.assertEqual(response.json()['available_count'], 2)
+
+
+class AvailabilityCacheTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        availability.availability_cache.reset_stats()
+        check_in = self.today + timedelta(days=4)
+        self.payload = {
+            'room_type_id': self.room_type.id,
+            'check_in': check_in.isoformat(),
+            'check_out': (check_in + timedelta(days=2)).isoformat(),
+        }
+
+    def check(self):
+        response = self.client.post(reverse('bookings:check-availability'), self.payload, content_type='application/json')
+        return response.json()['available_count']
+
+    def test_repeated_checks_hit_the_cache(self):
+        self.assertEqual(self.check(), 2)
+        with self.assertNumQueries(1):  # the room type lookup only
+            self.assertEqual(self.check(), 2)
+        self.assertEqual(availability.availability_cache.stats()['hits'], 1)
+        self.assertEqual(availability.availability_cache.stats()['misses'], 1)
+
+    def test_status_transitions_bump_the_room_type_version(self):
+        self.assertEqual(self.check(), 2)
+        booking = self.make_booking(start=5, nights=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.confirm(room=self.room_a)
+        self.assertEqual(self.check(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.cancel()
+        self.assertEqual(self.check(), 2)
+        self.assertEqual(availability.availability_cache.stats()['misses'], 3)
+
+    def test_other_room_types_keep_their_entries(self):
+        other_type = RoomType.objects.create(name='Suite', base_price=200, capacity=4)
+        other_room = Room.objects.create(room_type=other_type, number='201')
+        self.check()
+
+        booking = self.make_booking(start=4, nights=2, room_type=other_type)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.confirm(room=other_room)
+        self.check()
+
+        self.assertEqual(availability.availability_cache.stats()['hits'], 1)
+
+    def test_room_edits_invalidate_old_and_new_room_type(self):
+        suite = RoomType.objects.create(name='Suite', base_price=200, capacity=4)
+        self.assertEqual(self.check(), 2)
+
+        self.room_a.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room_a.save()
+        self.assertEqual(self.check(), 1)
+
+        self.payload['room_type_id'] = suite.id
+        self.assertEqual(self.check(), 0)
+        self.room_b.room_type = suite
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room_b.save()
+        self.assertEqual(self.check(), 1)
+        self.payload['room_type_id'] = self.room_type.id
+        self.assertEqual(self.check(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Room.objects.create(room_type=self.room_type, number='103')
+        self.assertEqual(self.check(), 1)
+
+
+    def test_deleted_booking_bumps_the_room_type_version(self):
+        booking = self.make_booking(start=4, nights=2)
+        booking.confirm(room=self.room_a)
+        self.assertEqual(self.check(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertEqual(self.check(), 2)
+
+class BatchCheckAvailabilityTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('bookings:check-availability-batch')
+        self.suite = RoomType.objects.create(name='Suite', base_price=250, capacity=4)
+        self.suite_room = Room.objects.create(room_type=self.suite, number='301')
+
+    def query(self, room_type, start, nights):
+        check_in = self.today + timedelta(days=start)
+        return {
+            'room_type_id': room_type.id,
+            'check_in': check_in.isoformat(),
+            'check_out': (check_in + timedelta(days=nights)).isoformat(),
+        }
+
+    def post(self, queries):
+        return self.client.post(self.url, {'queries': queries}, content_type='application/json')
+
+    def test_answers_each_range(self):
+        self.make_booking(start=2, nights=3).confirm(room=self.room_a)
+        self.make_booking(start=10, nights=2, room_type=self.suite).confirm(room=self.suite_room)
+
+        response = self.post([
+            self.query(self.room_type, 0, 2),
+            self.query(self.room_type, 3, 1),
+            self.query(self.suite, 9, 2),
+            self.query(self.suite, 12, 3),
+            {'room_type_id': self.room_type.id, 'check_in': 'tomorrow'},
+        ])
+
+        results = response.json()['results']
+        self.assertEqual([r.get('available_count') for r in results], [2, 1, 0, 1, None])
+        self.assertEqual(results[3]['total_price'], '750.00')
+        self.assertIn('error', results[4])
+
+    def test_query_count_is_bounded(self):
+        queries = [self.query(self.room_type, start, 2) for start in range(100)]
+        queries += [self.query(self.suite, start, 3) for start in range(100)]
+
+        # Room types, active rooms, occupied nights
+        with self.assertNumQueries(3):
+            response = self.post(queries)
+        self.assertEqual(len(response.json()['results']), 200)
+
+    def test_rejects_oversized_batches(self):
+        queries = [self.query(self.room_type, 1, 1)] * (availability.BATCH_MAX_QUERIES + 1)
+        self.assertEqual(self.post(queries).status_code, 400)
+
+
+class FlexibleSearchTests(BookingTestMixin, TestCase):
+
+    def search(self, nights, start, days, **params):
+        response = self.client.get(reverse('bookings:flexible-search'), {
+            'nights': nights,
+            'start': (self.today + timedelta(days=start)).isoformat(),
+            'end': (self.today + timedelta(days=start + days)).isoformat(),
+            **params
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def offsets(self, results):
+        return [(date.fromisoformat(r['check_in']) - self.today).days for r in results]
+
+    def test_finds_every_fitting_start_date(self):
+        # Room A is taken for nights 3-5 and room B for nights 1-7, so a
+        # 3-night stay inside days 1-11 can start on day 6 (room A) at the
+        # earliest and on day 8 in either room.
+        self.make_booking(start=3, nights=3).confirm(room=self.room_a)
+        self.make_booking(start=1, nights=7).confirm(room=self.room_b)
+        results = self.search(3, 1, 10)
+
+        self.assertEqual(self.offsets(results), [6, 7, 8])
+        self.assertEqual(results[0]['available_rooms'], 1)
+        self.assertEqual(results[-1]['available_rooms'], 2)
+        self.assertEqual(results[0]['cheapest_price'], '300.00')
+
+    def test_picks_the_cheapest_room_type(self):
+        budget = RoomType.objects.create(name='Budget', base_price=40, capacity=2)
+        budget_room = Room.objects.create(room_type=budget, number='B1')
+        self.make_booking(start=1, nights=2, room_type=budget).confirm(room=budget_room)
+
+        results = self.search(2, 1, 4)
+
+        self.assertEqual([r['room_type'] for r in results], ['Deluxe', 'Deluxe', 'Budget'])
+        self.assertEqual(results[2]['cheapest_price'], '80.00')
+        self.assertEqual(self.offsets(self.search(2, 1, 4, room_type_id=budget.id)), [3])
+
+    def test_query_count_does_not_depend_on_range(self):
+        self.make_booking(start=3, nights=3).confirm(room=self.room_a)
+        # Room types, rooms, overlapping bookings
+        with self.assertNumQueries(3):
+            self.search(2, 0, 300)
+
+
+class RoomAssignmentTests(BookingTestMixin, TestCase):
+
+    def test_optimizer_fits_what_first_available_rejects(self):
+        day = lambda n: self.today + timedelta(days=n)
+        rooms = {1: [], 2: []}
+        # In arrival order, first-available puts stays 10 and 11 in room 1
+        # with a one-night hole between them, so stay 13 no longer fits anywhere.
+        requests = [
+            (10, day(1), day(2)),
+            (11, day(3), day(4)),
+            (12, day(0), day(3)),
+            (13, day(2), day(5)),
+        ]
+
+        self.assertEqual(plan_first_available(rooms, requests).rejected, [13])
+        plan = plan_assignments(rooms, requests)
+        self.assertEqual(plan.rejected, [])
+        self.assertEqual(plan.assignments, {10: 1, 13: 1, 12: 2, 11: 2})
+
+    def test_prefers_the_tightest_gap(self):
+        day = lambda n: self.today + timedelta(days=n)
+        rooms = {1: [(day(0), day(3))], 2: [(day(0), day(1))]}
+
+        plan = plan_assignments(rooms, [(20, day(3), day(5))])
+
+        self.assertEqual(plan.assignments, {20: 1})
+
+    def test_plans_around_existing_stays(self):
+        self.make_booking(start=1, nights=2).confirm(room=self.room_a)
+        first = self.make_booking(start=3, nights=2)
+        second = self.make_booking(start=1, nights=1)
+
+        plans = plan_for_bookings(Booking.objects.filter(status='pending'))
+
+        plan = plans[self.room_type.id]
+        self.assertEqual(plan.assignments, {first.id: self.room_a.id, second.id: self.room_b.id})
+
+
+class BulkConfirmTests(BookingTestMixin, TestCase):
+
+    def confirm_with_queries(self, bookings):
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                result = Booking.objects.bulk_confirm([booking.id for booking in bookings])
+        return result, len(queries)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        small, small_queries = self.confirm_with_queries([self.make_booking(start=1, nights=1)])
+
+        for n in range(6):
+            Room.objects.create(room_type=self.room_type, number=f'2{n:02d}')
+        large, large_queries = self.confirm_with_queries(
+            [self.make_booking(start=start, nights=1) for start in range(2, 9) for _ in range(2)]
+        )
+
+        self.assertEqual(len(small.confirmed), 1)
+        self.assertEqual(len(large.confirmed), 14)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_confirms_and_writes_ledger(self):
+        bookings = [self.make_booking(start=1, nights=2), self.make_booking(start=1, nights=2)]
+
+        result, _ = self.confirm_with_queries(bookings)
+
+        self.assertEqual(result.failed, {})
+        rooms = set(Booking.objects.filter(status='confirmed').values_list('room_id', flat=True))
+        self.assertEqual(rooms, {self.room_a.id, self.room_b.id})
+        self.assertEqual(RoomNight.objects.count(), 4)
+
+    def test_conflicting_ledger_rows_fail_only_their_booking(self):
+        clash = self.make_booking(start=1, nights=1)
+        fine = self.make_booking(start=5, nights=1)
+        # Nights taken without a confirmed booking, e.g. by a write outside the lock
+        ghost = self.make_booking(start=1, nights=1)
+        for room in (self.room_a, self.room_b):
+            RoomNight.objects.create(booking=ghost, room=room, date=clash.check_in)
+
+        result, _ = self.confirm_with_queries([clash, fine])
+
+        self.assertEqual([booking.id for booking in result.confirmed], [fine.id])
+        self.assertEqual(result.failed, {clash.id: "Room is already booked for these dates"})
+        clash.refresh_from_db()
+        self.assertEqual((clash.status, clash.room_id), ('pending', None))
+        self.assertEqual(RoomNight.objects.filter(booking=fine).count(), 1)
+
+    def test_past_check_in_is_allowed_like_confirm(self):
+        late = self.make_booking(start=1, nights=3)
+        Booking.objects.filter(id=late.id).update(
+            check_in=self.today - timedelta(days=1), check_out=self.today + timedelta(days=1)
+        )
+
+        result, _ = self.confirm_with_queries([late])
+
+        self.assertEqual(result.failed, {})
+        self.assertEqual(RoomNight.objects.filter(booking=late).count(), 2)
+
+    def test_reports_per_booking_failures(self):
+        self.make_booking(start=1, nights=2).confirm(room=self.room_a)
+        fits = self.make_booking(start=1, nights=2)
+        no_room = self.make_booking(start=1, nights=2)
+        too_many = self.make_booking(start=5, nights=1)
+        Booking.objects.filter(id=too_many.id).update(guests=3)
+        cancelled = self.make_booking(start=5, nights=1)
+        cancelled.cancel()
+
+        result, _ = self.confirm_with_queries([fits, no_room, too_many, cancelled])
+
+        self.assertEqual([booking.id for booking in result.confirmed], [fits.id])
+        self.assertEqual(result.failed, {
+            no_room.id: "No rooms available",
+            too_many.id: "Room type 'Deluxe' has max capacity of 2",
+            cancelled.id: "Only pending bookings can be confirmed",
+        })
+        self.assertEqual(Booking.objects.get(id=no_room.id).status, 'pending')
+
+
+class ConcurrentConfirmationTests(TransactionTestCase):
+
+    def test_threads_never_double_book(self):
+        out = StringIO()
+        call_command(
+            'stress_confirmations', threads=4, bookings=40, room_types=1, rooms=3, days=5, stdout=out
+        )
+
+        self.assertIn(" 0 errors", out.getvalue())
+        self.assertIn("Overlapping stays: 0", out.getvalue())
+        self.assertFalse(Booking.objects.exists())
+
+
+class BookingChangeTrackingTests(BookingTestMixin, TestCase):
+
+    def test_status_transition_skips_unchanged_checks(self):
+        booking = self.make_booking(start=0, nights=2)
+        booking.confirm(room=self.room_a)
+        booking = Booking.objects.get(id=booking.id)
+
+        # Savepoint, UPDATE, release: no FK, capacity, overlap or ledger queries
+        with self.assertNumQueries(3):
+            booking.mark_check_in()
+
+    def test_check_out_after_arrival_day(self):
+        booking = self.make_booking(start=0, nights=2)
+        booking.confirm(room=self.room_a)
+        booking.mark_check_in()
+        Booking.objects.filter(id=booking.id).update(
+            check_in=self.today - timedelta(days=1), check_out=self.today + timedelta(days=1)
+        )
+        booking = Booking.objects.get(id=booking.id)
+
+        booking.mark_check_out()
+
+        self.assertEqual(booking.status, 'checked_out')
+        self.assertFalse(booking.room_nights.exists())
+
+    def test_changed_dates_are_revalidated(self):
+        self.make_booking(start=4, nights=2).confirm(room=self.room_a)
+        booking = self.make_booking(start=1, nights=2)
+        booking.confirm(room=self.room_a)
+        booking = Booking.objects.get(id=booking.id)
+
+        booking.check_out = self.today + timedelta(days=5)
+        with self.assertRaises(ValidationError):
+            booking.save()
+
+        booking.check_in = self.today - timedelta(days=1)
+        booking.check_out = self.today + timedelta(days=2)
+        with self.assertRaises(ValidationError):
+            booking.save()
+
+
+class IdempotencyKeyTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('bookings:booking-create')
+        check_in = self.today + timedelta(days=3)
+        self.payload = {
+            'full_name': 'Retry Guest',
+            'email': 'retry@example.com',
+            'room_type': self.room_type.id,
+            'check_in': check_in.isoformat(),
+            'check_out': (check_in + timedelta(days=2)).isoformat(),
+            'guests': 1,
+        }
+
+    def post(self, payload, key):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                self.url, payload, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key
+            )
+
+    def test_retry_replays_first_response(self):
+        first = self.post(self.payload, 'abc')
+
+        with self.assertNumQueries(1):
+            retry = self.post(self.payload, 'abc')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_key_reused_for_different_request(self):
+        self.post(self.payload, 'abc')
+
+        response = self.post(dict(self.payload, guests=2), 'abc')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_expired_keys_are_purged(self):
+        self.post(self.payload, 'abc')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+
+        self.assertIn("Purged 1", out.getvalue())
+        response = self.post(self.payload, 'abc')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Booking.objects.count(), 2)
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_DELAY=60)
+class OutboxTests(BookingTestMixin, TestCase):
+
+    def enqueue(self, booking):
+        return OutboxMessage.objects.enqueue(
+            'guest_confirmation', ('Confirmed', 'Body', '', [booking.email]), booking=booking
+        )
+
+    def test_rolled_back_change_sends_nothing(self):
+        booking = self.make_booking()
+        with self.assertRaises(ValidationError):
+            with transaction.atomic():
+                booking.confirm(room=self.room_a)
+                self.enqueue(booking)
+                raise ValidationError("payment declined")
+
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(outbox.drain(), (0, 0, 0))
+
+    def test_booking_create_queues_notification_for_relay(self):
+        check_in = self.today + timedelta(days=3)
+        response = self.client.post(reverse('bookings:booking-create'), {
+            'full_name': 'Outbox Guest',
+            'email': 'outbox@example.com',
+            'room_type': self.room_type.id,
+            'check_in': check_in.isoformat(),
+            'check_out': (check_in + timedelta(days=2)).isoformat(),
+            'guests': 1,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+
+        out = StringIO()
+        call_command('relay_outbox', stdout=out)
+
+        self.assertIn("Sent 1", out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Outbox Guest', mail.outbox[0].subject)
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.kind, message.status), ('admin_new_booking', 'sent'))
+        # Already sent messages are not picked up again
+        self.assertEqual(outbox.drain(), (0, 0, 0))
+
+    def test_relay_sends_in_batches(self):
+        booking = self.make_booking()
+        for _ in range(5):
+            self.enqueue(booking)
+
+        self.assertEqual(outbox.relay(batch_size=2), (2, 0, 0))
+        self.assertEqual(outbox.drain(batch_size=2), (3, 0, 0))
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failures_back_off_then_give_up(self):
+        message = self.enqueue(self.make_booking())
+        broken = mock.Mock(send_messages=mock.Mock(side_effect=OSError('connection refused')))
+
+        self.assertEqual(outbox.relay(connection=broken), (0, 1, 0))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertGreater(message.available_at, timezone.now())
+        self.assertEqual(outbox.relay(connection=broken), (0, 0, 0))
+
+        OutboxMessage.objects.update(available_at=timezone.now())
+        self.assertEqual(outbox.relay(connection=broken), (0, 0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.last_error), ('failed', 'connection refused'))
+
+    def test_refused_recipient_fails_only_its_message(self):
+        dispatcher = EmailDispatcher(workers=2, connection_factory=RefusingBackend)
+        self.addCleanup(dispatcher.shutdown, 5)
+        booking = self.make_booking()
+        recipients = [
+            'a@example.com', 'b@example.com', 'bad@example.com', 'c@example.com', 'd@example.com', 'e@example.com'
+        ]
+        for email in recipients:
+            OutboxMessage.objects.enqueue('guest_confirmation', ('Confirmed', 'Body', '', [email]), booking=booking)
+
+        with mock.patch('core.mail._dispatcher', dispatcher):
+            self.assertEqual(outbox.relay(), (5, 1, 0))
+            OutboxMessage.objects.filter(status='pending').update(available_at=timezone.now())
+            self.assertEqual(outbox.relay(), (0, 0, 1))
+
+        self.assertEqual(
+            dict(OutboxMessage.objects.values_list('recipients__0', 'status')),
+            {email: 'failed' if email == 'bad@example.com' else 'sent' for email in recipients},
+        )
+        refused = OutboxMessage.objects.get(status='failed')
+        self.assertEqual(refused.attempts, 2)
+        self.assertIn('No such user', refused.last_error)
+        # The accepted messages were not sent again with the retry
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), sorted(set(recipients) - {'bad@example.com'}))
+
+    def test_relay_hands_the_batch_to_one_backend_call(self):
+        server = BrevoStandInServer(reject={'bad@example.com'}).start()
+        self.addCleanup(server.stop)
+        booking = self.make_booking()
+        for email in ['a@example.com', 'bad@example.com', 'b@example.com']:
+            OutboxMessage.objects.enqueue('guest_confirmation', ('Confirmed', 'Body', '', [email]), booking=booking)
+        backend = BrevoEmailBackend(api_key='test', api_url=server.url, max_workers=1)
+
+        self.assertEqual(outbox.relay(connection=backend), (2, 1, 0))
+
+        # One batch request, then each message alone to find the rejected one
+        self.assertEqual(len(server.payloads[0]['messageVersions']), 3)
+        self.assertEqual(
+            dict(OutboxMessage.objects.values_list('recipients__0', 'status')),
+            {'a@example.com': 'sent', 'bad@example.com': 'pending', 'b@example.com': 'sent'},
+        )
+        self.assertIn('not valid', OutboxMessage.objects.get(status='pending').last_error)
+
+
+@override_settings(ADMIN_NOTIFICATION_DIGEST=True, ADMIN_DIGEST_URGENT_DAYS=1)
+class AdminDigestTests(BookingTestMixin, TestCase):
+
+    def book(self, name, start):
+        check_in = self.today + timedelta(days=start)
+        response = self.client.post(reverse('bookings:booking-create'), {
+            'full_name': name,
+            'email': 'digest@example.com',
+            'room_type': self.room_type.id,
+            'check_in': check_in.isoformat(),
+            'check_out': (check_in + timedelta(days=2)).isoformat(),
+            'guests': 1,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_bookings_are_collected_into_one_digest(self):
+        self.book('Early Planner', start=10)
+        self.book('Late Planner', start=20)
+        self.book('Walk In', start=0)
+
+        # Only the urgent arrival goes out straight away
+        outbox.drain()
+        self.assertEqual([message.subject for message in mail.outbox], ['New Booking Request from Walk In'])
+
+        out = StringIO()
+        call_command('send_admin_digest', stdout=out)
+        self.assertIn("digest of 2", out.getvalue())
+        outbox.drain()
+
+        digest = mail.outbox[1]
+        self.assertEqual(digest.subject, '2 New Booking Requests')
+        self.assertIn('Early Planner', digest.body)
+        self.assertIn('Late Planner', digest.body)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(OutboxMessage.objects.filter(status='held').exists())
+        self.assertEqual(outbox.send_admin_digest(), 0)
+
+    @override_settings(ADMIN_DIGEST_THRESHOLD=2)
+    def test_threshold_sends_the_digest_without_waiting(self):
+        self.book('Early Planner', start=10)
+        self.assertTrue(OutboxMessage.objects.filter(status='held').exists())
+
+        self.book('Late Planner', start=20)
+        self.assertFalse(OutboxMessage.objects.filter(status='held').exists())
+        outbox.drain()
+        self.assertEqual([message.subject for message in mail.outbox], ['2 New Booking Requests'])
+
+    @override_settings(ADMIN_NOTIFICATION_DIGEST=False)
+    def test_digest_off_sends_each_notification(self):
+        self.book('Early Planner', start=10)
+        self.book('Late Planner', start=20)
+
+        outbox.drain()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(outbox.send_admin_digest(), 0)
+
+
+class BookingPricingTests(BookingTestMixin, TestCase):
+
+    def test_annotations_match_properties(self):
+        suite = RoomType.objects.create(name='Suite', base_price='250.50', capacity=4)
+        self.make_booking(nights=3)
+        self.make_booking(start=2, nights=1, room_type=suite)
+        self.make_booking(start=5, nights=7)
+
+        annotated = list(Booking.objects.with_pricing().order_by('-total_price'))
+
+        self.assertEqual([booking.total_price for booking in annotated], [700, 300, Decimal('250.50')])
+        for booking in annotated:
+            fresh = Booking.objects.get(pk=booking.pk)
+            self.assertEqual((booking.nights, booking.total_price), (fresh.nights, fresh.total_price))
+        self.assertEqual(
+            [booking.nights for booking in Booking.objects.with_pricing().filter(nights__gte=3).order_by('nights')],
+            [3, 7]
+        )
+
+    def test_annotation_is_ignored_once_dates_change(self):
+        self.make_booking(nights=3)
+        booking = Booking.objects.with_pricing().get()
+
+        booking.check_out += timedelta(days=2)
+
+        self.assertEqual((booking.nights, booking.total_price), (5, 500))
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_admin_changelist_sorts_on_annotations(self):
+        for nights in (4, 1, 2):
+            self.make_booking(nights=nights)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        url = reverse('admin:bookings_booking_changelist')
+
+        # Columns: id, full_name, room_type, room_display, check_in, check_out, nights, ...
+        response = self.client.get(url, {'o': '7'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([booking.nights for booking in response.context['cl'].result_list], [1, 2, 4])
+        self.assertIsNone(response.context['cl'].full_result_count)
+
+
+class DailyStatsTests(BookingTestMixin, TestCase):
+
+    def snapshot(self):
+        return list(
+            DailyStats.objects.exclude(
+                rooms_sold=0, revenue=0, arrivals=0, departures=0, cancellations=0
+            ).order_by('room_type_id', 'date').values_list(
+                'room_type_id', 'date', 'rooms_sold', 'revenue', 'arrivals', 'departures', 'cancellations'
+            )
+        )
+
+    def test_incremental_updates_match_rebuild(self):
+        suite = RoomType.objects.create(name='Suite', base_price=250, capacity=4)
+        Room.objects.create(room_type=suite, number='201')
+
+        staying = self.make_booking(start=0, nights=2)
+        staying.confirm(room=self.room_a)
+        staying.mark_check_in()
+        moved = self.make_booking(start=3, nights=3)
+        moved.confirm(room=self.room_b)
+        moved.check_out = moved.check_out + timedelta(days=2)
+        moved.save()
+        cancelled = self.make_booking(start=4, nights=1)
+        cancelled.confirm(room=self.room_a)
+        cancelled.cancel()
+        self.make_booking(start=5).cancel()
+        self.make_booking(start=6)
+        bulk = [self.make_booking(start=10 + i, nights=2, room_type=suite) for i in range(3)]
+        Booking.objects.bulk_confirm([booking.id for booking in bulk])
+        gone = self.make_booking(start=20, nights=1)
+        gone.confirm(room=self.room_a)
+        Booking.objects.get(pk=gone.pk).delete()
+
+        incremental = self.snapshot()
+        self.assertEqual(DailyStats.objects.rebuild(), len(incremental))
+        self.assertEqual(self.snapshot(), incremental)
+
+        day = DailyStats.objects.get(room_type=self.room_type, date=self.today + timedelta(days=4))
+        self.assertEqual((day.rooms_sold, day.revenue, day.cancellations), (1, 100, 1))
+
+    def test_refresh_from_db_resets_the_loaded_state(self):
+        booking = self.make_booking(start=0, nights=2)
+        Booking.objects.get(pk=booking.pk).confirm(room=self.room_a)
+
+        booking.refresh_from_db()
+        booking.mark_check_in()
+
+        day = DailyStats.objects.get(room_type=self.room_type, date=self.today)
+        self.assertEqual((day.rooms_sold, day.revenue, day.arrivals), (1, 100, 1))
+        incremental = self.snapshot()
+        DailyStats.objects.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+        self.assertEqual(sum(row[2] for row in incremental), 2)
+        self.assertEqual(sum(row[3] for row in incremental), 200)
+
+    @override_settings(DAILY_STATS_REBUILD_DAYS=10)
+    def test_nightly_rebuild_covers_recent_and_future_days(self):
+        self.make_booking(start=30, nights=2).confirm(room=self.room_a)
+        old = DailyStats.objects.create(room_type=self.room_type, date=self.today - timedelta(days=11), rooms_sold=5)
+        DailyStats.objects.filter(date=self.today + timedelta(days=30)).update(rooms_sold=7)
+
+        tasks.rebuild_daily_stats()
+
+        old.refresh_from_db()
+        self.assertEqual(old.rooms_sold, 5)
+        day = DailyStats.objects.get(room_type=self.room_type, date=self.today + timedelta(days=30))
+        self.assertEqual(day.rooms_sold, 1)
+        self.assertTrue(DailyStats.objects.filter(date=self.today + timedelta(days=32), departures=1).exists())
+
+    def test_unchanged_sales_skip_the_table(self):
+        booking = self.make_booking(start=0)
+        booking.confirm(room=self.room_a)
+
+        with CaptureQueriesContext(connection) as queries:
+            booking.mark_check_in()
+        self.assertFalse(any('bookings_dailystats' in query['sql'] for query in queries))
+
+    def test_report_sums_the_range(self):
+        self.make_booking(start=0, nights=2).confirm(room=self.room_a)
+        self.make_booking(start=1, nights=3).confirm(room=self.room_b)
+        self.make_booking(start=2).cancel()
+        start, end = self.today, self.today + timedelta(days=3)
+
+        client = APIClient()
+        url = reverse('bookings:daily-stats-report')
+        params = {'start': start.isoformat(), 'end': end.isoformat()}
+        self.assertIn(client.get(url, params).status_code, (401, 403))
+
+        client.force_authenticate(User.objects.create_user('manager', is_staff=True))
+        response = client.get(url, params)
+
+        self.assertEqual(response.status_code, 200)
+        totals = response.json()['totals']
+        # 2 rooms over 4 days, 5 nights sold at 100
+        self.assertEqual(totals['rooms_available'], 8)
+        self.assertEqual(totals['rooms_sold'], 5)
+        self.assertEqual(totals['occupancy'], 62.5)
+        self.assertEqual((totals['revenue'], totals['adr'], totals['revpar']), ('500.00', '100.00', '62.50'))
+        self.assertEqual((totals['arrivals'], totals['departures'], totals['cancellations']), (2, 1, 1))
+
+
+class BookingExportTests(BookingTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.suite = RoomType.objects.create(name='Suite', base_price=250, capacity=4)
+        self.confirmed = self.make_booking(start=1, nights=3, full_name='Ann')
+        self.confirmed.confirm(room=self.room_a)
+        self.pending = self.make_booking(start=20, nights=2, full_name='Ben', room_type=self.suite)
+        self.make_booking(start=5, nights=1, full_name='Cy').cancel()
+        self.staff = User.objects.create_user('accounting', is_staff=True)
+
+    def download(self, params=None):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        return client.get(reverse('bookings:booking-export'), params or {})
+
+    def csv_rows(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        return list(csv.DictReader(StringIO(content)))
+
+    def test_streams_all_bookings_with_pricing(self):
+        self.assertIn(APIClient().get(reverse('bookings:booking-export')).status_code, (401, 403))
+
+        rows = self.csv_rows(self.download())
+
+        self.assertEqual([row['Guest'] for row in rows], ['Ann', 'Ben', 'Cy'])
+        self.assertEqual(
+            {key: rows[0][key] for key in ('Room type', 'Room', 'Nights', 'Status', 'Total price')},
+            {'Room type': 'Deluxe', 'Room': '101', 'Nights': '3', 'Status': 'confirmed', 'Total price': '300.00'},
+        )
+        self.assertEqual((rows[1]['Room'], rows[1]['Total price']), ('', '500.00'))
+
+    def test_escapes_formulas_in_guest_text(self):
+        Booking.objects.filter(pk=self.confirmed.pk).update(full_name='=HYPERLINK("http://x")', phone='+1 555')
+        Booking.objects.filter(pk=self.pending.pk).update(full_name='@SUM(A1)', email='-x@example.com')
+
+        rows = self.csv_rows(self.download())
+
+        self.assertEqual((rows[0]['Guest'], rows[0]['Phone']), ('\'=HYPERLINK("http://x")', "'+1 555"))
+        self.assertEqual((rows[1]['Guest'], rows[1]['Email']), ("'@SUM(A1)", "'-x@example.com"))
+        self.assertEqual(rows[2]['Guest'], 'Cy')
+
+    def test_filters(self):
+        def guests(params):
+            return [row['Guest'] for row in self.csv_rows(self.download(params))]
+
+        self.assertEqual(guests({'status': 'pending,cancelled'}), ['Ben', 'Cy'])
+        self.assertEqual(guests({'room_type_id': self.suite.id}), ['Ben'])
+        self.assertEqual(guests({
+            'start': (self.today + timedelta(days=1)).isoformat(),
+            'end': (self.today + timedelta(days=5)).isoformat(),
+        }), ['Ann', 'Cy'])
+
+        for params in ({'status': 'lost'}, {'start': 'soon'}, {'file_format': 'pdf'}):
+            response = self.download(params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.json())
+
+    @skipIf(export.openpyxl is None, "openpyxl is not installed")
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_admin_action_exports_xlsx(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+        response = self.client.post(
+            reverse('admin:bookings_booking_changelist') + '?status__exact=pending',
+            {'action': 'export_xlsx', 'select_across': '1', 'index': '0', '_selected_action': [self.pending.id]},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        sheet = export.openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        header, *rows = sheet.iter_rows(values_only=True)
+        self.assertEqual(header[0], 'ID')
+        self.assertEqual([(row[0], row[8], row[11]) for row in rows], [(self.pending.id, 2, 500)])
+
+
+class BulkImportTests(BookingTestMixin, TestCase):
+
+    HEADER = 'full_name,email,room_type,room,check_in,check_out,guests,status\n'
+
+    def day(self, offset):
+        return (self.today + timedelta(days=offset)).isoformat()
+
+    def import_bookings(self, rows, **kwargs):
+        report = StringIO()
+        content = self.HEADER + ''.join(f'{row}\n' for row in rows)
+        result = importer.run_import('bookings', StringIO(content), 'bookings.csv', report, **kwargs)
+        return result, list(csv.DictReader(StringIO(report.getvalue())))
+
+    def test_command_imports_room_types_and_rooms(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        directory = directory.name
+        room_types = os.path.join(directory, 'room_types.jsonl')
+        rooms = os.path.join(directory, 'rooms.csv')
+        with open(room_types, 'w') as file:
+            file.write('{"name": "Family Suite", "base_price": "180.50", "capacity": 4}\n')
+            file.write('{"name": "Deluxe", "slug": "deluxe"}\n')
+            file.write('not json\n')
+        with open(rooms, 'w') as file:
+            file.write('number,room_type,is_active\n201,family-suite,yes\n202,Family Suite,no\n101,deluxe,\n203,penthouse,\n')
+
+        out = StringIO()
+        call_command('bulk_import', 'room_types', room_types, stdout=out)
+        call_command('bulk_import', 'rooms', rooms, stdout=out)
+
+        suite = RoomType.objects.get(slug='family-suite')
+        self.assertEqual((suite.base_price, suite.capacity), (Decimal('180.50'), 4))
+        self.assertEqual(
+            list(suite.rooms.order_by('number').values_list('number', 'is_active')),
+            [('201', True), ('202', False)],
+        )
+        with open(f'{room_types}.errors.csv') as file:
+            errors = [(row['line'], row['error']) for row in csv.DictReader(file)]
+        self.assertEqual(errors[0], ('2', "Room type 'deluxe' already exists"))
+        self.assertTrue(errors[1][1].startswith('Invalid JSON'))
+        with open(f'{rooms}.errors.csv') as file:
+            errors = [(row['line'], row['error']) for row in csv.DictReader(file)]
+        self.assertEqual(errors, [('4', 'Room 101 already exists'), ('5', "Room type 'penthouse' does not exist")])
+
+    def test_bookings_are_validated_in_memory(self):
+        self.make_booking(start=10, nights=3).confirm(room=self.room_a)
+
+        result, errors = self.import_bookings([
+            # Historical stays back to back in room 101
+            f'Ann,ann@example.com,deluxe,101,{self.day(-30)},{self.day(-27)},2,checked_out',
+            f'Ben,ben@example.com,deluxe,101,{self.day(-27)},{self.day(-25)},1,checked_out',
+            f'Cy,cy@example.com,deluxe,101,{self.day(-28)},{self.day(-26)},1,checked_out',
+            f'Di,di@example.com,deluxe,101,{self.day(11)},{self.day(12)},1,confirmed',
+            f'Ed,ed@example.com,Deluxe,102,{self.day(11)},{self.day(12)},1,confirmed',
+            f'Flo,flo@example.com,deluxe,,{self.day(5)},{self.day(7)},3,pending',
+            f'Gus,gus@example.com,deluxe,,{self.day(5)},{self.day(7)},1,confirmed',
+            f'Hal,not-an-email,deluxe,,{self.day(5)},{self.day(4)},1,pending',
+            f'Ivy,ivy@example.com,deluxe,,{self.day(-5)},{self.day(-3)},1,cancelled',
+        ])
+
+        self.assertEqual(result, importer.ImportResult(created=4, failed=5))
+        self.assertEqual([(row['line'], row['error']) for row in errors], [
+            ('4', 'Room 101 is already booked for these dates'),
+            ('5', 'Room 101 is already booked for these dates'),
+            ('7', "Room type 'Deluxe' has max capacity of 2"),
+            ('8', 'A confirmed booking needs a room'),
+            ('9', 'Check-out must be after check-in'),
+        ])
+        self.assertEqual(json.loads(errors[0]['record'])['full_name'], 'Cy')
+
+        ed = Booking.objects.get(full_name='Ed')
+        self.assertEqual(list(ed.room_nights.values_list('room__number', 'date')), [('102', self.today + timedelta(days=11))])
+        self.assertFalse(RoomNight.objects.filter(booking__full_name='Ann').exists())
+        self.assertEqual(Booking.objects.with_pricing().get(full_name='Ann').total_price, 300)
+
+        # The aggregates match a full rebuild
+        stats = list(DailyStats.objects.exclude(
+            rooms_sold=0, revenue=0, arrivals=0, departures=0, cancellations=0
+        ).order_by('date').values_list('date', 'rooms_sold', 'arrivals', 'departures', 'cancellations'))
+        self.assertEqual(stats[0], (self.today - timedelta(days=30), 1, 1, 0, 0))
+        DailyStats.objects.rebuild()
+        self.assertEqual(stats, list(DailyStats.objects.exclude(
+            rooms_sold=0, revenue=0, arrivals=0, departures=0, cancellations=0
+        ).order_by('date').values_list('date', 'rooms_sold', 'arrivals', 'departures', 'cancellations')))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def rows(count, offset):
+            return [
+                f'Guest,g@example.com,deluxe,{(self.room_a, self.room_b)[i % 2].number},'
+                f'{self.day(offset - 3 * i)},{self.day(offset - 3 * i + 2)},1,checked_out'
+                for i in range(count)
+            ]
+
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.import_bookings(rows(4, -1))[0].created, 4)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.import_bookings(rows(40, -200))[0].created, 40)
+
+        self.assertEqual(len(many.captured_queries), len(few.captured_queries))
+
+    def test_json_array(self):
+        records = [{'full_name': 'Jo', 'email': 'jo@example.com', 'room_type': 'deluxe',
+                    'check_in': self.day(3), 'check_out': self.day(5), 'guests': 2}]
+
+        result = importer.run_import('bookings', StringIO(json.dumps(records)), 'bookings.json')
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual(Booking.objects.get().status, 'pending')
+        with self.assertRaises(ValueError):
+            importer.run_import('bookings', StringIO('{}'), 'bookings.json')
+        with self.assertRaises(ValueError):
+            importer.run_import('bookings', StringIO(''), 'bookings.xls')
+
+    def test_unreadable_row_stops_after_committed_batches(self):
+        with self.assertRaises(importer.ImportStopped) as stopped:
+            self.import_bookings([
+                f'Ann,ann@example.com,deluxe,101,{self.day(-30)},{self.day(-27)},2,checked_out',
+                f'Ben,ben@example.com,deluxe,101,{self.day(-20)},{self.day(-18)},2,{"x" * 200_000}',
+            ], batch_size=1)
+
+        self.assertEqual(stopped.exception.result, importer.ImportResult(created=1, failed=0))
+        self.assertIn('Import stopped after 1 record(s) were imported', str(stopped.exception))
+        # finish() still ran for the committed batch
+        self.assertTrue(DailyStats.objects.filter(date=self.today - timedelta(days=30), arrivals=1).exists())
+
+    def test_rejected_batch_releases_its_stays(self):
+        bulk_create = Booking.objects.bulk_create
+        calls = []
+
+        def conflict_once(objs, **kwargs):
+            calls.append(objs)
+            if len(calls) == 1:
+                raise IntegrityError('conflict')
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Booking.objects, 'bulk_create', side_effect=conflict_once):
+            result, errors = self.import_bookings([
+                f'Ann,ann@example.com,deluxe,101,{self.day(-30)},{self.day(-27)},2,checked_out',
+                f'Ann,ann@example.com,deluxe,101,{self.day(-30)},{self.day(-27)},2,checked_out',
+            ], batch_size=1)
+
+        self.assertEqual(result, importer.ImportResult(created=1, failed=1))
+        self.assertEqual(errors[0]['error'], 'Batch rejected by the database: conflict')
+        self.assertEqual(Booking.objects.get().room, self.room_a)
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_admin_upload(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        url = reverse('admin:rooms_room_import')
+        self.assertContains(self.client.get(reverse('admin:rooms_room_changelist')), url)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        upload = SimpleUploadedFile('rooms.csv', b'number,room_type\n103,deluxe\n104,deluxe\n')
+        response = self.client.post(url, {'file': upload})
+        self.assertRedirects(response, reverse('admin:rooms_room_changelist'))
+        self.assertEqual(self.room_type.rooms.count(), 4)
+
+        upload = SimpleUploadedFile('rooms.csv', b'number,room_type\n105,deluxe\n103,deluxe\n')
+        response = self.client.post(url, {'file': upload})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="rooms.csv.errors.csv"')
+        self.assertIn('Room 103 already exists', response.content.decode())
+        self.assertEqual(self.room_type.rooms.count(), 5)
+
+        response = self.client.post(url, {'file': SimpleUploadedFile('rooms.pdf', b'%PDF')})
+        self.assertContains(response, 'Unsupported file type')
+
+        # Bad UTF-8 after the first few batches were committed
+        rows = ''.join(f'{200 + i},deluxe\n' for i in range(1000)).encode()
+        upload = SimpleUploadedFile('rooms.csv', b'number,room_type\n' + rows + b'\xff,deluxe\n')
+        with override_settings(IMPORT_BATCH_SIZE=100):
+            response = self.client.post(url, {'file': upload})
+        imported = self.room_type.rooms.count() - 5
+        self.assertGreater(imported, 0)
+        self.assertContains(response, f'Import stopped after {imported} record(s) were imported')
+
+
+class BrevoEmailBackendTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = BrevoStandInServer(reject={'bad@example.com'}).start()
+        cls.addClassCleanup(cls.server.stop)
+
+    def setUp(self):
+        self.server.payloads.clear()
+        self.server.connections = 0
+
+    def backend(self, **kwargs):
+        return BrevoEmailBackend(api_key='test', api_url=self.server.url, **kwargs)
+
+    def messages(self, count, sender='Hotel <hotel@example.com>'):
+        return [
+            EmailMessage(f'Subject {i}', f'Body {i}', sender, [f'guest{i}@example.com'])
+            for i in range(count)
+        ]
+
+    def test_batches_over_pooled_connections(self):
+        messages = self.messages(250) + self.messages(3, sender='other@example.com')
+
+        sent = self.backend(batch_size=100, max_workers=2).send_messages(messages)
+
+        self.assertEqual(sent, 253)
+        self.assertEqual(self.server.requests, 4)
+        self.assertLessEqual(self.server.connections, 2)
+        versions = sorted(len(payload['messageVersions']) for payload in self.server.payloads)
+        self.assertEqual(versions, [3, 50, 100, 100])
+        first = next(payload for payload in self.server.payloads if len(payload['messageVersions']) == 3)
+        self.assertEqual(first['sender'], {'name': 'Hotel Nyumba', 'email': 'other@example.com'})
+        self.assertEqual(
+            first['messageVersions'][1],
+            {'subject': 'Subject 1', 'textContent': 'Body 1', 'to': [{'email': 'guest1@example.com'}]}
+        )
+        self.assertTrue(all(message.brevo_message_id for message in messages))
+
+    def test_errors_are_reported_per_message(self):
+        messages = self.messages(3)
+        messages[1].to = ['bad@example.com']
+
+        with self.assertRaises(BrevoSendError) as raised:
+            self.backend().send_messages(messages)
+
+        self.assertEqual(raised.exception.failed_messages, [messages[1]])
+        self.assertEqual(raised.exception.sent, 2)
+        self.assertIn('not valid', messages[1].brevo_error)
+        self.assertIsNone(messages[0].brevo_error)
+        # The rejected batch, then each message on its own
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(self.backend(fail_silently=True).send_messages(messages), 2)
+
+    def test_html_alternative_is_sent_alone(self):
+        message = EmailMultiAlternatives('Confirmed', 'Plain', 'hotel@example.com', ['guest@example.com'])
+        message.attach_alternative('<p>Rich</p>', 'text/html')
+
+        self.assertEqual(self.backend().send_messages([message] + self.messages(2)), 3)
+
+        single = next(payload for payload in self.server.payloads if 'messageVersions' not in payload)
+        self.assertEqual((single['textContent'], single['htmlContent']), ('Plain', '<p>Rich</p>'))
+
+
+@override_settings(
+    THROTTLE_BACKEND='memory',
+    THROTTLE_BUCKETS={'availability': {'ip': (1, 2), 'global': (1, 3)}},
+)
+class ThrottlingTests(BookingTestMixin, TestCase):
+
+    def check(self, ip):
+        return self.client.post(
+            reverse('bookings:check-availability'),
+            {
+                'room_type_id': self.room_type.id,
+                'check_in': (self.today + timedelta(days=1)).isoformat(),
+                'check_out': (self.today + timedelta(days=2)).isoformat(),
+            },
+            content_type='application/json',
+            REMOTE_ADDR=ip,
+        )
+
+    def test_per_ip_then_global_bucket(self):
+        statuses = [self.check('10.0.0.1').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+        # Another client still has its own tokens, until the shared bucket runs dry
+        self.assertEqual(self.check('10.0.0.2').status_code, 200)
+        rejected = self.check('10.0.0.2')
+        self.assertEqual(rejected.status_code, 429)
+        self.assertIn('Retry-After', rejected)
+
+        stats = throttle_stats()['availability']
+        self.assertEqual(stats['allowed'], 3)
+        self.assertEqual(stats['rejected'], {'ip': 1, 'global': 1})
+
+    @override_settings(THROTTLE_BACKEND='cache', THROTTLE_SYNC_INTERVAL=0)
+    def test_cache_backend_shares_consumption(self):
+        cache.clear()
+        limiter = get_limiter('availability')
+        other = CacheLimiter('availability', (1, 2), (1, 3), sync_interval=0)
+
+        # Consumption is reported one sync late, so the third hit still passes;
+        # the fourth sees what the other process used and is rejected
+        results = [
+            limiter.hit('10.0.0.1')[0],
+            other.hit('10.0.0.1')[0],
+            limiter.hit('10.0.0.1')[0],
+        ]
+        allowed, wait = other.hit('10.0.0.1')
+
+        self.assertEqual(results, [True, True, True])
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+
+
+    def test_cache_round_trips_run_outside_the_lock(self):
+        limiter = CacheLimiter('availability', (1, 2), (1, 3), sync_interval=0)
+        held = []
+
+        def add(key, delta, timeout):
+            held.append(limiter.lock.locked())
+            return delta
+
+        with mock.patch('core.throttling._add', side_effect=add):
+            limiter.hit('10.0.0.1')
+            limiter.hit('10.0.0.1')
+
+        self.assertTrue(held)
+        self.assertNotIn(True, held)
+
+    def test_tracked_buckets_are_capped(self):
+        limiter = MemoryLimiter('availability', (0.001, 2))
+
+        with mock.patch('core.throttling.MAX_TRACKED_BUCKETS', 8):
+            for i in range(100):
+                limiter.hit(f'10.0.{i // 256}.{i % 256}')
+            # Recently used buckets are kept
+            limiter.hit('10.0.0.98')
+
+        self.assertLessEqual(len(limiter.buckets), 8)
+        self.assertEqual(list(limiter.buckets)[-2:], ['10.0.0.99', '10.0.0.98'])
+        self.assertNotIn('10.0.0.0', limiter.buckets)
+
+class CheckAvailabilityAsyncViewTests(BookingTestMixin, TestCase):
+
+    async def post(self, payload):
+        request = AsyncRequestFactory().post(
+            reverse('bookings:check-availability'), payload, content_type='application/json'
+        )
+        return await CheckAvailabilityAsyncView.as_view()(request)
+
+    async def test_matches_sync_view(self):
+        booking = await sync_to_async(self.make_booking)(start=1, nights=2)
+        await sync_to_async(booking.confirm)(room=self.room_a)
+        payload = {
+            'room_type_id': self.room_type.id,
+            'check_in': (self.today + timedelta(days=1)).isoformat(),
+            'check_out': (self.today + timedelta(days=4)).isoformat(),
+        }
+
+        response = await self.post(payload)
+        sync_response = await sync_to_async(self.client.post)(
+            reverse('bookings:check-availability'), payload, content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), sync_response.json())
+        self.assertEqual(json.loads(response.content)['available_count'], 1)
+
+    async def test_throttle_runs_off_the_event_loop(self):
+        def throttle(request, scope):
+            with self.assertRaises(RuntimeError):
+                asyncio.get_running_loop()
+            return JsonResponse({'detail': 'slow down'}, status=429)
+
+        with mock.patch('bookings.views.throttled_response', side_effect=throttle) as throttled:
+            response = await self.post({})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(throttled.call_args.args[1], 'availability')
+
+    async def test_errors(self):
+        missing = await self.post({'room_type_id': self.room_type.id})
+        unknown = await self.post({'room_type_id': 999, 'check_in': '2030-01-01', 'check_out': '2030-01-02'})
+
+        self.assertEqual(missing.status_code, 400)
+        self.assertEqual(unknown.status_code, 404)
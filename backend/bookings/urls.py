@@ -1,11 +1,18 @@
 
 
+from django.conf import settings
 from django.urls import path
 from .views import (
     # Public endpoints
     PublicBookingCreateView,
     CheckAvailabilityView,
-    
+    CheckAvailabilityAsyncView,
+    BatchCheckAvailabilityView,
+    AvailabilityCalendarView,
+    FlexibleSearchView,
+    # Staff reports
+    DailyStatsReportView,
+    BookingExportView,
 )
 
 app_name = 'bookings'
@@ -15,7 +22,16 @@ app_name = 'bookings'
 
 urlpatterns = [
     path('create/', PublicBookingCreateView.as_view(), name='booking-create'),
-    path('check-availability/', CheckAvailabilityView.as_view(), name='check-availability'),
+    path(
+        'check-availability/',
+        (CheckAvailabilityAsyncView if settings.ASYNC_VIEWS else CheckAvailabilityView).as_view(),
+        name='check-availability'
+    ),
+    path('check-availability/batch/', BatchCheckAvailabilityView.as_view(), name='check-availability-batch'),
+    path('availability-calendar/', AvailabilityCalendarView.as_view(), name='availability-calendar'),
+    path('flexible-search/', FlexibleSearchView.as_view(), name='flexible-search'),
+    path('reports/daily-stats/', DailyStatsReportView.as_view(), name='daily-stats-report'),
+    path('export/', BookingExportView.as_view(), name='booking-export'),
 ]
 
 
@@ -1,58 +1,58 @@
 
 
+from asgiref.sync import sync_to_async
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny
-from django.core.mail import send_mail
+from rest_framework.permissions import AllowAny, IsAdminUser
+from core.throttling import TokenBucketThrottle, throttled_response
 from django.conf import settings
-from .models import Booking
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.http import JsonResponse
+from . import availability, export, outbox
+from .models import Booking, DailyStats, IdempotencyKey, OutboxMessage
 from .serializers import PublicBookingSerializer
 from rooms.models import RoomType
-from datetime import datetime
-import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
 import logging
+import json
 
 logger = logging.getLogger(__name__)
 
 
-def send_email_async(subject, message, recipient_list):
-    """Send email in a background thread to avoid blocking"""
-    def send():
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=recipient_list,
-                fail_silently=False,
-            )
-            logger.info(f"Email sent successfully to {recipient_list}")
-        except Exception as e:
-            logger.error(f"Failed to send email: {e}")
-    
-    thread = threading.Thread(target=send)
-    thread.daemon = True  # Thread will close when main program exits
-    thread.start()
-
-
 class PublicBookingCreateView(generics.CreateAPIView):
     """
     Create a new booking request (public endpoint)
     """
     permission_classes = [AllowAny]
-    queryset = Booking.objects.all()
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'booking_create'
+    queryset = Booking.objects.with_pricing()
     serializer_class = PublicBookingSerializer
     
+    idempotency_scope = 'bookings:create'
+    
     def perform_create(self, serializer):
-        """Save with pending status and send notification to admin"""
-        booking = serializer.save(status='pending')
-        
-        # Send email notification to admin asynchronously
-        self._send_admin_notification(booking)
+        """Save with pending status and queue the admin notification"""
+        # The notification is written to the outbox with the booking, so it
+        # is sent only if the booking is committed
+        with transaction.atomic():
+            booking = serializer.save(status='pending')
+            hold = outbox.hold_for_digest(booking)
+            OutboxMessage.objects.enqueue(
+                'admin_new_booking', self._admin_notification_email(booking), booking=booking, hold=hold
+            )
+            if hold:
+                outbox.send_digest_if_full()
     
-    def _send_admin_notification(self, booking):
-        """Send email notification to admin about new booking (non-blocking)"""
+    def _admin_notification_email(self, booking):
+        """(subject, message, from_email, recipient_list) for the admin new-booking notification"""
         subject = f'New Booking Request from {booking.full_name}'
         
         message = f"""
@@ -79,17 +79,51 @@ Please log in to the admin panel to confirm this booking and assign a room.
 Booking ID: #{booking.id}
 """
         
-        # Send email asynchronously using threading
-        send_email_async(
-            subject=subject,
-            message=message,
-            recipient_list=[settings.ADMIN_EMAIL]
-        )
+        return subject, message, settings.DEFAULT_FROM_EMAIL, [settings.ADMIN_EMAIL]
     
     def create(self, request, *args, **kwargs):
-        """Override to provide custom response"""
+        """
+        Override to provide custom response.
+        With an Idempotency-Key header the first response is stored and
+        replayed for retries, without validating or creating anything again.
+        """
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return self._create_booking(request)
+        if len(key) > 255:
+            return Response(
+                {'error': 'Idempotency-Key must be at most 255 characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        request_hash = IdempotencyKey.hash_request(request.data)
+        stored = IdempotencyKey.objects.lookup(self.idempotency_scope, key)
+        if stored:
+            return self._replay(stored, request_hash)
+        
+        try:
+            with transaction.atomic():
+                response = self._create_booking(request)
+                IdempotencyKey.objects.create(
+                    scope=self.idempotency_scope,
+                    key=key,
+                    request_hash=request_hash,
+                    status_code=response.status_code,
+                    response_body=response.data,
+                    expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+        except IntegrityError:
+            # A concurrent retry with the same key won; our booking is rolled back
+            stored = IdempotencyKey.objects.lookup(self.idempotency_scope, key)
+            if stored is None:
+                raise
+            return self._replay(stored, request_hash)
+        return response
+    
+    def _create_booking(self, request):
         serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         self.perform_create(serializer)
         
         return Response({
@@ -97,6 +131,16 @@ Booking ID: #{booking.id}
             'message': 'Booking request submitted successfully! You will receive a confirmation email once approved.',
             'booking_id': serializer.data.get('id')
         }, status=status.HTTP_201_CREATED)
+    
+    def _replay(self, stored, request_hash):
+        if stored.request_hash != request_hash:
+            return Response(
+                {'error': 'Idempotency-Key was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        response = Response(stored.response_body, status=stored.status_code)
+        response['Idempotent-Replayed'] = 'true'
+        return response
 
 
 class CheckAvailabilityView(APIView):
@@ -107,6 +151,8 @@ class CheckAvailabilityView(APIView):
 
 
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'availability'
     
     def post(self, request):
         room_type_id = request.data.get('room_type_id')
@@ -135,8 +181,8 @@ class CheckAvailabilityView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Get available rooms for this room type
-            available_rooms = Booking.objects.get_available_rooms(
+            # Count available rooms for this room type (engine or versioned cache)
+            available_count = availability.available_count(
                 room_type, check_in_date, check_out_date
             )
             
@@ -146,8 +192,8 @@ class CheckAvailabilityView(APIView):
             
             # Return availability info
             return Response({
-                'available': available_rooms.exists(),
-                'available_count': available_rooms.count(),
+                'available': available_count > 0,
+                'available_count': available_count,
                 'room_type': room_type.name,
                 'room_type_id': room_type.id,
                 'nights': nights,
@@ -175,6 +221,401 @@ class CheckAvailabilityView(APIView):
             )
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class CheckAvailabilityAsyncView(View):
+    """
+    CheckAvailabilityView as a native async Django view, for ASGI deployments
+    (ASYNC_VIEWS = True). Same request and response format; waiting on the
+    cache and database does not hold a worker thread.
+    """
+    throttle_scope = 'availability'
+    
+    async def post(self, request):
+        # The throttle's cache calls block, so keep them off the event loop
+        throttled = await sync_to_async(throttled_response)(request, self.throttle_scope)
+        if throttled:
+            return throttled
+        
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            data = request.POST
+        room_type_id = data.get('room_type_id')
+        check_in = data.get('check_in')
+        check_out = data.get('check_out')
+        
+        if not all([room_type_id, check_in, check_out]):
+            return JsonResponse(
+                {'error': 'room_type_id, check_in, and check_out are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            room_type = await RoomType.objects.aget(id=room_type_id)
+            
+            check_in_date = datetime.strptime(check_in, '%Y-%m-%d').date()
+            check_out_date = datetime.strptime(check_out, '%Y-%m-%d').date()
+            
+            if check_out_date <= check_in_date:
+                return JsonResponse(
+                    {'error': 'Check-out date must be after check-in date'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            available_count = await availability.aavailable_count(
+                room_type, check_in_date, check_out_date
+            )
+            
+            nights = (check_out_date - check_in_date).days
+            total_price = room_type.base_price * nights
+            
+            return JsonResponse({
+                'available': available_count > 0,
+                'available_count': available_count,
+                'room_type': room_type.name,
+                'room_type_id': room_type.id,
+                'nights': nights,
+                'total_price': str(total_price),
+                'price_per_night': str(room_type.base_price),
+                'check_in': check_in,
+                'check_out': check_out
+            })
+            
+        except RoomType.DoesNotExist:
+            return JsonResponse(
+                {'error': 'Room type not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except ValueError as e:
+            return JsonResponse(
+                {'error': f'Invalid date format. Use YYYY-MM-DD. Error: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return JsonResponse(
+                {'error': f'An error occurred: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class BatchCheckAvailabilityView(APIView):
+    """
+    Check availability for many date ranges in one request.
+    Body: {"queries": [{"room_type_id": 1, "check_in": "YYYY-MM-DD", "check_out": "YYYY-MM-DD"}, ...]}
+    Results come back in the same order; invalid entries get an "error" instead.
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'availability'
+    
+    def post(self, request):
+        queries = request.data.get('queries')
+        
+        if not isinstance(queries, list) or not queries:
+            return Response(
+                {'error': 'queries must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(queries) > availability.BATCH_MAX_QUERIES:
+            return Response(
+                {'error': f'At most {availability.BATCH_MAX_QUERIES} queries per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Parse and validate every entry before touching the database
+        parsed = []
+        for query in queries:
+            try:
+                room_type_id = int(query['room_type_id'])
+                check_in_date = datetime.strptime(query['check_in'], '%Y-%m-%d').date()
+                check_out_date = datetime.strptime(query['check_out'], '%Y-%m-%d').date()
+            except (KeyError, TypeError, ValueError):
+                parsed.append({'error': 'room_type_id, check_in, and check_out (YYYY-MM-DD) are required'})
+                continue
+            if check_out_date <= check_in_date:
+                parsed.append({'error': 'Check-out date must be after check-in date'})
+                continue
+            parsed.append((room_type_id, check_in_date, check_out_date))
+        
+        valid = [entry for entry in parsed if isinstance(entry, tuple)]
+        room_types = RoomType.objects.in_bulk({room_type_id for room_type_id, _, _ in valid})
+        
+        lookups = [entry for entry in valid if entry[0] in room_types]
+        counts = dict(zip(lookups, availability.batch_available_counts(lookups)))
+        
+        results = []
+        for query, entry in zip(queries, parsed):
+            if not isinstance(entry, tuple):
+                results.append(entry)
+                continue
+            room_type_id, check_in_date, check_out_date = entry
+            room_type = room_types.get(room_type_id)
+            if room_type is None:
+                results.append({'error': 'Room type not found', 'room_type_id': room_type_id})
+                continue
+            
+            # Calculate pricing
+            nights = (check_out_date - check_in_date).days
+            total_price = room_type.base_price * nights
+            available_count = counts[entry]
+            
+            results.append({
+                'available': available_count > 0,
+                'available_count': available_count,
+                'room_type': room_type.name,
+                'room_type_id': room_type.id,
+                'nights': nights,
+                'total_price': str(total_price),
+                'price_per_night': str(room_type.base_price),
+                'check_in': query['check_in'],
+                'check_out': query['check_out']
+            })
+        
+        return Response({'results': results})
+
+
+class FlexibleSearchView(APIView):
+    """
+    Find every check-in date within a range that fits a stay of N nights.
+    Query params: nights, start, end (YYYY-MM-DD; check-out must not be
+    after end), room_type_id (optional, all room types by default).
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'availability'
+    
+    def get(self, request):
+        nights = request.query_params.get('nights')
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        room_type_id = request.query_params.get('room_type_id')
+        
+        if not all([nights, start, end]):
+            return Response(
+                {'error': 'nights, start, and end are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            start_date = datetime.strptime(start, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end, '%Y-%m-%d').date()
+        except ValueError as e:
+            return Response(
+                {'error': f'Invalid date format. Use YYYY-MM-DD. Error: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            nights = int(nights)
+            room_type_id = int(room_type_id) if room_type_id else None
+        except ValueError:
+            return Response(
+                {'error': 'nights and room_type_id must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if nights < 1 or end_date <= start_date:
+            return Response(
+                {'error': 'nights must be positive and end must be after start'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if (end_date - start_date).days > availability.FLEXIBLE_SEARCH_MAX_DAYS:
+            return Response(
+                {'error': f'The search range can span at most {availability.FLEXIBLE_SEARCH_MAX_DAYS} days'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if room_type_id is not None and not RoomType.objects.filter(id=room_type_id).exists():
+            return Response(
+                {'error': 'Room type not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return Response({
+            'nights': nights,
+            'start': start,
+            'end': end,
+            'results': availability.flexible_search(nights, start_date, end_date, room_type_id),
+        })
+
+
+class AvailabilityCalendarView(APIView):
+    """
+    Available room counts per day for each room type over a date window.
+    Query params: start (YYYY-MM-DD, default today), days (default 30, max 365),
+    room_type_id (optional).
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'availability'
+    
+    def get(self, request):
+        start = request.query_params.get('start')
+        days = request.query_params.get('days', 30)
+        room_type_id = request.query_params.get('room_type_id')
+        
+        try:
+            start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else timezone.now().date()
+        except ValueError as e:
+            return Response(
+                {'error': f'Invalid date format. Use YYYY-MM-DD. Error: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            days = int(days)
+            room_type_id = int(room_type_id) if room_type_id else None
+        except ValueError:
+            return Response(
+                {'error': 'days and room_type_id must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not 1 <= days <= availability.CALENDAR_MAX_DAYS:
+            return Response(
+                {'error': f'days must be between 1 and {availability.CALENDAR_MAX_DAYS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if room_type_id is not None and not RoomType.objects.filter(id=room_type_id).exists():
+            return Response(
+                {'error': 'Room type not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        data = availability.cached_availability_calendar(start_date, days, room_type_id)
+        response = Response(data)
+        patch_cache_control(response, public=True, max_age=60)
+        return response
+
+
+class DailyStatsReportView(APIView):
+    """
+    Occupancy and revenue report over a date range, summed from DailyStats
+    (staff only). Query params: start, end (YYYY-MM-DD, both included),
+    room_type_id (optional). Occupancy, ADR and RevPAR are computed from
+    the sums against the room type's current active rooms.
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        room_type_id = request.query_params.get('room_type_id')
+        
+        if not all([start, end]):
+            return Response(
+                {'error': 'start and end are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            start_date = datetime.strptime(start, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end, '%Y-%m-%d').date()
+        except ValueError as e:
+            return Response(
+                {'error': f'Invalid date format. Use YYYY-MM-DD. Error: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if end_date < start_date:
+            return Response(
+                {'error': 'end must not be before start'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            room_type_id = int(room_type_id) if room_type_id else None
+        except ValueError:
+            return Response(
+                {'error': 'room_type_id must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        room_types = RoomType.objects.with_room_counts().order_by('name')
+        if room_type_id is not None:
+            room_types = room_types.filter(id=room_type_id)
+            if not room_types:
+                return Response(
+                    {'error': 'Room type not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
+        days = (end_date - start_date).days + 1
+        sums = DailyStats.objects.totals(
+            start_date, end_date + timedelta(days=1), [room_type.id for room_type in room_types]
+        )
+        
+        results = []
+        totals = dict.fromkeys(DailyStats.objects.COUNTERS, 0)
+        total_available = 0
+        for room_type in room_types:
+            counters = sums.get(room_type.id) or dict.fromkeys(DailyStats.objects.COUNTERS, 0)
+            available = room_type.active_rooms_count * days
+            for name, amount in counters.items():
+                totals[name] += amount
+            total_available += available
+            results.append({
+                'room_type_id': room_type.id,
+                'room_type': room_type.name,
+                **_report_metrics(counters, available),
+            })
+        
+        return Response({
+            'start': start,
+            'end': end,
+            'days': days,
+            'totals': _report_metrics(totals, total_available),
+            'room_types': results,
+        })
+
+
+def _report_metrics(counters, rooms_available):
+    """Report figures for summed DailyStats counters and the room nights on offer"""
+    revenue = Decimal(counters['revenue'] or 0)
+    rooms_sold = counters['rooms_sold'] or 0
+    cents = Decimal('0.01')
+    return {
+        'rooms_available': rooms_available,
+        'rooms_sold': rooms_sold,
+        'occupancy': round(rooms_sold * 100 / rooms_available, 1) if rooms_available else None,
+        'revenue': str(revenue.quantize(cents)),
+        # Average daily rate: revenue per room sold
+        'adr': str((revenue / rooms_sold).quantize(cents)) if rooms_sold else None,
+        # Revenue per available room night
+        'revpar': str((revenue / rooms_available).quantize(cents)) if rooms_available else None,
+        'arrivals': counters['arrivals'] or 0,
+        'departures': counters['departures'] or 0,
+        'cancellations': counters['cancellations'] or 0,
+    }
+
+
+class BookingExportView(APIView):
+    """
+    Download bookings as CSV or XLSX (staff only), streamed from the database.
+    Query params: file_format (csv or xlsx, default csv), status (comma
+    separated), room_type_id, start and end (check-in dates, YYYY-MM-DD).
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        # Not `format`: DRF reserves that one for content negotiation
+        file_format = request.query_params.get('file_format', 'csv')
+        try:
+            queryset = export.filter_bookings(Booking.objects.all(), request.query_params)
+            return export.export_response(queryset, file_format)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+
 
 
 
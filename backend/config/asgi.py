@@ -5,6 +5,25 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serving over ASGI
+-----------------
+The WSGI entry point (config/wsgi.py, run by gunicorn) stays the default.
+To serve over ASGI with uvicorn instead, with the public read endpoints
+(check-availability, room-types, hotel info) as native async views:
+
+    ASYNC_VIEWS=True CONN_MAX_AGE=0 \
+        uvicorn config.asgi:application --host 0.0.0.0 --port $PORT --workers 2
+
+or, to keep gunicorn's process management, with the uvicorn-worker package:
+
+    ASYNC_VIEWS=True CONN_MAX_AGE=0 \
+        gunicorn config.asgi:application -k uvicorn_worker.UvicornWorker --workers 2
+
+CONN_MAX_AGE=0 because persistent connections are not reused across async
+requests; put PgBouncer (or Neon's pooled URL) in front of PostgreSQL
+instead. The remaining DRF views still work under ASGI; Django runs them in
+a thread pool. Compare both modes with `manage.py benchmark_asgi`.
 """
 
 import os
@@ -9,6 +9,7 @@ from pathlib import Path
 from decouple import config, Csv
 import dj_database_url
 from datetime import timedelta
+from celery.schedules import crontab
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
@@ -93,7 +94,8 @@ if config('DATABASE_URL', default=''):
     DATABASES = {
         'default': dj_database_url.parse(
             config('DATABASE_URL'),
-            conn_max_age=600,
+            # Set CONN_MAX_AGE=0 when serving over ASGI (see config/asgi.py)
+            conn_max_age=config('CONN_MAX_AGE', default=600, cast=int),
             conn_health_checks=True,
             ssl_require=True
         )
@@ -208,13 +210,30 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
 ADMIN_EMAIL = config('ADMIN_EMAIL', default=EMAIL_HOST_USER)
-# BREVO_API_KEY = config("BREVO_API_KEY", default="")
-# DEFAULT_FROM_NAME = 'Hotel Numba'
-
+DEFAULT_FROM_NAME = config('DEFAULT_FROM_NAME', default='Hotel Nyumba')
+
+# Brevo HTTP API (bookings/emails/bravo_email.py), used instead of SMTP when a
+# key is set: messages per batch request, concurrent requests per send
+BREVO_API_KEY = config('BREVO_API_KEY', default='')
+BREVO_API_URL = config('BREVO_API_URL', default='https://api.brevo.com/v3/smtp/email')
+BREVO_BATCH_SIZE = config('BREVO_BATCH_SIZE', default=100, cast=int)
+BREVO_MAX_WORKERS = config('BREVO_MAX_WORKERS', default=4, cast=int)
+BREVO_TIMEOUT = 10
+
+if BREVO_API_KEY:
+    EMAIL_BACKEND = 'bookings.emails.bravo_email.BrevoEmailBackend'
 # Fallback to console backend if email not configured
-if not EMAIL_HOST_USER:
+elif not EMAIL_HOST_USER:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Pooled email delivery for the outbox relay (core/mail.py): worker threads
+# per process, each reusing one SMTP connection, fed by a bounded queue
+EMAIL_DISPATCH_WORKERS = config('EMAIL_DISPATCH_WORKERS', default=2, cast=int)
+EMAIL_DISPATCH_QUEUE_SIZE = config('EMAIL_DISPATCH_QUEUE_SIZE', default=1000, cast=int)
+EMAIL_DISPATCH_IDLE_TIMEOUT = 30
+EMAIL_DISPATCH_PUT_TIMEOUT = 5
+EMAIL_DISPATCH_SHUTDOWN_TIMEOUT = 10
+
 CELERY_BROKER_URL = config('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
@@ -233,6 +252,114 @@ CELERY_RESULT_BACKEND_MAX_RETRIES = 10
 CELERY_TASK_ACKS_LATE = True
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
+# Seconds between outbox relay runs (bookings/outbox.py)
+OUTBOX_RELAY_INTERVAL = config('OUTBOX_RELAY_INTERVAL', default=10, cast=int)
+
+# Admin new-booking notifications: with the digest on, they are collected and
+# sent as one email every ADMIN_DIGEST_WINDOW seconds, or as soon as
+# ADMIN_DIGEST_THRESHOLD of them are waiting (0: no threshold). Stays checking
+# in within ADMIN_DIGEST_URGENT_DAYS are sent on their own straight away
+ADMIN_NOTIFICATION_DIGEST = config('ADMIN_NOTIFICATION_DIGEST', default=False, cast=bool)
+ADMIN_DIGEST_WINDOW = config('ADMIN_DIGEST_WINDOW', default=15 * 60, cast=int)
+ADMIN_DIGEST_URGENT_DAYS = config('ADMIN_DIGEST_URGENT_DAYS', default=1, cast=int)
+ADMIN_DIGEST_THRESHOLD = config('ADMIN_DIGEST_THRESHOLD', default=50, cast=int)
+
+# Days back from today that the nightly DailyStats rebuild recomputes
+DAILY_STATS_REBUILD_DAYS = config('DAILY_STATS_REBUILD_DAYS', default=30, cast=int)
+
+# Periodic tasks (run with `celery -A config beat`)
+CELERY_BEAT_SCHEDULE = {
+    'purge-expired-idempotency-keys': {
+        'task': 'bookings.tasks.purge_expired_idempotency_keys',
+        'schedule': 60 * 60,
+    },
+    'relay-outbox': {
+        'task': 'bookings.tasks.relay_outbox',
+        'schedule': OUTBOX_RELAY_INTERVAL,
+    },
+    'send-admin-digest': {
+        'task': 'bookings.tasks.send_admin_digest',
+        'schedule': ADMIN_DIGEST_WINDOW,
+    },
+    'rebuild-daily-stats': {
+        'task': 'bookings.tasks.rebuild_daily_stats',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'purge-sent-outbox-messages': {
+        'task': 'bookings.tasks.purge_sent_outbox_messages',
+        'schedule': 24 * 60 * 60,
+    },
+}
+
+
+
+
+# Cache
+
+# Redis in production (shared by every worker), local memory otherwise
+CACHE_URL = config('CACHE_URL', default='')
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+
+
+# Availability
+
+# 'db' answers availability from the RoomNight ledger; 'numpy' serves search
+# traffic from an in-process occupancy matrix (requires numpy)
+AVAILABILITY_ENGINE = config('AVAILABILITY_ENGINE', default='db')
+AVAILABILITY_ENGINE_DAYS = config('AVAILABILITY_ENGINE_DAYS', default=400, cast=int)
+
+# Rows fetched per round trip by booking exports (bookings/export.py)
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Records validated and inserted per transaction by bulk imports (bookings/importer.py)
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=5000, cast=int)
+
+# How long the room type admin's inventory overview is cached (seconds)
+ROOM_INVENTORY_CACHE_TTL = config('ROOM_INVENTORY_CACHE_TTL', default=60, cast=int)
+
+# Token-bucket throttling for public endpoints (core/throttling.py).
+# Per scope: (tokens per second, bucket size) per client IP and for all clients together.
+# 'cache' shares buckets between processes with batched cache updates; 'memory' keeps them per process.
+THROTTLE_BACKEND = config('THROTTLE_BACKEND', default='cache')
+THROTTLE_SYNC_INTERVAL = config('THROTTLE_SYNC_INTERVAL', default=1.0, cast=float)
+THROTTLE_BUCKETS = {
+    'availability': {'ip': (2, 30), 'global': (100, 300)},
+    'booking_create': {'ip': (0.1, 5), 'global': (5, 50)},
+}
+if not config('THROTTLE_ENABLED', default=True, cast=bool):
+    THROTTLE_BUCKETS = {}
+
+# Serve the hot public read endpoints (check-availability, room-types, hotel info)
+# with native async views. Only worth it under ASGI (uvicorn, see config/asgi.py);
+# under WSGI every async view would spin up its own event loop.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+# How long a stored response for an Idempotency-Key header is replayed (seconds)
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60, cast=int)
+
+# Outbox relay (bookings/outbox.py): messages per batch, attempts before a
+# message is marked failed, first retry delay in seconds (doubling after
+# each attempt), and how long sent messages are kept (seconds)
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=100, cast=int)
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 60
+OUTBOX_RETENTION = config('OUTBOX_RETENTION', default=7 * 24 * 60 * 60, cast=int)
+
 
 
 
@@ -416,7 +543,7 @@ if DEBUG:
         ALLOWED_HOSTS = ['*']
     
     # Use console email backend in development
-    if not config('EMAIL_HOST_USER', default=''):
+    if not config('EMAIL_HOST_USER', default='') and not BREVO_API_KEY:
         EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 
@@ -1,7 +1,81 @@
+import io
 
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from .models import HotelInfo
 
 @admin.register(HotelInfo)
 class HotelInfoAdmin(admin.ModelAdmin):
     list_display = ('name','address','email')
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV, JSON (a list of records) or JSON Lines")
+
+
+class ImportAdminMixin:
+    """
+    Adds an Import page to the changelist that loads a file through
+    bookings.importer; set import_kind. When rows fail, the error report
+    is sent back as a CSV download.
+    """
+    import_kind = None
+    change_list_template = 'admin/import_change_list.html'
+    
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='%s_%s_import' % info),
+        ] + super().get_urls()
+    
+    def import_view(self, request):
+        # Import here to avoid circular import
+        from bookings import importer
+        
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        
+        form = ImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            report = io.StringIO()
+            try:
+                result = importer.run_import(
+                    self.import_kind,
+                    io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''),
+                    upload.name,
+                    report
+                )
+            except ValueError as e:
+                # Includes importer.ImportStopped (undecodable or malformed file part
+                # way), whose message says how many records were already imported
+                form.add_error('file', str(e))
+            else:
+                name = self.opts.verbose_name_plural
+                if not result.failed:
+                    self.message_user(request, f"Imported {result.created} {name}", messages.SUCCESS)
+                    return redirect(f'admin:{self.opts.app_label}_{self.opts.model_name}_changelist')
+                
+                # Shown on the next admin page; the report downloads now
+                self.message_user(
+                    request,
+                    f"Imported {result.created} {name}, skipped {result.failed} invalid row(s) "
+                    f"listed in the downloaded error report",
+                    messages.WARNING
+                )
+                response = HttpResponse(report.getvalue(), content_type='text/csv')
+                response['Content-Disposition'] = f'attachment; filename="{upload.name}.errors.csv"'
+                return response
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': f"Import {self.opts.verbose_name_plural}",
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/import_form.html', context)
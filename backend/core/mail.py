@@ -0,0 +1,206 @@
+"""
+Pooled email delivery.
+
+The outbox relay hands each batch of messages to a single process-wide
+dispatcher instead of opening a connection per email. The dispatcher owns a
+bounded queue and a fixed pool of worker threads; each worker keeps one
+connection from get_connection() open and reuses it for message after
+message, closing it after EMAIL_DISPATCH_IDLE_TIMEOUT seconds without work.
+
+Every message goes out in its own send_messages() call, so a backend that
+raises for one message (SMTPRecipientsRefused for a bad address) fails only
+that message: deliver() reports an error per message and the others count
+as sent. After an error the worker opens a fresh connection, since the old
+one may be unusable.
+
+Backpressure: when the queue is full, deliver() waits up to
+EMAIL_DISPATCH_PUT_TIMEOUT seconds for room and then sends the message in
+the calling thread. On interpreter exit the queue is drained (for up to
+EMAIL_DISPATCH_SHUTDOWN_TIMEOUT seconds) before workers stop.
+
+Settings: EMAIL_DISPATCH_WORKERS, EMAIL_DISPATCH_QUEUE_SIZE and the timeouts
+above.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def send_one(message, connection):
+    """Send one EmailMessage over an open connection; returns an error string, or None once sent"""
+    try:
+        sent = connection.send_messages([message])
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+    return None if sent else "Mail backend did not accept the message"
+
+
+class EmailDispatcher:
+    """Bounded queue of EmailMessages delivered by a fixed pool of workers"""
+
+    def __init__(self, workers=2, queue_size=1000, idle_timeout=30.0, put_timeout=5.0,
+                 connection_factory=get_connection):
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self.put_timeout = put_timeout
+        self.connection_factory = connection_factory
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.threads = []
+        self.pid = None
+        self.sent = 0
+        self.failed = 0
+        self.sent_inline = 0
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so start (again) in each worker process
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self.threads = [
+                threading.Thread(target=self._work, name=f'email-dispatch-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self.threads:
+                thread.start()
+            self.pid = os.getpid()
+
+    def deliver(self, messages):
+        """
+        Send EmailMessages through the pool and wait until each is handled;
+        returns {id(message): error} for the ones that failed.
+        """
+        self._ensure_started()
+        futures = []
+        for message in messages:
+            future = Future()
+            try:
+                self.queue.put((message, future), timeout=self.put_timeout)
+            except queue.Full:
+                logger.warning(f"Email queue full; sending to {message.to} in the calling thread")
+                connection = self._open()
+                future.set_result(self._send(message, connection))
+                self._close(connection)
+                with self.lock:
+                    self.sent_inline += 1
+            futures.append((message, future))
+        errors = {id(message): future.result() for message, future in futures}
+        return {key: error for key, error in errors.items() if error is not None}
+
+    def _work(self):
+        connection = None
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # SMTP servers drop idle sessions; close ours first
+                self._close(connection)
+                connection = None
+                continue
+
+            if item is _STOP:
+                self.queue.task_done()
+                self._close(connection)
+                return
+
+            message, future = item
+            try:
+                if connection is None:
+                    connection = self._open()
+                error = self._send(message, connection)
+            except Exception as e:
+                # Opening the connection failed
+                error = str(e) or e.__class__.__name__
+            if error is not None:
+                self._close(connection)
+                connection = None
+            future.set_result(error)
+            self.queue.task_done()
+
+    def _open(self):
+        connection = self.connection_factory()
+        # Opened explicitly, send_messages() leaves it open for the next message
+        connection.open()
+        return connection
+
+    def _send(self, message, connection):
+        error = send_one(message, connection)
+        with self.lock:
+            if error is None:
+                self.sent += 1
+            else:
+                self.failed += 1
+        return error
+
+    def _close(self, connection):
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def shutdown(self, timeout=None):
+        """Deliver what is queued, then stop the workers"""
+        if self.pid != os.getpid():
+            return
+        for _ in self.threads:
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                break
+        for thread in self.threads:
+            thread.join(timeout)
+        alive = sum(thread.is_alive() for thread in self.threads)
+        if alive or not self.queue.empty():
+            logger.warning(f"Email dispatcher stopped with {self.queue.qsize()} message(s) undelivered")
+        self.pid = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queued': self.queue.qsize(),
+                'sent': self.sent,
+                'failed': self.failed,
+                'sent_inline': self.sent_inline,
+            }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """The process-wide EmailDispatcher, configured from settings"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = EmailDispatcher(
+                    workers=getattr(settings, 'EMAIL_DISPATCH_WORKERS', 2),
+                    queue_size=getattr(settings, 'EMAIL_DISPATCH_QUEUE_SIZE', 1000),
+                    idle_timeout=getattr(settings, 'EMAIL_DISPATCH_IDLE_TIMEOUT', 30.0),
+                    put_timeout=getattr(settings, 'EMAIL_DISPATCH_PUT_TIMEOUT', 5.0),
+                )
+                atexit.register(
+                    _dispatcher.shutdown, getattr(settings, 'EMAIL_DISPATCH_SHUTDOWN_TIMEOUT', 10.0)
+                )
+    return _dispatcher
+
+
+def deliver(messages):
+    """Send EmailMessages through the process-wide dispatcher; returns {id(message): error}"""
+    return get_dispatcher().deliver(messages)
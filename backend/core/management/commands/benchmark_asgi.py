@@ -0,0 +1,144 @@
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rooms.models import RoomType
+
+SERVERS = {
+    # Sync DRF views, one request at a time per worker
+    'wsgi': lambda port, workers: [
+        sys.executable, '-m', 'gunicorn', 'config.wsgi:application',
+        '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning',
+    ],
+    # Native async views on an event loop per worker
+    'asgi': lambda port, workers: [
+        sys.executable, '-m', 'uvicorn', 'config.asgi:application',
+        '--port', str(port), '--workers', str(workers), '--log-level', 'warning',
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test check-availability, room-types and hotel info under gunicorn (WSGI, sync views) "
+        "and uvicorn (ASGI, async views) against the configured database; reports requests/s and "
+        "p99 latency per mode. Throttling is disabled in the servers started for the run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per mode")
+        parser.add_argument('--concurrency', type=int, default=32, help="Concurrent client connections")
+        parser.add_argument('--workers', type=int, default=2, help="Server worker processes")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--modes', nargs='+', choices=sorted(SERVERS), default=['wsgi', 'asgi'])
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        room_type_ids = list(RoomType.objects.values_list('id', flat=True))
+        if not room_type_ids:
+            raise CommandError("No room types in the database; create some before benchmarking")
+
+        rng = random.Random(options['seed'])
+        today = timezone.now().date()
+        requests = []
+        for i in range(options['requests']):
+            kind = i % 4
+            if kind == 2:
+                requests.append(('GET', '/api/v1/rooms/room-types/', None))
+            elif kind == 3:
+                requests.append(('GET', '/api/v1/hotel/', None))
+            else:
+                check_in = today + timedelta(days=rng.randint(0, 120))
+                requests.append(('POST', '/api/v1/bookings/check-availability/', json.dumps({
+                    'room_type_id': rng.choice(room_type_ids),
+                    'check_in': check_in.isoformat(),
+                    'check_out': (check_in + timedelta(days=rng.randint(1, 7))).isoformat(),
+                })))
+
+        for mode in options['modes']:
+            server = self.start_server(mode, options['port'], options['workers'])
+            try:
+                self.run(mode, options['port'], requests, options['concurrency'])
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+
+    def start_server(self, mode, port, workers):
+        env = dict(
+            os.environ,
+            ASYNC_VIEWS=str(mode == 'asgi'),
+            CONN_MAX_AGE='0' if mode == 'asgi' else os.environ.get('CONN_MAX_AGE', '600'),
+            THROTTLE_ENABLED='False',
+            ALLOWED_HOSTS=','.join(filter(None, settings.ALLOWED_HOSTS + ['127.0.0.1'])),
+        )
+        try:
+            server = subprocess.Popen(SERVERS[mode](port, workers), cwd=settings.BASE_DIR, env=env)
+        except OSError as e:
+            raise CommandError(f"Could not start the {mode} server: {e}")
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"The {mode} server exited (is it installed?)")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"The {mode} server did not start listening on port {port}")
+
+    def run(self, mode, port, requests, concurrency):
+        queue = list(reversed(requests))
+        queue_lock = threading.Lock()
+        latencies = []
+        errors = []
+
+        def client():
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            while True:
+                with queue_lock:
+                    if not queue:
+                        break
+                    method, path, body = queue.pop()
+                started = time.perf_counter()
+                try:
+                    connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        errors.append(response.status)
+                except (OSError, http.client.HTTPException) as e:
+                    errors.append(str(e))
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                latencies.append((time.perf_counter() - started) * 1000)
+            connection.close()
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.stdout.write(
+            f"{mode}: {len(latencies) / elapsed:.0f} req/s, "
+            f"p50 {statistics.median(latencies):.1f} ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms, "
+            f"{len(errors)} errors"
+        )
@@ -0,0 +1,161 @@
+import socketserver
+import threading
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+
+from core.mail import EmailDispatcher
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP server that accepts and discards mail, counting
+    connections and messages. connect_latency and message_latency (seconds)
+    stand in for the TLS handshake and per-message round trips of a real relay.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, connect_latency=0.0, message_latency=0.0):
+        super().__init__(address, StandInSMTPHandler)
+        self.connect_latency = connect_latency
+        self.message_latency = message_latency
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+        self.active = 0
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+            server.active += 1
+        try:
+            self.converse(server)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def converse(self, server):
+        time.sleep(server.connect_latency)
+        self.reply('220 localhost stand-in SMTP')
+        for raw in self.rfile:
+            command = raw.decode(errors='replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250 localhost')
+            elif command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                for line in self.rfile:
+                    if line in (b'.\r\n', b'.\n'):
+                        break
+                time.sleep(server.message_latency)
+                with server.lock:
+                    server.messages += 1
+                self.reply('250 OK')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply('250 OK')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare thread-and-connection-per-email sending with the pooled EmailDispatcher "
+        "against a local stand-in SMTP server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=2, help="Dispatcher worker threads")
+        parser.add_argument('--connect-latency', type=float, default=50, help="Milliseconds per new connection")
+        parser.add_argument('--message-latency', type=float, default=2, help="Milliseconds per message")
+        parser.add_argument('--port', type=int, default=8025)
+
+    def handle(self, *args, **options):
+        server = StandInSMTPServer(
+            ('127.0.0.1', options['port']),
+            connect_latency=options['connect_latency'] / 1000,
+            message_latency=options['message_latency'] / 1000,
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def connection():
+            return get_connection(
+                'django.core.mail.backends.smtp.EmailBackend',
+                host='127.0.0.1', port=options['port'], username='', password='',
+                use_tls=False, use_ssl=False, timeout=30,
+            )
+
+        messages = [
+            EmailMessage(f'Benchmark {i}', 'Body', 'hotel@example.com', [f'guest{i}@example.com'])
+            for i in range(options['emails'])
+        ]
+        try:
+            for name, run in (('thread per email', self.thread_per_email), ('dispatcher', self.dispatcher)):
+                server.connections = server.messages = 0
+                started = time.perf_counter()
+                peak_threads, failed = run(messages, connection, server, options['workers'])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{name:>16}: {server.messages} emails in {elapsed:.2f}s "
+                    f"({server.messages / elapsed:.0f}/s), {failed} failed, "
+                    f"{server.connections} connections, peak {peak_threads} sending threads"
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def sending_threads(self, server):
+        # Everything but the main thread, the server loop and its connection handlers
+        return threading.active_count() - 2 - server.active
+
+    def thread_per_email(self, messages, connection, server, workers):
+        """What send_email_async did: a new thread and SMTP connection per message"""
+        failed = []
+
+        def send(message):
+            try:
+                with connection() as conn:
+                    conn.send_messages([message])
+            except Exception as e:
+                failed.append(e)
+
+        peak = 0
+        threads = []
+        for message in messages:
+            thread = threading.Thread(target=send, args=(message,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            peak = max(peak, self.sending_threads(server))
+        for thread in threads:
+            thread.join()
+        return peak, len(failed)
+
+    def dispatcher(self, messages, connection, server, workers):
+        dispatcher = EmailDispatcher(workers=workers, connection_factory=connection)
+        peak = 0
+        done = threading.Event()
+
+        def sample():
+            nonlocal peak
+            while not done.wait(0.005):
+                # Not counting the sampler itself
+                peak = max(peak, self.sending_threads(server) - 1)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        errors = dispatcher.deliver(messages)
+        done.set()
+        sampler.join()
+        dispatcher.shutdown(timeout=10)
+        return peak, len(errors)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.throttling import throttle_stats
+
+
+class Command(BaseCommand):
+    help = "Show rejected request counts per throttle scope, as reported to the cache by all processes"
+
+    def handle(self, *args, **options):
+        for scope, stats in throttle_stats().items():
+            rejected = stats['rejected_all_processes']
+            self.stdout.write(f"{scope}: {rejected['ip']} rejected per IP, {rejected['global']} rejected globally")
@@ -1,3 +1,135 @@
-from django.test import TestCase
+import json
+import smtplib
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from . import paginator
+from .mail import EmailDispatcher
+from .models import HotelInfo
+from .views import HotelInfoDetailAsync
+
+
+class HotelInfoDetailAsyncTests(TestCase):
+
+    async def get(self):
+        request = AsyncRequestFactory().get(reverse('hotel-info'))
+        return await HotelInfoDetailAsync.as_view()(request)
+
+    async def test_not_found(self):
+        response = await self.get()
+        self.assertEqual(response.status_code, 404)
+
+    async def test_matches_sync_view(self):
+        await HotelInfo.objects.acreate(
+            name='Hotel Nyumba', description='By the lake', address='Kampala', email='info@example.com'
+        )
+
+        response = await self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), (await self.async_client.get(reverse('hotel-info'))).json())
+
+
+class EstimatedCountPaginatorTests(TestCase):
+
+    def setUp(self):
+        HotelInfo.objects.bulk_create(
+            [HotelInfo(name=f'Hotel {i}', address='Kampala', email='info@example.com') for i in range(3)]
+        )
+        self.queryset = HotelInfo.objects.order_by('id')
+
+    def test_small_results_are_counted_exactly(self):
+        with mock.patch.object(paginator, 'estimated_count', return_value=5):
+            self.assertEqual(paginator.EstimatedCountPaginator(self.queryset, 2).count, 3)
+
+    def test_large_results_use_the_estimate(self):
+        with mock.patch.object(paginator, 'estimated_count', return_value=120000):
+            pages = paginator.EstimatedCountPaginator(self.queryset, 100)
+            with self.assertNumQueries(0):
+                self.assertEqual(pages.num_pages, 1200)
+
+    def test_no_estimate_outside_postgresql(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.EstimatedCountPaginator(self.queryset, 2).count, 3)
+
+
+class RefusingBackend(LocmemBackend):
+    """Locmem backend that refuses bad@example.com, as SMTP does with SMTPRecipientsRefused"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'bad@example.com' in message.to:
+                raise smtplib.SMTPRecipientsRefused({'bad@example.com': (550, b'No such user')})
+        return super().send_messages(messages)
+
+
+class EmailDispatcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.connections = 0
+
+    def connection(self):
+        self.connections += 1
+        return RefusingBackend()
+
+    def messages(self, *recipients):
+        return [EmailMessage(f'Subject {to}', 'Body', 'hotel@example.com', [to]) for to in recipients]
+
+    def dispatcher(self, **kwargs):
+        dispatcher = EmailDispatcher(connection_factory=self.connection, **kwargs)
+        self.addCleanup(dispatcher.shutdown, 5)
+        return dispatcher
+
+    def test_delivers_everything_over_one_connection(self):
+        dispatcher = self.dispatcher(workers=1)
+
+        errors = dispatcher.deliver(self.messages(*[f'guest{i}@example.com' for i in range(25)]))
+
+        self.assertEqual(errors, {})
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertEqual(self.connections, 1)
+        self.assertEqual(dispatcher.stats()['sent'], 25)
+
+    def test_refused_recipient_fails_only_its_message(self):
+        dispatcher = self.dispatcher(workers=1)
+        messages = self.messages('a@example.com', 'bad@example.com', 'b@example.com')
+
+        errors = dispatcher.deliver(messages)
+
+        self.assertEqual(list(errors), [id(messages[1])])
+        self.assertIn('No such user', errors[id(messages[1])])
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com'], ['b@example.com']])
+        # A fresh connection after the error
+        self.assertEqual(self.connections, 2)
+        self.assertEqual((dispatcher.stats()['sent'], dispatcher.stats()['failed']), (2, 1))
+
+    def test_full_queue_sends_in_calling_thread(self):
+        busy = threading.Event()
+        release = threading.Event()
+
+        def blocked_connection():
+            if threading.current_thread().name.startswith('email-dispatch'):
+                busy.set()
+                release.wait(5)
+            return self.connection()
+
+        dispatcher = self.dispatcher(workers=1, queue_size=1, put_timeout=0)
+        dispatcher.connection_factory = blocked_connection
+        first = threading.Thread(target=dispatcher.deliver, args=(self.messages('guest0@example.com'),))
+        first.start()
+        self.assertTrue(busy.wait(5))
+        with self.assertLogs('core.mail', 'WARNING'):
+            # The worker holds the first message, the queue takes the second
+            threading.Timer(0.2, release.set).start()
+            errors = dispatcher.deliver(self.messages('guest1@example.com', 'guest2@example.com'))
+        first.join(5)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(dispatcher.stats()['sent_inline'], 1)
+        self.assertEqual(len(mail.outbox), 3)
@@ -0,0 +1,334 @@
+"""
+Token-bucket throttling for public endpoints.
+
+Each throttled view names a scope (view.throttle_scope) configured in
+settings.THROTTLE_BUCKETS with a per-IP bucket and a global bucket shared by
+all clients; rate is tokens refilled per second and burst is the bucket size:
+
+    THROTTLE_BUCKETS = {
+        'availability': {'ip': (2, 30), 'global': (100, 300)},
+    }
+
+Buckets live in process memory, so the common path touches no shared store.
+With THROTTLE_BACKEND = 'memory' that is all (exact, per process). With
+'cache' every process also adds the tokens it consumed to a counter in the
+Django cache, batched every THROTTLE_SYNC_INTERVAL seconds per bucket, and
+deducts what other processes consumed in the meantime from its own buckets.
+One cache round trip per bucket per interval replaces DRF's write on every
+request, at the cost of limits being approximate within an interval. The
+round trip is made outside the limiter's lock, so other requests are not
+held up by it.
+
+A limiter tracks at most MAX_TRACKED_BUCKETS per-IP buckets. Beyond that,
+buckets that have refilled are dropped first and then the least recently
+used, so a client cycling through addresses can't grow memory without bound.
+
+Rejections are counted per scope and bucket kind; see throttle_stats().
+"""
+import logging
+import threading
+import time
+from itertools import islice
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+# Per-IP buckets a limiter tracks at most; pruning brings it back to three quarters
+MAX_TRACKED_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Tokens refilled continuously at `rate` per second up to `burst`"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at', 'pending', 'synced_total', 'synced_at', 'syncing')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = now
+        self.pending = 0          # consumed locally, not yet reported to the cache
+        self.synced_total = None  # shared counter value after our last sync
+        self.synced_at = now
+        self.syncing = False
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, now):
+        """Consume one token; returns 0 if granted, else seconds until one is available"""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.pending += 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+        self.pending -= 1
+
+
+class MemoryLimiter:
+    """Per-IP and global buckets for one scope, held in this process"""
+
+    def __init__(self, scope, ip, global_=None):
+        self.scope = scope
+        self.ip_limits = ip
+        self.global_limits = global_
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.global_bucket = None
+        self.allowed = 0
+        self.rejected = {'ip': 0, 'global': 0}
+
+    def _bucket(self, ident, now):
+        bucket = self.buckets.pop(ident, None)
+        if bucket is None:
+            if len(self.buckets) >= MAX_TRACKED_BUCKETS:
+                self._prune(now)
+            bucket = TokenBucket(*self.ip_limits, now)
+        # Reinserted so the dict runs from least to most recently used
+        self.buckets[ident] = bucket
+        return bucket
+
+    def _prune(self, now):
+        """
+        Forget buckets that are full again (they are indistinguishable from new
+        ones), then the least recently used down to three quarters of the cap
+        """
+        for ident, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self.buckets[ident]
+        excess = len(self.buckets) - MAX_TRACKED_BUCKETS * 3 // 4
+        for ident in list(islice(self.buckets, max(excess, 0))):
+            del self.buckets[ident]
+
+    def _global(self, now):
+        if self.global_bucket is None:
+            self.global_bucket = TokenBucket(*self.global_limits, now)
+        return self.global_bucket
+
+    def hit(self, ident):
+        """Returns (allowed, seconds to wait)"""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self._bucket(ident, now) if self.ip_limits else None
+            global_bucket = self._global(now) if self.global_limits else None
+            syncs = [
+                sync for sync in (
+                    bucket and self.claim_sync(f'ip:{ident}', bucket, now),
+                    global_bucket and self.claim_sync('global', global_bucket, now),
+                ) if sync
+            ]
+        if syncs:
+            totals = self.exchange(syncs)
+            with self.lock:
+                for sync, total in zip(syncs, totals):
+                    self.apply_sync(sync, total, now)
+
+        with self.lock:
+            if bucket is not None:
+                wait = bucket.take(now)
+                if wait:
+                    self.rejected['ip'] += 1
+                    return False, wait
+
+            if global_bucket is not None:
+                wait = global_bucket.take(now)
+                if wait:
+                    if bucket is not None:
+                        bucket.give_back()
+                    self.rejected['global'] += 1
+                    return False, wait
+
+            self.allowed += 1
+            return True, 0
+
+    def claim_sync(self, name, bucket, now):
+        """
+        Called under the lock: returns what exchange() should report for the
+        bucket, or None if it doesn't need a sync. In memory there is nobody
+        to share consumption with.
+        """
+        bucket.pending = 0
+        return None
+
+    def exchange(self, syncs):
+        """Report the claimed consumption without holding the lock; returns a total per sync"""
+        return [None for _ in syncs]
+
+    def apply_sync(self, sync, total, now):
+        """Called under the lock with the total exchange() got back for sync"""
+
+    def stats(self):
+        with self.lock:
+            return {'allowed': self.allowed, 'rejected': dict(self.rejected), 'tracked': len(self.buckets)}
+
+
+class CacheLimiter(MemoryLimiter):
+    """MemoryLimiter whose buckets are kept in step across processes through the cache"""
+
+    def __init__(self, scope, ip, global_=None, sync_interval=1.0):
+        super().__init__(scope, ip, global_)
+        self.sync_interval = sync_interval
+        self.reported_rejections = {'ip': 0, 'global': 0}
+
+    def counter_key(self, name):
+        return f'throttle:{self.scope}:{name}'
+
+    def claim_sync(self, name, bucket, now):
+        if bucket.syncing or (now - bucket.synced_at < self.sync_interval and bucket.synced_total is not None):
+            return None
+        # Requests arriving while the cache is asked add to pending again;
+        # they are reported by the next sync
+        bucket.syncing = True
+        sent, bucket.pending = bucket.pending, 0
+        rejections = {}
+        for kind, count in self.rejected.items():
+            rejections[kind] = count - self.reported_rejections[kind]
+            self.reported_rejections[kind] = count
+        return SimpleNamespace(name=name, bucket=bucket, sent=sent, rejections=rejections)
+
+    def exchange(self, syncs):
+        totals = []
+        for sync in syncs:
+            bucket = sync.bucket
+            # Counters only need to outlive the time a full bucket takes to refill
+            timeout = int(bucket.burst / bucket.rate) + 60
+            total = None
+            try:
+                total = _add(self.counter_key(sync.name), sync.sent, timeout)
+                for kind, delta in sync.rejections.items():
+                    if delta:
+                        _add(f'throttle:{self.scope}:rejected:{kind}', delta, timeout=None)
+            except Exception as e:
+                # Keep limiting with the local view until the cache is back
+                logger.warning(f"Throttle sync for {self.scope} failed: {e}")
+            totals.append(total)
+        return totals
+
+    def apply_sync(self, sync, total, now):
+        bucket = sync.bucket
+        bucket.syncing = False
+        if total is None:
+            bucket.pending += sync.sent
+            return
+        if bucket.synced_total is not None and total >= bucket.synced_total + sync.sent:
+            # Whatever else the counter grew by was consumed by other processes
+            bucket.tokens -= total - bucket.synced_total - sync.sent
+        bucket.synced_total = total
+        bucket.synced_at = now
+
+
+def _add(key, delta, timeout):
+    """Atomically add delta to a cache counter, creating it if needed; returns the new value"""
+    try:
+        return cache.incr(key, delta) if delta else cache.get_or_set(key, 0, timeout)
+    except ValueError:
+        if cache.add(key, delta, timeout):
+            return delta
+        return cache.incr(key, delta)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(scope):
+    """The process-wide limiter for a scope, or None if the scope is not configured"""
+    config = getattr(settings, 'THROTTLE_BUCKETS', {}).get(scope)
+    if not config:
+        return None
+    backend = getattr(settings, 'THROTTLE_BACKEND', 'cache')
+    sync_interval = getattr(settings, 'THROTTLE_SYNC_INTERVAL', 1.0)
+    ip = tuple(config['ip']) if config.get('ip') else None
+    global_ = tuple(config['global']) if config.get('global') else None
+    # Keyed on the configuration too, so changed settings take effect
+    key = (scope, backend, sync_interval, ip, global_)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                if backend == 'memory':
+                    limiter = MemoryLimiter(scope, ip, global_)
+                else:
+                    limiter = CacheLimiter(scope, ip, global_, sync_interval)
+                _limiters[key] = limiter
+    return limiter
+
+
+def reset_limiters():
+    """Forget all buckets and counts in this process (e.g. between tests)"""
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def throttle_stats():
+    """
+    {scope: {'allowed', 'rejected', 'rejected_all_processes'}}: this process's
+    counts, plus rejections reported to the cache by every process (cache
+    backend only, up to the last sync).
+    """
+    stats = {}
+    for scope in getattr(settings, 'THROTTLE_BUCKETS', {}):
+        stats[scope] = {
+            'allowed': 0,
+            'rejected': {'ip': 0, 'global': 0},
+            'rejected_all_processes': {
+                kind: cache.get(f'throttle:{scope}:rejected:{kind}', 0) for kind in ('ip', 'global')
+            },
+        }
+    for limiter in list(_limiters.values()):
+        if limiter.scope not in stats:
+            continue
+        local = limiter.stats()
+        stats[limiter.scope]['allowed'] += local['allowed']
+        for kind, count in local['rejected'].items():
+            stats[limiter.scope]['rejected'][kind] += count
+    return stats
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle using the token buckets of view.throttle_scope. Views
+    without a configured scope are not throttled. Rejections get a 429 with
+    Retry-After.
+    """
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        limiter = get_limiter(getattr(view, 'throttle_scope', None))
+        if limiter is None:
+            return True
+        allowed, wait = limiter.hit(self.get_ident(request))
+        if not allowed:
+            self.retry_after = wait
+            logger.debug(f"Throttled {self.get_ident(request)} on {limiter.scope}")
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+def throttled_response(request, scope):
+    """
+    TokenBucketThrottle for plain Django (e.g. async) views: the same 429
+    response DRF would send, with Retry-After, or None if the request is allowed.
+    """
+    throttle = TokenBucketThrottle()
+    if throttle.allow_request(request, SimpleNamespace(throttle_scope=scope)):
+        return None
+    exc = Throttled(throttle.wait())
+    response = JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+    response['Retry-After'] = str(exc.wait)
+    return response
@@ -1,8 +1,9 @@
 
 
+from django.conf import settings
 from django.urls import path
-from .views import HotelInfoDetail
+from .views import HotelInfoDetail, HotelInfoDetailAsync
 
 urlpatterns = [
-    path('', HotelInfoDetail.as_view(), name='hotel-info'),
+    path('', (HotelInfoDetailAsync if settings.ASYNC_VIEWS else HotelInfoDetail).as_view(), name='hotel-info'),
 ]
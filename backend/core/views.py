@@ -1,4 +1,6 @@
 
+from django.http import JsonResponse
+from django.views import View
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -19,6 +21,21 @@ class HotelInfoDetail(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class HotelInfoDetailAsync(View):
+    """HotelInfoDetail as a native async Django view, for ASGI deployments (ASYNC_VIEWS = True)"""
+    
+    async def get(self, request):
+        hotel = await HotelInfo.objects.afirst()
+        if not hotel:
+            return JsonResponse(
+                {"error": "Hotel information not found."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        serializer = HotelInfoSerializer(hotel)
+        return JsonResponse(serializer.data, status=status.HTTP_200_OK)
+
+
 
 
 
@@ -1,12 +1,61 @@
 
 # rooms/admin.py
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.utils import timezone
 from django.utils.html import format_html
+from core.admin import ImportAdminMixin
 from .models import RoomType, Room
 
+OCCUPANCY_DAYS = 30
+
+
+def inventory_overview():
+    """
+    {room_type_id: inventory} for today, from one annotated query, cached for
+    ROOM_INVENTORY_CACHE_TTL seconds. Image URLs are cached along with it,
+    since building them can be as slow as a query with remote storage.
+    """
+    today = timezone.localdate()
+    key = f'rooms:inventory:{today.isoformat()}'
+    overview = cache.get(key)
+    if overview is not None:
+        return overview
+    
+    overview = {}
+    for room_type in RoomType.objects.with_inventory(today, days=OCCUPANCY_DAYS):
+        capacity = room_type.active_rooms_count * OCCUPANCY_DAYS
+        overview[room_type.id] = {
+            'active_rooms': room_type.active_rooms_count,
+            'occupied_tonight': room_type.occupied_tonight,
+            'arrivals_today': room_type.arrivals_today,
+            'departures_today': room_type.departures_today,
+            'occupancy': round(100 * room_type.booked_nights / capacity, 1) if capacity else None,
+            'image_url': room_type.image.url if room_type.image else None,
+        }
+    cache.set(key, overview, getattr(settings, 'ROOM_INVENTORY_CACHE_TTL', 60))
+    return overview
+
+
+class InventoryChangeList(ChangeList):
+    """Attaches the cached inventory overview to each room type on the page"""
+    
+    def get_results(self, request):
+        super().get_results(request)
+        overview = inventory_overview()
+        for room_type in self.result_list:
+            room_type.inventory = overview.get(room_type.id, {})
+
+
 @admin.register(RoomType)
-class RoomTypeAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'slug', 'base_price', 'capacity', 'total_rooms', 'image_preview']
+class RoomTypeAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'room_types'
+    list_display = [
+        'id', 'name', 'slug', 'base_price', 'capacity', 'total_rooms', 'occupied_tonight',
+        'arrivals_today', 'departures_today', 'occupancy', 'image_preview',
+    ]
     search_fields = ['name', 'slug']
     prepopulated_fields = {'slug': ('name',)}
     list_filter = ['capacity']
@@ -26,16 +75,46 @@ class RoomTypeAdmin(admin.ModelAdmin):
     
     readonly_fields = ['image_preview_large']
     
+    def get_changelist(self, request, **kwargs):
+        return InventoryChangeList
+    
+    def _inventory(self, obj, field):
+        # Room types created since the overview was cached show up on its next refresh
+        value = getattr(obj, 'inventory', {}).get(field)
+        return '-' if value is None else value
+    
     def total_rooms(self, obj):
-        return obj.rooms.filter(is_active=True).count()
+        return self._inventory(obj, 'active_rooms')
     total_rooms.short_description = 'Active Rooms'
     
+    def occupied_tonight(self, obj):
+        return self._inventory(obj, 'occupied_tonight')
+    occupied_tonight.short_description = 'Occupied Tonight'
+    
+    def arrivals_today(self, obj):
+        return self._inventory(obj, 'arrivals_today')
+    arrivals_today.short_description = 'Arrivals'
+    
+    def departures_today(self, obj):
+        return self._inventory(obj, 'departures_today')
+    departures_today.short_description = 'Departures'
+    
+    def occupancy(self, obj):
+        value = self._inventory(obj, 'occupancy')
+        return value if value == '-' else f'{value}%'
+    occupancy.short_description = f'Occupancy ({OCCUPANCY_DAYS}d)'
+    
     def image_preview(self, obj):
         """Small preview for list view"""
-        if obj.image:
+        inventory = getattr(obj, 'inventory', None)
+        if inventory:
+            url = inventory['image_url']
+        else:
+            url = obj.image.url if obj.image else None
+        if url:
             return format_html(
                 '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 4px; border: 1px solid #ddd;" />',
-                obj.image.url
+                url
             )
         return format_html('<span style="color: #999;">No Image</span>')
     image_preview.short_description = 'Preview'
@@ -53,7 +132,8 @@ class RoomTypeAdmin(admin.ModelAdmin):
 
 
 @admin.register(Room)
-class RoomAdmin(admin.ModelAdmin):
+class RoomAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'rooms'
     list_display = ['id', 'number', 'room_type', 'is_active', 'created_at']
     list_filter = ['room_type', 'is_active']
     search_fields = ['number', 'room_type__name']
@@ -1,6 +1,67 @@
+from datetime import timedelta
+
 from django.db import models
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.text import slugify
 
+
+def _count(queryset, group_by):
+    """Correlated subquery counting the rows of queryset, 0 when there are none"""
+    counts = queryset.order_by().values(group_by).annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counts[:1], output_field=IntegerField()), Value(0))
+
+
+class RoomTypeQuerySet(models.QuerySet):
+    
+    def with_room_counts(self, check_in=None, check_out=None):
+        """
+        Annotate active_rooms_count and available_rooms_count in the same query.
+        Without dates every active room counts as available.
+        """
+        # Import here to avoid circular import
+        from bookings.models import RoomNight
+        
+        active = Q(rooms__is_active=True)
+        queryset = self.annotate(active_rooms_count=Count('rooms', filter=active))
+        
+        if not check_in or not check_out:
+            return queryset.annotate(available_rooms_count=F('active_rooms_count'))
+        
+        booked_room_ids = RoomNight.objects.booked_room_ids(check_in, check_out)
+        return queryset.annotate(
+            available_rooms_count=Count('rooms', filter=active & ~Q(rooms__id__in=booked_room_ids))
+        )
+    
+    def with_inventory(self, day=None, days=30):
+        """
+        Annotate the inventory overview for `day` (today by default):
+        active_rooms_count, occupied_tonight, arrivals_today, departures_today
+        and booked_nights, the ledger nights from `day` over the next `days`.
+        """
+        # Import here to avoid circular import
+        from bookings.models import Booking, RoomNight
+        
+        day = day or timezone.localdate()
+        # Subqueries rather than joins, so the counts don't multiply each other
+        nights = RoomNight.objects.filter(room__room_type=OuterRef('pk'))
+        bookings = Booking.objects.filter(room_type=OuterRef('pk'))
+        return self.annotate(
+            active_rooms_count=Count('rooms', filter=Q(rooms__is_active=True)),
+            occupied_tonight=_count(nights.filter(date=day), 'room__room_type'),
+            arrivals_today=_count(
+                bookings.filter(check_in=day, status__in=Booking.ACTIVE_STATUSES), 'room_type'
+            ),
+            departures_today=_count(
+                bookings.filter(check_out=day, status__in=Booking.SOLD_STATUSES), 'room_type'
+            ),
+            booked_nights=_count(
+                nights.filter(date__gte=day, date__lt=day + timedelta(days=days)), 'room__room_type'
+            ),
+        )
+
+
 class RoomType(models.Model):
     name = models.CharField(max_length=50)
     slug = models.SlugField(max_length=50, unique=True, blank=True)
@@ -8,6 +69,8 @@ class RoomType(models.Model):
     base_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     capacity = models.PositiveIntegerField(default=1, blank=True, null=True)
     image = models.ImageField(upload_to='room_types/', blank=True, null=True, help_text="Room type image")
+    
+    objects = RoomTypeQuerySet.as_manager()
 
  
     
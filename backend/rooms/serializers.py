@@ -15,6 +15,15 @@ class RoomTypeSerializer(serializers.ModelSerializer):
         # Import here to avoid circular import
         from bookings.models import Booking
         
+        # List/detail views annotate the count for every row in one query
+        if hasattr(obj, 'available_rooms_count'):
+            return obj.available_rooms_count
+        
+        # Nested under RoomSerializer the view precomputes counts per room type
+        available_rooms_counts = self.context.get('available_rooms_counts')
+        if available_rooms_counts is not None:
+            return available_rooms_counts.get(obj.id, 0)
+        
         request = self.context.get('request')
         if not request:
             return obj.rooms.filter(is_active=True).count()
@@ -30,17 +39,9 @@ class RoomTypeSerializer(serializers.ModelSerializer):
             check_in_date = datetime.strptime(check_in, '%Y-%m-%d').date()
             check_out_date = datetime.strptime(check_out, '%Y-%m-%d').date()
             
-            # Get rooms of this type that are NOT booked
-            all_rooms = obj.rooms.filter(is_active=True)
-            booked_room_ids = Booking.objects.filter(
-                room__room_type=obj,
-                # status__in=[Booking.STATUS_CONFIRMED, Booking.STATUS_CHECKED_IN],
-                status__in=['confirmed', 'checked_in'],
-                check_in__lt=check_out_date,
-                check_out__gt=check_in_date
-            ).values_list('room_id', flat=True)
-            
-            available_count = all_rooms.exclude(id__in=booked_room_ids).count()
+            available_count = Booking.objects.get_available_rooms(
+                obj, check_in_date, check_out_date
+            ).count()
             return available_count
         except (ValueError, TypeError):
             return obj.rooms.filter(is_active=True).count()
@@ -63,7 +64,12 @@ class RoomSerializer(serializers.ModelSerializer):
     def get_availability_status(self, obj):
         """Return 'available' or 'booked' for display"""
         # Import here to avoid circular import
-        from bookings.models import Booking
+        from bookings.models import RoomNight
+        
+        # RoomListView resolves the booked rooms once for the whole page
+        booked_room_ids = self.context.get('booked_room_ids')
+        if booked_room_ids is not None:
+            return 'booked' if obj.id in booked_room_ids else 'available'
         
         request = self.context.get('request')
         if not request:
@@ -80,13 +86,11 @@ class RoomSerializer(serializers.ModelSerializer):
             check_in_date = datetime.strptime(check_in, '%Y-%m-%d').date()
             check_out_date = datetime.strptime(check_out, '%Y-%m-%d').date()
             
-            # Check if room has overlapping bookings
-            has_booking = Booking.objects.filter(
+            # Check if room is occupied on any of the requested nights
+            has_booking = RoomNight.objects.filter(
                 room=obj,
-                # status__in=[Booking.STATUS_CONFIRMED, Booking.STATUS_CHECKED_IN],
-                status__in=['confirmed', 'checked_in'],
-                check_in__lt=check_out_date,
-                check_out__gt=check_in_date
+                date__gte=check_in_date,
+                date__lt=check_out_date
             ).exists()
             
             return 'booked' if has_booking else 'available'
@@ -1,3 +1,219 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from bookings.models import Booking
+from .admin import inventory_overview
+from .models import Room, RoomType
+from .views import RoomTypeListAsyncView
+
+
+class RoomTypeListViewTests(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.check_in = self.today + timedelta(days=10)
+        self.check_out = self.today + timedelta(days=12)
+        self.params = {'check_in': self.check_in.isoformat(), 'check_out': self.check_out.isoformat()}
+
+    def add_room_type(self, name, rooms=3):
+        room_type = RoomType.objects.create(name=name, base_price=80, capacity=2)
+        for i in range(rooms):
+            Room.objects.create(room_type=room_type, number=f'{name}-{i}')
+        return room_type
+
+    def count_queries(self, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('roomtype-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()['results']
+
+    def test_available_counts_respect_bookings(self):
+        room_type = self.add_room_type('Suite', rooms=3)
+        Room.objects.create(room_type=room_type, number='Suite-off', is_active=False)
+        booking = Booking.objects.create(
+            full_name='Guest', email='guest@example.com', room_type=room_type,
+            check_in=self.check_in, check_out=self.check_out,
+        )
+        booking.confirm()
+
+        _, results = self.count_queries(self.params)
+        self.assertEqual(results[0]['available_rooms_count'], 2)
+
+        _, results = self.count_queries({})
+        self.assertEqual(results[0]['available_rooms_count'], 3)
+
+    async def test_async_view_matches_sync_view(self):
+        room_type = await RoomType.objects.acreate(name='Suite', base_price=80, capacity=2)
+        for i in range(3):
+            await Room.objects.acreate(room_type=room_type, number=f'Suite-{i}')
+        for i in range(2):
+            await RoomType.objects.acreate(name=f'Type{i}', base_price=90, capacity=2)
+        params = dict(self.params, limit=2)
+
+        request = AsyncRequestFactory().get(reverse('roomtype-list'), params)
+        response = await RoomTypeListAsyncView.as_view()(request)
+        sync_response = await sync_to_async(self.client.get)(reverse('roomtype-list'), params)
+
+        self.assertEqual(json.loads(response.content), sync_response.json())
+
+    def test_query_count_does_not_grow_with_room_types(self):
+        self.add_room_type('Single')
+        baseline, _ = self.count_queries(self.params)
+        # One COUNT for pagination plus the annotated list query
+        self.assertEqual(baseline, 2)
+
+        for i in range(8):
+            self.add_room_type(f'Type{i}')
+        queries, results = self.count_queries(self.params)
+
+        self.assertEqual(len(results), 9)
+        self.assertEqual(queries, baseline)
+
+
+class RoomListViewTests(TestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        self.check_in = today + timedelta(days=5)
+        self.check_out = today + timedelta(days=8)
+        self.params = {'check_in': self.check_in.isoformat(), 'check_out': self.check_out.isoformat(), 'limit': 200}
+        self.room_type = RoomType.objects.create(name='Standard', base_price=60, capacity=2)
+
+    def add_rooms(self, count, room_type=None):
+        room_type = room_type or self.room_type
+        start = Room.objects.count()
+        for i in range(start, start + count):
+            Room.objects.create(room_type=room_type, number=f'R{i}')
+
+    def get(self, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('room-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()['results']
+
+    def test_booked_rooms_are_flagged(self):
+        self.add_rooms(2)
+        booking = Booking.objects.create(
+            full_name='Guest', email='guest@example.com', room_type=self.room_type,
+            check_in=self.check_in, check_out=self.check_out,
+        )
+        booking.confirm()
+
+        _, results = self.get(self.params)
+        status = {row['number']: row['availability_status'] for row in results}
+        self.assertEqual(status[booking.room.number], 'booked')
+        self.assertEqual(list(status.values()).count('available'), 1)
+        self.assertTrue(all(row['room_type']['available_rooms_count'] == 1 for row in results))
+
+    def test_query_count_is_constant(self):
+        self.add_rooms(2)
+        baseline, _ = self.get(self.params)
+
+        self.add_rooms(120)
+        self.add_rooms(10, RoomType.objects.create(name='Suite', base_price=150, capacity=4))
+        queries, results = self.get(self.params)
+
+        self.assertEqual(len(results), 132)
+        self.assertEqual(queries, baseline)
+        # Pagination count, the room page, room type counts and booked room ids
+        self.assertEqual(queries, 4)
+
+
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class RoomTypeInventoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+        self.room_type = self.add_room_type('Deluxe', rooms=4)
+        Room.objects.create(room_type=self.room_type, number='Deluxe-off', is_active=False)
+
+    def add_room_type(self, name, rooms=2):
+        room_type = RoomType.objects.create(name=name, base_price=100, capacity=2)
+        for i in range(rooms):
+            Room.objects.create(room_type=room_type, number=f'{name}-{i}')
+        return room_type
+
+    def book(self, start, nights, room_type=None):
+        booking = Booking.objects.create(
+            full_name='Guest', email='guest@example.com', room_type=room_type or self.room_type,
+            check_in=self.today + timedelta(days=start), check_out=self.today + timedelta(days=start + nights),
+        )
+        booking.confirm()
+        return booking
+
+    def test_inventory_counts(self):
+        day = self.today + timedelta(days=2)
+        self.book(2, 3)      # arriving on day
+        self.book(0, 2)      # leaving on day, not occupying that night
+        self.book(1, 3)      # staying over
+        self.book(10, 2).cancel()
+        other = self.add_room_type('Suite')
+        self.book(2, 1, room_type=other)
+
+        inventory = {
+            room_type.id: room_type
+            for room_type in RoomType.objects.with_inventory(day, days=30)
+        }
+
+        room_type = inventory[self.room_type.id]
+        self.assertEqual(
+            (room_type.active_rooms_count, room_type.occupied_tonight,
+             room_type.arrivals_today, room_type.departures_today, room_type.booked_nights),
+            # Booked nights from day on: 3 + 2
+            (4, 2, 1, 1, 5),
+        )
+        self.assertEqual((inventory[other.id].occupied_tonight, inventory[other.id].arrivals_today), (1, 1))
+
+    def test_overview_occupancy(self):
+        self.book(0, 3)
+        self.book(5, 3)
+
+        overview = inventory_overview()
+
+        self.assertEqual(overview[self.room_type.id], {
+            'active_rooms': 4,
+            'occupied_tonight': 1,
+            'arrivals_today': 1,
+            'departures_today': 0,
+            'occupancy': round(100 * 6 / 120, 1),
+            'image_url': None,
+        })
+
+    def test_changelist_is_one_query_and_cached(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        url = reverse('admin:rooms_roomtype_changelist')
+        self.book(0, 2)
+
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url)
+        self.assertContains(response, 'Occupied Tonight')
+        [row] = response.context['cl'].result_list
+        self.assertEqual(row.inventory['occupied_tonight'], 1)
+
+        for i in range(5):
+            self.add_room_type(f'Type{i}')
+        with CaptureQueriesContext(connection) as cached:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['cl'].result_list), 6)
+        # Only the overview query is saved; the page itself doesn't grow with room types
+        self.assertEqual(len(cached.captured_queries), len(first.captured_queries) - 1)
+
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(
+            sorted(row.inventory['active_rooms'] for row in response.context['cl'].result_list),
+            [2, 2, 2, 2, 2, 4],
+        )
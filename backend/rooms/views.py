@@ -1,18 +1,87 @@
+from datetime import datetime
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.views import View
 from rest_framework import generics
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
 from .models import RoomType, Room
 from .serializers import RoomTypeSerializer, RoomSerializer
 
-class RoomTypeListView(generics.ListAPIView):
+
+class StayDatesMixin:
+    """Parse the optional check_in/check_out query params once per request"""
+    
+    def get_stay_dates(self):
+        """Return (check_in, check_out) dates, or (None, None) if missing or invalid"""
+        if not hasattr(self, '_stay_dates'):
+            self._stay_dates = (None, None)
+            # GET rather than query_params so plain Django views can use this too
+            check_in = self.request.GET.get('check_in')
+            check_out = self.request.GET.get('check_out')
+            if check_in and check_out:
+                try:
+                    self._stay_dates = (
+                        datetime.strptime(check_in, '%Y-%m-%d').date(),
+                        datetime.strptime(check_out, '%Y-%m-%d').date(),
+                    )
+                except ValueError:
+                    pass
+        return self._stay_dates
+
+
+class RoomTypeListView(StayDatesMixin, generics.ListAPIView):
     queryset = RoomType.objects.all()
     serializer_class = RoomTypeSerializer
     
-class RoomTypeDetailView(generics.RetrieveAPIView):
+    def get_queryset(self):
+        """Annotate availability counts for all room types in one query"""
+        return super().get_queryset().with_room_counts(*self.get_stay_dates())
+    
+class RoomTypeListAsyncView(StayDatesMixin, View):
+    """
+    RoomTypeListView as a native async Django view, for ASGI deployments
+    (ASYNC_VIEWS = True). Same query parameters, pagination and response.
+    """
+    
+    async def get(self, request):
+        queryset = RoomType.objects.all().with_room_counts(*self.get_stay_dates())
+        
+        paginator = LimitOffsetPagination()
+        paginator.request = Request(request)
+        paginator.limit = paginator.get_limit(paginator.request)
+        paginator.offset = paginator.get_offset(paginator.request)
+        paginator.count = await queryset.acount()
+        page = [room_type async for room_type in queryset[paginator.offset:paginator.offset + paginator.limit]]
+        
+        # Counts are annotated, so serializing needs no further queries
+        serializer = RoomTypeSerializer(page, many=True, context={'request': request})
+        return JsonResponse(paginator.get_paginated_response(serializer.data).data)
+    
+class RoomTypeDetailView(StayDatesMixin, generics.RetrieveAPIView):
     queryset = RoomType.objects.all()
     serializer_class = RoomTypeSerializer
     
-class RoomListView(generics.ListAPIView):
+    def get_queryset(self):
+        return super().get_queryset().with_room_counts(*self.get_stay_dates())
+    
+class RoomListView(StayDatesMixin, generics.ListAPIView):
     queryset = Room.objects.select_related("room_type").all()
     serializer_class = RoomSerializer
+    
+    def get_serializer_context(self):
+        """Resolve availability once per request instead of once per room"""
+        # Import here to avoid circular import
+        from bookings.models import RoomNight
+        
+        context = super().get_serializer_context()
+        check_in, check_out = self.get_stay_dates()
+        
+        context['available_rooms_counts'] = dict(
+            RoomType.objects.with_room_counts(check_in, check_out).values_list('id', 'available_rooms_count')
+        )
+        if check_in and check_out:
+            context['booked_room_ids'] = set(RoomNight.objects.booked_room_ids(check_in, check_out))
+        return context
 
     